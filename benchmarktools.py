@@ -0,0 +1,1636 @@
+"""
+Synthetic Wisconsin-shaped ward layers and timing helpers for the geo hot paths in gdftools.
+usage: 'python benchmarktools.py'
+"""
+import importlib.util
+import json
+import random
+import time
+import pathlib
+import tempfile
+import threading
+import urllib.request
+import warnings
+import gc
+import multiprocessing
+import datetime
+import platform
+import subprocess
+import tracemalloc
+
+import geojson
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import sys
+sys.path.append('./')
+from gdftools import ConvertGDFtoGJSN, StreamGDFtoGJSN, ClipGDFToBounds, ComputeRegionCentroids
+import gdftools
+import layercache
+import pointlocator
+from pointlocator import LocatePoints
+import lodpyramid
+from lodpyramid import ReportLODPyramid
+from gdftools import ConvertGDFtoTopoJSON, GetDistrictsInBounds, IterDistrictsInBounds
+from topojsontools import DecodeTopology
+from vectortiles import TileCache, TilesInBounds, MakeTileServer
+from gdftools import GetWardDataFromList, GetWardDataForCounty, GetTargetWardsInCounty, GetPassiveWardsInCounty
+import countybatch
+from countybatch import BuildCountyArtifacts
+from vdlfcommon import vdlf_target_counties
+from gdftools import AddVAPPercentages
+from compactframes import CompactFrame, CompareMemory
+import outlinecache
+from gdftools import GetCityInCounty, common_cols
+from gdftools import GetWardsInState
+import geometrystore
+from shapely import wkt
+from gdftools import ConvertDFToGDF
+from geometrycodec import GeometryFrame, EncodeGeometries
+from payloadtools import ReportPayloadSavings
+import crosswalk
+import overlapmatrix
+from overlapmatrix import BuildOverlapMatrix, GetOverlapMatrix
+import geometryrepair
+from geometryrepair import RepairLayer
+from layerwatch import LayerWatcher
+from gdftools import GetBoundedGeometry, TrimGDFToBounds
+
+try:
+	import psutil
+except ImportError:
+	psutil = None
+
+### edatools, behind map_wards_to_reporting_units, needs phonenumbers
+try:
+	import map_wards_to_reporting_units
+except ImportError:
+	map_wards_to_reporting_units = None
+
+wisconsin_bounds = (-92.89, 42.49, -86.80, 47.08)
+
+### The 72 Wisconsin counties.  County FIPS codes are the odd numbers 001-141 in this order.
+wisconsin_counties = [
+	'Adams', 'Ashland', 'Barron', 'Bayfield', 'Brown', 'Buffalo', 'Burnett', 'Calumet',
+	'Chippewa', 'Clark', 'Columbia', 'Crawford', 'Dane', 'Dodge', 'Door', 'Douglas',
+	'Dunn', 'Eau Claire', 'Florence', 'Fond du Lac', 'Forest', 'Grant', 'Green', 'Green Lake',
+	'Iowa', 'Iron', 'Jackson', 'Jefferson', 'Juneau', 'Kenosha', 'Kewaunee', 'La Crosse',
+	'Lafayette', 'Langlade', 'Lincoln', 'Manitowoc', 'Marathon', 'Marinette', 'Marquette', 'Menominee',
+	'Milwaukee', 'Monroe', 'Oconto', 'Oneida', 'Outagamie', 'Ozaukee', 'Pepin', 'Pierce',
+	'Polk', 'Portage', 'Price', 'Racine', 'Richland', 'Rock', 'Rusk', 'St. Croix',
+	'Sauk', 'Sawyer', 'Shawano', 'Sheboygan', 'Taylor', 'Trempealeau', 'Vernon', 'Vilas',
+	'Walworth', 'Washburn', 'Washington', 'Waukesha', 'Waupaca', 'Waushara', 'Winnebago', 'Wood']
+
+county_grid_shape = (8, 9)
+
+### roughly the number of wards in the state
+state_ward_grid_shape = (70, 100)
+
+### Milwaukee County, and roughly the number of wards in it
+milwaukee_bounds = (-88.07, 42.84, -87.82, 43.19)
+milwaukee_ward_grid_shape = (25, 20)
+
+
+def MakeSyntheticWardGrid(n_rows=70, n_cols=100, mcd_size=3, vertices_per_edge=8, bounds=wisconsin_bounds, seed=0):
+	"""
+	Build a reproducible grid of ward polygons with the column schema of the LTSB ward files.
+
+	Parameters:
+	- n_rows, n_cols (int): The ward grid dimensions. 70 x 100 is about the number of wards in the state.
+	- mcd_size (int): Wards per side of each municipality (MCD) tile.
+	- vertices_per_edge (int): Vertices along each cell edge, so polygons carry a realistic amount of detail.
+	- bounds (tuple): (xmin, ymin, xmax, ymax) of the grid in EPSG:4326.
+	- seed (int): Seed for the population columns.
+
+	Returns:
+	- gdf (GeoDataFrame): One row per ward in EPSG:4326. Neighboring wards share their edges exactly.
+
+	The grid is cut into the 72 counties as an 8 x 9 block layout, so a 70 x 100 grid covers the state
+	and a small grid covers the first few counties. Each county's first MCD is a city that shares the
+	county's name; the rest alternate between villages and towns.
+	"""
+	rng = np.random.default_rng(seed)
+	xmin, ymin, xmax, ymax = bounds
+	dx = (xmax - xmin) / n_cols
+	dy = (ymax - ymin) / n_rows
+
+	rows, cols = np.divmod(np.arange(n_rows * n_cols), n_cols)
+	geoms = shapely.box(xmin + cols * dx, ymin + rows * dy, xmin + (cols + 1) * dx, ymin + (rows + 1) * dy)
+	geoms = shapely.segmentize(geoms, min(dx, dy) / vertices_per_edge)
+
+	### A smooth warp of every coordinate keeps shared edges identical but makes the wards irregular
+	def warp(coords):
+		x, y = coords[:, 0], coords[:, 1]
+		return np.column_stack([
+			x + 0.15 * dx * np.sin(2 * np.pi * y / (4 * dy)),
+			y + 0.15 * dy * np.sin(2 * np.pi * x / (4 * dx))])
+	geoms = shapely.transform(geoms, warp)
+
+	county_rows, county_cols = county_grid_shape
+	state_rows, state_cols = state_ward_grid_shape
+	county_idx = (rows * county_rows // state_rows).clip(max=county_rows - 1) * county_cols \
+		+ (cols * county_cols // state_cols).clip(max=county_cols - 1)
+
+	df = pd.DataFrame({'county_idx': county_idx, 'mcd_key': (rows // mcd_size) * n_cols + cols // mcd_size})
+	df['CNTY_NAME'] = [wisconsin_counties[i % len(wisconsin_counties)] for i in county_idx]
+	df['CNTY_FIPS'] = ['55' + str(2 * (i % len(wisconsin_counties)) + 1).zfill(3) for i in county_idx]
+	df['mcd_num'] = df.groupby('county_idx')['mcd_key'].rank(method='dense').astype(int) - 1
+	df['CTV'] = np.where(df['mcd_num'] == 0, 'C', np.where(df['mcd_num'] % 2 == 1, 'V', 'T'))
+	df['MCD_NAME'] = np.where(df['mcd_num'] == 0, df['CNTY_NAME'], df['CNTY_NAME'] + ' ' + (df['mcd_num'] + 1).astype(str))
+	df['MCD_FIPS'] = df['CNTY_FIPS'] + (df['mcd_num'] * 25 + 1000).astype(str).str.zfill(5)
+	ward_num = df.groupby(['county_idx', 'mcd_num']).cumcount() + 1
+	df['STR_WARDS'] = ward_num.astype(str).str.zfill(4)
+	df['WARDID'] = ward_num.astype(str)
+	df['GEOID'] = df['MCD_FIPS'] + df['STR_WARDS']
+	df['LABEL'] = df['MCD_NAME'] + ' - ' + df['CTV'] + ' ' + df['STR_WARDS']
+	df['ALDERID20'] = ((ward_num - 1) // 3 + 1).astype(str).str.zfill(4)
+
+	persons = rng.integers(200, 3000, len(df))
+	persons[rng.random(len(df)) < 0.01] = 0
+	vap = (persons * rng.uniform(0.65, 0.85, len(df))).astype(int)
+	shares = rng.dirichlet([8.0, 1.0, 1.5, 0.5, 0.3], len(df))
+	counts = (shares * vap[:, None]).astype(int)
+	df['PERSONS'] = persons
+	df['PERSONS18'] = vap
+	df['WHITE18'] = counts[:, 0]
+	df['BLACK18'] = counts[:, 1]
+	df['HISPANIC18'] = counts[:, 2]
+	df['ASIAN18'] = counts[:, 3]
+	df['HISPANIC'] = (df['HISPANIC18'] * persons / np.maximum(vap, 1)).astype(int)
+
+	columns = ['GEOID', 'CNTY_FIPS', 'CNTY_NAME', 'MCD_FIPS', 'MCD_NAME', 'CTV', 'WARDID', 'STR_WARDS', 'LABEL',
+		'ALDERID20', 'PERSONS', 'PERSONS18', 'WHITE18', 'BLACK18', 'HISPANIC', 'HISPANIC18', 'ASIAN18']
+	return gpd.GeoDataFrame(df[columns], geometry=geoms, crs='EPSG:4326')
+
+
+def TimeCall(func, *args, repeat=3, **kwargs):
+	"""
+	Call func(*args, **kwargs) `repeat` times and return the best wall time in seconds
+	along with the result of the last call.
+	"""
+	best = None
+	result = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		result = func(*args, **kwargs)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best, result
+
+
+def _LegacyConvertGDFtoGJSN(gdf):
+	"""
+	The original ConvertGDFtoGJSN: a round trip through the GDAL GeoJSON driver and geojson.load,
+	kept here only as the baseline for BenchmarkConvertGDFtoGJSN.
+	"""
+	randstr = str(random.randint(0, 1000))
+	out_file = pathlib.Path(tempfile.gettempdir()) / f"{randstr}.geojson"
+	gdf.to_file(out_file, driver="GeoJSON")
+	with out_file.open() as f:
+		gjsn = geojson.load(f)
+	out_file.unlink()
+	return gjsn
+
+
+def BenchmarkConvertGDFtoGJSN(gdf=None, repeat=3):
+	"""
+	Time the temp-file GeoJSON round trip against the in-memory encoder on a statewide ward layer.
+
+	Returns:
+	- dict: Timings in seconds, the speedup, and the size of the streamed payload in bytes.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	legacy_time, legacy = TimeCall(_LegacyConvertGDFtoGJSN, gdf, repeat=repeat)
+	memory_time, result = TimeCall(ConvertGDFtoGJSN, gdf, repeat=repeat)
+	stream_time, chunks = TimeCall(lambda g: list(StreamGDFtoGJSN(g)), gdf, repeat=repeat)
+	if result != legacy:
+		print('Warning: in-memory GeoJSON differs from the GDAL round trip.')
+	results = {
+		'features': len(gdf),
+		'legacy_seconds': legacy_time,
+		'in_memory_seconds': memory_time,
+		'stream_seconds': stream_time,
+		'speedup': legacy_time / memory_time,
+		'payload_bytes': sum(len(c) for c in chunks),
+	}
+	print('ConvertGDFtoGJSN on', len(gdf), 'wards:')
+	print(f"  temp file round trip: {legacy_time:.3f} s")
+	print(f"  in memory:            {memory_time:.3f} s ({results['speedup']:.1f}x)")
+	print(f"  streamed bytes:       {stream_time:.3f} s, {results['payload_bytes'] / 10**6:.1f} MB")
+	return results
+
+
+def MakeSyntheticBounds(wards_gdf, county_name='Milwaukee', buffer=0.05):
+	"""
+	Return a one-row bounds GeoDataFrame: the outline of a county in a synthetic ward layer, grown by
+	`buffer` degrees so that its edge cuts through the neighboring wards.
+	"""
+	outline = wards_gdf.loc[wards_gdf['CNTY_NAME'] == county_name].geometry.unary_union.buffer(buffer)
+	return gpd.GeoDataFrame({'NAME': [county_name]}, geometry=[outline], crs=wards_gdf.crs)
+
+
+def _LegacyClipGDFToBounds(gdf, bounds, area_cutoff):
+	"""
+	The clipping in the original GetBoundedGeometry and TrimGDFToBounds: a full overlay, then a deep
+	copy of the result reprojected to 'epsg:6933' for the sliver areas.
+	"""
+	gdf = gpd.overlay(gdf, bounds[["geometry"]], how="intersection")
+	temp = gdf.copy(deep=True)
+	temp = temp.to_crs("epsg:6933")
+	gdf["areaKMSq"] = temp["geometry"].area / 10**6
+	return gdf[gdf["areaKMSq"].gt(area_cutoff)]
+
+
+def BenchmarkClipGDFToBounds(gdf=None, bounds=None, repeat=3):
+	"""
+	Time the overlay-based clipping against ClipGDFToBounds, clipping a statewide ward layer to one county.
+
+	Returns:
+	- dict: Timings in seconds, the speedup and the number of clipped rows.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	if bounds is None:
+		bounds = MakeSyntheticBounds(gdf)
+	legacy_time, legacy = TimeCall(_LegacyClipGDFToBounds, gdf, bounds, 0.0, repeat=repeat)
+	clip_time, result = TimeCall(ClipGDFToBounds, gdf, bounds, 0.0, repeat=repeat)
+	if len(result) != len(legacy):
+		print('Warning: ClipGDFToBounds and gpd.overlay kept different rows.')
+	results = {
+		'features': len(gdf),
+		'clipped': len(result),
+		'legacy_seconds': legacy_time,
+		'strtree_seconds': clip_time,
+		'speedup': legacy_time / clip_time,
+	}
+	print('Clipping', len(gdf), 'wards to', bounds['NAME'].iloc[0], 'county:')
+	print(f"  overlay:        {legacy_time:.3f} s")
+	print(f"  STRtree engine: {clip_time:.3f} s ({results['speedup']:.1f}x)")
+	return results
+
+
+def _LegacyComputeRegionCentroids(gdf):
+	"""
+	The original ComputeRegionCentroids: three reprojections of the frame and per-row lambdas,
+	kept here only as the baseline for BenchmarkComputeRegionCentroids.
+	"""
+	gdf = gdf.to_crs("epsg:3035")
+	gdf["Center_point"] = gdf["geometry"].centroid.to_crs("epsg:4326")
+	gdf = gdf.to_crs("epsg:4326")
+	focal_point = [gdf["Center_point"].y.mean(), gdf["Center_point"].x.mean()]
+	idx = list(gdf.columns).index("geometry")
+	gdf.insert(idx, "lat", gdf.Center_point.map(lambda p: p.y), True)
+	gdf.insert(idx + 1, "lon", gdf.Center_point.map(lambda p: p.x), True)
+	gdf.drop("Center_point", axis=1, inplace=True)
+	return focal_point, gdf
+
+
+def BenchmarkComputeRegionCentroids(gdf=None, repeat=3):
+	"""
+	Time the original centroid code against ComputeRegionCentroids on a statewide ward layer, both on
+	the first call for a layer and on repeated calls served from the centroid cache.
+
+	Returns:
+	- dict: Timings in seconds and the speedups.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	legacy_time, _ = TimeCall(_LegacyComputeRegionCentroids, gdf, repeat=repeat)
+
+	def first_call(g):
+		gdftools._centroid_cache.clear()
+		return ComputeRegionCentroids(g)
+	first_time, _ = TimeCall(first_call, gdf, repeat=repeat)
+	cached_time, _ = TimeCall(ComputeRegionCentroids, gdf, repeat=repeat)
+	results = {
+		'features': len(gdf),
+		'legacy_seconds': legacy_time,
+		'first_call_seconds': first_time,
+		'cached_seconds': cached_time,
+		'speedup': legacy_time / first_time,
+		'cached_speedup': legacy_time / cached_time,
+	}
+	print('ComputeRegionCentroids on', len(gdf), 'wards:')
+	print(f"  original:         {legacy_time:.3f} s")
+	print(f"  vectorized:       {first_time:.3f} s ({results['speedup']:.1f}x)")
+	print(f"  cached centroids: {cached_time:.3f} s ({results['cached_speedup']:.1f}x)")
+	return results
+
+
+def _LegacyReadWardsInCounty(ward_bounds_file, county_name, columns=None):
+	gdf = gpd.read_file(ward_bounds_file)
+	gdf = gdf.loc[gdf['CNTY_NAME'] == county_name]
+	if columns is not None:
+		gdf = gdf[columns]
+	return gdf
+
+
+def BenchmarkCountyScopedRead(gdf=None, county_name='Milwaukee', repeat=3):
+	"""
+	Time a county-scoped ward read done the original way (read the whole state, then filter) against
+	a read with the county filter and column list pushed down to the reader. The layer cache is
+	bypassed so every call parses the file.
+
+	Returns:
+	- dict: Timings in seconds and the speedups, or None if pyogrio is not installed.
+	"""
+	if layercache.pyogrio is None:
+		print('pyogrio is not installed; county-scoped reads fall back to a full read.')
+		return None
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	columns = ['GEOID', 'MCD_NAME', 'CTV', 'WARDID', 'PERSONS18', 'HISPANIC18', 'geometry']
+	with tempfile.TemporaryDirectory() as d:
+		ward_bounds_file = pathlib.Path(d) / 'wards.shp'
+		gdf.to_file(ward_bounds_file)
+		legacy_time, expected = TimeCall(_LegacyReadWardsInCounty, ward_bounds_file, county_name, repeat=repeat)
+		where_time, result = TimeCall(
+			layercache._ReadLayer, ward_bounds_file, where={'CNTY_NAME': county_name}, repeat=repeat)
+		legacy_columns_time, _ = TimeCall(
+			_LegacyReadWardsInCounty, ward_bounds_file, county_name, columns, repeat=repeat)
+		columns_time, _ = TimeCall(
+			layercache._ReadLayer, ward_bounds_file, where={'CNTY_NAME': county_name}, columns=columns, repeat=repeat)
+	assert list(result.index) == list(expected.index)
+	results = {
+		'features': len(gdf),
+		'features_read': len(result),
+		'legacy_seconds': legacy_time,
+		'where_seconds': where_time,
+		'legacy_columns_seconds': legacy_columns_time,
+		'where_columns_seconds': columns_time,
+		'speedup': legacy_time / where_time,
+		'columns_speedup': legacy_columns_time / columns_time,
+	}
+	print(f'{county_name} County wards ({len(result)} of {len(gdf)}):')
+	print(f"  full read + filter:            {legacy_time:.3f} s")
+	print(f"  where= pushdown:               {where_time:.3f} s ({results['speedup']:.1f}x)")
+	print(f"  full read + filter, {len(columns) - 1} fields: {legacy_columns_time:.3f} s")
+	print(f"  where= and columns= pushdown:  {columns_time:.3f} s ({results['columns_speedup']:.1f}x)")
+	return results
+
+
+def MakeSyntheticPoints(n=500000, bounds=wisconsin_bounds, margin=0.1, seed=0):
+	"""
+	Make a DataFrame of `n` geocoded points (latitude/longitude columns, as geocoders.nominatim_geocode
+	returns them) spread uniformly over `bounds` and a small margin around it.
+	"""
+	rng = np.random.default_rng(seed)
+	x0, y0, x1, y1 = bounds
+	return pd.DataFrame({
+		'VANID': np.arange(n),
+		'latitude': rng.uniform(y0 - margin, y1 + margin, n),
+		'longitude': rng.uniform(x0 - margin, x1 + margin, n),
+	})
+
+
+def _LegacyLocatePoints(df, layer_gdf, columns):
+	points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['longitude'], df['latitude']), crs='epsg:4326')
+	joined = gpd.sjoin(points, layer_gdf[[*columns, 'geometry']].to_crs('epsg:4326'), how='left', predicate='intersects')
+	joined = joined[~joined.index.duplicated()]
+	return pd.DataFrame(joined.drop(columns=['geometry', 'index_right']))
+
+
+def BenchmarkLocatePoints(gdf=None, n_points=500000, repeat=3):
+	"""
+	Time LocatePoints against a geopandas spatial join for assigning synthetic geocoded points to
+	a statewide ward layer, both with a fresh locator and with the locator cached for the layer.
+
+	Returns:
+	- dict: Timings in seconds and the speedups.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	df = MakeSyntheticPoints(n_points)
+	columns = ['GEOID', 'LABEL']
+	legacy_time, expected = TimeCall(_LegacyLocatePoints, df, gdf, columns, repeat=repeat)
+
+	def first_call(d, g):
+		pointlocator._locator_cache.clear()
+		return LocatePoints(d, g, columns)
+	first_time, _ = TimeCall(first_call, df, gdf, repeat=repeat)
+	cached_time, result = TimeCall(LocatePoints, df, gdf, columns, repeat=repeat)
+	assert result['GEOID'].fillna('').equals(expected['GEOID'].fillna(''))
+	results = {
+		'features': len(gdf),
+		'points': n_points,
+		'located': int(result['GEOID'].notna().sum()),
+		'sjoin_seconds': legacy_time,
+		'first_call_seconds': first_time,
+		'cached_seconds': cached_time,
+		'speedup': legacy_time / first_time,
+		'cached_speedup': legacy_time / cached_time,
+		'points_per_second': n_points / cached_time,
+	}
+	print(f'Locating {n_points} points in {len(gdf)} wards ({results["located"]} inside):')
+	print(f"  points_from_xy + sjoin: {legacy_time:.3f} s")
+	print(f"  LocatePoints:           {first_time:.3f} s ({results['speedup']:.1f}x)")
+	print(f"  cached locator:         {cached_time:.3f} s ({results['cached_speedup']:.1f}x, {results['points_per_second']:,.0f} points/s)")
+	return results
+
+
+def BenchmarkLODPyramid(gdf=None, vertices_per_edge=64):
+	"""
+	Report the GeoJSON payload size and encode time at each level of the zoom pyramid for a statewide
+	ward layer with the columns the getters send to the map. The default layer has 64 vertices per
+	ward edge to stand in for survey-precision boundaries.
+
+	Returns:
+	- DataFrame: The report from ReportLODPyramid, for a freshly built pyramid.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape, vertices_per_edge=vertices_per_edge)
+	_, gdf = ComputeRegionCentroids(gdf)
+	gdf['id'] = gdf['LABEL']
+	gdf['z_layer'] = 0
+	lodpyramid._pyramid_cache.clear()
+	report = ReportLODPyramid(gdf[gdftools.common_cols])
+	print('GeoJSON payload by zoom level for', len(gdf), 'wards:')
+	for row in report.itertuples():
+		print(f"  zoom {str(row.zoom):>4}: {row.vertices:>9,} vertices {row.bytes / 2**20:7.2f} MB"
+			f" encode {row.encode_seconds:.3f} s (build {row.build_seconds:.3f} s) {row.ratio:5.1f}x smaller")
+	return report
+
+
+def BenchmarkTopoJSON(gdf=None, repeat=3):
+	"""
+	Compare GeoJSON and TopoJSON for a dense Milwaukee-sized ward layer with the columns the getters
+	send to the map: payload size, encode time, JSON parse time, and parse plus decode back to
+	GeoJSON (what a Python consumer of the topology pays).
+
+	Returns:
+	- dict: Sizes in bytes, timings in seconds and the ratios.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*milwaukee_ward_grid_shape, vertices_per_edge=32, bounds=milwaukee_bounds)
+	_, gdf = ComputeRegionCentroids(gdf)
+	gdf['id'] = gdf['LABEL']
+	gdf['z_layer'] = 0
+	gdf = gdf[gdftools.common_cols]
+
+	gjsn_time, gjsn = TimeCall(lambda g: json.dumps(ConvertGDFtoGJSN(g)), gdf, repeat=repeat)
+	topo_time, topo = TimeCall(lambda g: json.dumps(ConvertGDFtoTopoJSON(g)), gdf, repeat=repeat)
+	gjsn_parse, _ = TimeCall(json.loads, gjsn, repeat=repeat)
+	topo_parse, _ = TimeCall(json.loads, topo, repeat=repeat)
+	topo_decode, _ = TimeCall(DecodeTopology, topo, repeat=repeat)
+	results = {
+		'features': len(gdf),
+		'geojson_bytes': len(gjsn),
+		'topojson_bytes': len(topo),
+		'geojson_encode_seconds': gjsn_time,
+		'topojson_encode_seconds': topo_time,
+		'geojson_parse_seconds': gjsn_parse,
+		'topojson_parse_seconds': topo_parse,
+		'topojson_parse_and_decode_seconds': topo_decode,
+		'size_ratio': len(gjsn) / len(topo),
+		'parse_ratio': gjsn_parse / topo_parse,
+	}
+	print('GeoJSON vs TopoJSON for', len(gdf), 'wards:')
+	print(f"  GeoJSON:  {len(gjsn) / 2**20:6.2f} MB, encode {gjsn_time:.3f} s, parse {gjsn_parse:.3f} s")
+	print(f"  TopoJSON: {len(topo) / 2**20:6.2f} MB, encode {topo_time:.3f} s, parse {topo_parse:.3f} s,"
+		f" parse + decode {topo_decode:.3f} s")
+	print(f"  {results['size_ratio']:.1f}x smaller, {results['parse_ratio']:.1f}x faster to parse")
+	return results
+
+
+def BenchmarkVectorTiles(gdf=None, zooms=(6, 7, 8, 9, 10), http_sample=200):
+	"""
+	Measure vector tile throughput for a statewide ward layer: tiles per second rendered into a fresh
+	MBTiles cache, served back from the cache, and fetched through the local tile endpoint. Also
+	compares the bytes of a statewide view at the lowest zoom with the full-state GeoJSON.
+
+	Returns:
+	- dict: Tile counts, bytes, timings in seconds and tiles per second.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	gdf = gdf[['GEOID', 'LABEL', 'PERSONS18', 'geometry']]
+	with tempfile.TemporaryDirectory() as d:
+		cache = TileCache(pathlib.Path(d) / 'wards.mbtiles', gdf, layer_name='wards')
+		start = time.perf_counter()
+		n_tiles = cache.seed(zooms)
+		render_time = time.perf_counter() - start
+		start = time.perf_counter()
+		cache.seed(zooms)
+		cached_time = time.perf_counter() - start
+
+		tiles = [(z, x, y) for z in zooms for x, y in TilesInBounds(z, cache.layer.bounds)][:http_sample]
+		server = MakeTileServer({'wards': cache}, port=0)
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		start = time.perf_counter()
+		for z, x, y in tiles:
+			with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}/wards/{z}/{x}/{y}.pbf') as r:
+				r.read()
+		http_time = time.perf_counter() - start
+		server.shutdown()
+		server.server_close()
+
+		view_bytes = sum(len(cache.tile(zooms[0], x, y)) for x, y in TilesInBounds(zooms[0], cache.layer.bounds))
+		cache.close()
+	gjsn_bytes = sum(len(chunk) for chunk in StreamGDFtoGJSN(gdf))
+	results = {
+		'features': len(gdf),
+		'tiles': n_tiles,
+		'render_seconds': render_time,
+		'cached_seconds': cached_time,
+		'http_seconds': http_time,
+		'render_tiles_per_second': n_tiles / render_time,
+		'cached_tiles_per_second': n_tiles / cached_time,
+		'http_tiles_per_second': len(tiles) / http_time,
+		'statewide_view_bytes': view_bytes,
+		'geojson_bytes': gjsn_bytes,
+	}
+	print(f'Vector tiles for {len(gdf)} wards, zooms {zooms[0]}-{zooms[-1]} ({n_tiles} tiles):')
+	print(f"  render into MBTiles: {results['render_tiles_per_second']:8,.0f} tiles/s ({render_time:.2f} s)")
+	print(f"  from MBTiles:        {results['cached_tiles_per_second']:8,.0f} tiles/s")
+	print(f"  over HTTP:           {results['http_tiles_per_second']:8,.0f} tiles/s")
+	print(f"  statewide view at zoom {zooms[0]}: {view_bytes / 2**20:.2f} MB of tiles vs {gjsn_bytes / 2**20:.2f} MB of GeoJSON")
+	return results
+
+
+def _ClearLayerCaches():
+	layercache.layer_cache.invalidate()
+	with gdftools._centroid_cache_lock:
+		gdftools._centroid_cache.clear()
+
+
+def BenchmarkDistrictLoader(max_workers=gdftools.district_loader_workers, read_latency=(0.0, 0.05), repeat=3):
+	"""
+	Time loading the layers of a county page (wards, assembly, senate and county board districts)
+	one after another with GetDistrictsInBounds against loading them concurrently with
+	IterDistrictsInBounds. The caches are cleared before every run so each layer is read from disk.
+
+	The production layers are read over the VPN from a network share; each value of `read_latency`
+	adds that many seconds to every file read, standing in for the round trips to the share.
+
+	Returns:
+	- list: One dict of end-to-end and first-layer timings in seconds per read latency.
+	"""
+	layers = {
+		'wards': MakeSyntheticWardGrid(*state_ward_grid_shape),
+		'assembly': MakeSyntheticWardGrid(9, 11, vertices_per_edge=256, seed=1),
+		'senate': MakeSyntheticWardGrid(3, 11, vertices_per_edge=512, seed=2),
+		'county_board': MakeSyntheticWardGrid(6, 5, vertices_per_edge=64, bounds=milwaukee_bounds, seed=3),
+	}
+	bounds = MakeSyntheticBounds(layers['wards'])
+
+	def sequential(specs):
+		_ClearLayerCaches()
+		start = time.perf_counter()
+		first = None
+		results = []
+		for datafile, rename_column in specs:
+			results.append(GetDistrictsInBounds(datafile, rename_column, bounds))
+			first = time.perf_counter() - start if first is None else first
+		return first, results
+
+	def concurrent(specs):
+		_ClearLayerCaches()
+		start = time.perf_counter()
+		first = None
+		results = [None] * len(specs)
+		for i, result in IterDistrictsInBounds(specs, bounds, max_workers):
+			first = time.perf_counter() - start if first is None else first
+			results[i] = result
+		return first, results
+
+	read_layer = layercache._ReadLayer
+	all_results = []
+	with tempfile.TemporaryDirectory() as d:
+		specs = []
+		for name, gdf in layers.items():
+			gdf.to_file(pathlib.Path(d) / f'{name}.shp')
+			specs.append((pathlib.Path(d) / f'{name}.shp', 'GEOID'))
+		print(f'Loading {len(specs)} district layers clipped to', bounds['NAME'].iloc[0], 'county:')
+		for latency in read_latency:
+			def slow_read(*args, **kwargs):
+				time.sleep(latency)
+				return read_layer(*args, **kwargs)
+			layercache._ReadLayer = slow_read
+			try:
+				sequential_time, (sequential_first, expected) = TimeCall(sequential, specs, repeat=repeat)
+				concurrent_time, (concurrent_first, result) = TimeCall(concurrent, specs, repeat=repeat)
+			finally:
+				layercache._ReadLayer = read_layer
+			for (gdf, gjsn), (expected_gdf, expected_gjsn) in zip(result, expected):
+				assert gdf.equals(expected_gdf) and gjsn == expected_gjsn
+			results = {
+				'layers': len(specs),
+				'max_workers': max_workers,
+				'read_latency': latency,
+				'sequential_seconds': sequential_time,
+				'concurrent_seconds': concurrent_time,
+				'sequential_first_layer_seconds': sequential_first,
+				'concurrent_first_layer_seconds': concurrent_first,
+				'speedup': sequential_time / concurrent_time,
+			}
+			print(f"  {latency * 1000:.0f} ms per read:")
+			print(f"    sequential:            {sequential_time:.3f} s (first layer after {sequential_first:.3f} s)")
+			print(f"    concurrent, {max_workers} workers: {concurrent_time:.3f} s (first layer after {concurrent_first:.3f} s, {results['speedup']:.1f}x)")
+			all_results.append(results)
+	return all_results
+
+def _LegacyBuildCountyArtifacts(counties_gdf, county_names, out_dir, formats):
+	"""
+	The serial loop over GetWardDataForCounty, GetTargetWardsInCounty and GetPassiveWardsInCounty,
+	writing each county's files the way they do.
+	"""
+	out_dir = pathlib.Path(out_dir)
+	for county_name in county_names:
+		[cutoff, _, ward_list, pop_list, focal_point, gdf, _] = GetWardDataForCounty(counties_gdf, county_name)
+		[target_gdf, _] = GetTargetWardsInCounty(gdf, cutoff)
+		[passive_gdf, _] = GetPassiveWardsInCounty(gdf, cutoff)
+		for stem, part in [('population', gdf), ('targetwards', target_gdf), ('passivewards', passive_gdf)]:
+			if 'geojson' in formats:
+				part.to_file(out_dir / f'{county_name}_{stem}.geojson', driver='GeoJSON')
+			if 'shp' in formats:
+				part.to_file(out_dir / f'{county_name}_{stem}.shp', driver='ESRI Shapefile')
+			if 'xlsx' in formats and stem != 'population':
+				part.to_excel(out_dir / f'{county_name}_{stem}.xlsx')
+		if 'xlsx' in formats:
+			data = {'target_ward_cutoff': cutoff, 'focal_point_lat': focal_point[0], 'focal_point_lon': focal_point[1]}
+			pd.DataFrame(data, index=[0]).to_excel(out_dir / f'{county_name}_population_data.xlsx')
+			pd.DataFrame.from_dict({'ward_list': ward_list, 'pop_list': pop_list}).to_excel(
+				out_dir / f'{county_name}_population_arrays.xlsx')
+
+
+def BenchmarkCountyArtifacts(gdf=None, county_names=vdlf_target_counties, max_workers=None):
+	"""
+	Time building the population, target ward and passive ward files of the VDLF target counties with
+	the serial per-county loop against BuildCountyArtifacts: a first build, a rebuild with nothing
+	changed, and a rebuild after one county's data changed.
+
+	Returns:
+	- dict: Timings in seconds and the speedups.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	formats = tuple(f for f in countybatch.artifact_formats if f != 'xlsx' or importlib.util.find_spec('openpyxl'))
+	headers = ['GEOID', 'CNTY_FIPS', 'CNTY_NAME', 'MCD_NAME', 'CTV', 'WARDID']
+	numeric = ['PERSONS', 'PERSONS18', 'WHITE18', 'BLACK18', 'HISPANIC18', 'ASIAN18']
+	with tempfile.TemporaryDirectory() as d, warnings.catch_warnings():
+		warnings.simplefilter('ignore')
+		d = pathlib.Path(d)
+		gdf.to_file(d / 'wards.shp')
+		counties_gdf = GetWardDataFromList(d / 'wards.shp', county_names, headers, numeric, ['geometry'])
+		(d / 'legacy').mkdir()
+		(d / 'batch').mkdir()
+
+		start = time.perf_counter()
+		_LegacyBuildCountyArtifacts(counties_gdf, county_names, d / 'legacy', formats)
+		legacy_time = time.perf_counter() - start
+		start = time.perf_counter()
+		BuildCountyArtifacts(counties_gdf, county_names, d / 'batch', formats=formats, max_workers=max_workers)
+		batch_time = time.perf_counter() - start
+		start = time.perf_counter()
+		unchanged = BuildCountyArtifacts(counties_gdf, county_names, d / 'batch', formats=formats, max_workers=max_workers)
+		unchanged_time = time.perf_counter() - start
+		changed_gdf = counties_gdf.copy()
+		changed_gdf.loc[changed_gdf['CNTY_NAME'] == county_names[0], 'LatinxVAP'] += 1
+		start = time.perf_counter()
+		changed = BuildCountyArtifacts(changed_gdf, county_names, d / 'batch', formats=formats, max_workers=max_workers)
+		changed_time = time.perf_counter() - start
+	assert (unchanged['status'] == 'skipped').all()
+	assert list(changed.index[changed['status'] == 'built']) == [county_names[0]]
+	results = {
+		'counties': len(county_names),
+		'wards': len(counties_gdf),
+		'formats': formats,
+		'legacy_seconds': legacy_time,
+		'batch_seconds': batch_time,
+		'unchanged_seconds': unchanged_time,
+		'one_changed_seconds': changed_time,
+		'speedup': legacy_time / batch_time,
+	}
+	print(f"Building {', '.join(formats)} artifacts for {len(county_names)} counties ({len(counties_gdf)} wards):")
+	print(f"  serial per-county loop:      {legacy_time:.3f} s")
+	print(f"  BuildCountyArtifacts:        {batch_time:.3f} s ({results['speedup']:.1f}x)")
+	print(f"  rebuild, nothing changed:    {unchanged_time:.3f} s")
+	print(f"  rebuild, one county changed: {changed_time:.3f} s")
+	return results
+
+
+### roughly the number of census blocks in the state
+state_block_count = 200000
+
+
+def _LegacyAddVAPPercentages(gdf):
+	"""The original percentage columns of GetWardDataForCounty: one insert and one string-format pass per column."""
+	gdf = gdf.copy()
+	idx = list(gdf.columns).index("AsianVAP") + 1
+	for k, group in enumerate(["Black", "Latinx", "Asian"]):
+		col = group + "VAPPct"
+		gdf.insert(idx + k, col, gdf[group + "VAP"] / gdf["VAP"])
+		gdf[col] = gdf[col].fillna(0)
+		gdf[col] = gdf[col].map(lambda x: "{:.2f}".format(x))
+		gdf[col] = gdf[col].astype(float)
+	return gdf
+
+
+def MakeSyntheticVAPFrame(n=state_block_count, seed=0):
+	"""
+	A frame of voting age population counts shaped like a statewide block layer: mostly small
+	counts, with some blocks that have no voting age population at all.
+	"""
+	rng = np.random.default_rng(seed)
+	vap = rng.poisson(rng.choice([0, 5, 40, 300], size=n, p=[0.2, 0.3, 0.4, 0.1]))
+	shares = rng.dirichlet([8, 1, 1, 0.5], size=n)
+	counts = np.floor(shares * vap[:, None]).astype(int)
+	return pd.DataFrame({
+		'GEOID': np.arange(n).astype(str),
+		'VAP': vap,
+		'WhiteVAP': counts[:, 0],
+		'BlackVAP': counts[:, 1],
+		'LatinxVAP': counts[:, 2],
+		'AsianVAP': counts[:, 3],
+	})
+
+
+def BenchmarkVAPPercentages(n_rows=(1500, state_block_count), repeat=3):
+	"""
+	Time the string-format percentage columns against the vectorized ratio engine, for a county's
+	worth of wards and for a statewide block layer.
+
+	Returns:
+	- list: One dict of timings in seconds and the speedup per frame size.
+	"""
+	all_results = []
+	print('VAP percentage columns:')
+	for n in n_rows:
+		df = MakeSyntheticVAPFrame(n)
+		legacy_time, expected = TimeCall(_LegacyAddVAPPercentages, df, repeat=repeat)
+		ratio_time, result = TimeCall(AddVAPPercentages, df, repeat=repeat)
+		assert result.equals(expected)
+		results = {'rows': n, 'legacy_seconds': legacy_time, 'ratio_seconds': ratio_time, 'speedup': legacy_time / ratio_time}
+		print(f"  {n:>7,} rows: string format {legacy_time:.4f} s, ratio engine {ratio_time:.4f} s ({results['speedup']:.0f}x)")
+		all_results.append(results)
+	return all_results
+
+
+def MakeSyntheticBlockFrame(wards_gdf=None, n=state_block_count, seed=0):
+	"""
+	A statewide census block attribute frame: each block falls in a ward of the synthetic ward grid
+	and carries its county and MCD names and codes, a 15 digit block GEOID and small population counts.
+	"""
+	if wards_gdf is None:
+		wards_gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	rng = np.random.default_rng(seed)
+	ward = np.sort(rng.integers(0, len(wards_gdf), n))
+	df = pd.DataFrame(wards_gdf[['CNTY_FIPS', 'CNTY_NAME', 'MCD_FIPS', 'MCD_NAME', 'CTV', 'WARDID']]).iloc[ward].reset_index(drop=True)
+	df.insert(0, 'GEOID', ['55' + str(v).zfill(13) for v in rng.choice(10**13, n, replace=False)])
+	vap = MakeSyntheticVAPFrame(n, seed)
+	df['PERSONS'] = vap['VAP'] + rng.poisson(5, n)
+	for col in ['VAP', 'WhiteVAP', 'BlackVAP', 'LatinxVAP', 'AsianVAP']:
+		df[col] = vap[col]
+	return df
+
+
+def BenchmarkCompactFrames(wards_gdf=None):
+	"""
+	Measure the memory of a statewide ward frame and a statewide block frame as read and in the
+	compact layout, and the time CompactFrame takes.
+
+	Returns:
+	- list: One dict of bytes, savings and seconds per frame.
+	"""
+	if wards_gdf is None:
+		wards_gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	all_results = []
+	print('Compact frame layout:')
+	for name, df in [('wards', wards_gdf), ('blocks', MakeSyntheticBlockFrame(wards_gdf))]:
+		seconds, compact = TimeCall(CompactFrame, df, repeat=1)
+		total = CompareMemory(df, compact).loc['total']
+		results = {
+			'frame': name,
+			'rows': len(df),
+			'bytes_before': int(total['bytes_before']),
+			'bytes_after': int(total['bytes_after']),
+			'bytes_saved': int(total['bytes_saved']),
+			'fraction_saved': total['bytes_saved'] / total['bytes_before'],
+			'compact_seconds': seconds,
+		}
+		print(f"  {name} ({len(df):,} rows): {results['bytes_before'] / 2**20:.1f} MB -> {results['bytes_after'] / 2**20:.1f} MB "
+			f"({results['fraction_saved']:.0%} saved) in {seconds:.3f} s")
+		all_results.append(results)
+	return all_results
+
+
+def _LegacyGetCityInCounty(county_ward_gdf, county_name, city_name):
+	"""GetCityInCounty before outlinecache: a copy and a unary_union of the city's wards on every call."""
+	gdf = county_ward_gdf.loc[(county_ward_gdf['CNTY_NAME'] == county_name) & (county_ward_gdf['MCD_NAME'] == city_name)].copy(deep=True)
+	gdf = gpd.GeoDataFrame(geometry=gpd.GeoSeries(gdf.unary_union))
+	gdf = gdf.set_crs('epsg:4326')
+	gdf = gdf.to_crs('epsg:4326')
+	_, gdf = ComputeRegionCentroids(gdf)
+	gdf['id'] = city_name
+	gdf['z_layer'] = [0] * len(gdf)
+	gdf.reset_index(inplace=True)
+	return [gdf, ConvertGDFtoGJSN(gdf[common_cols])]
+
+
+def BenchmarkCityOutlines(gdf=None, vertices_per_edge=64, n_lookups=50, seed=0):
+	"""
+	Time GetCityInCounty on a statewide ward layer: the legacy per-call union, the first call (which
+	dissolves every MCD and county), lookups from the outline cache, and the first call of a new
+	process, which reads the stored outlines.
+
+	Returns:
+	- dict: Seconds per lookup for each case, and the first-call and from-disk seconds.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape, vertices_per_edge=vertices_per_edge)
+	cities = gdf[['CNTY_NAME', 'MCD_NAME']].drop_duplicates()
+	cities = list(cities.sample(min(n_lookups, len(cities)), random_state=seed).itertuples(index=False, name=None))
+	cache_dir = outlinecache.outline_cache_dir
+	with tempfile.TemporaryDirectory() as d:
+		outlinecache.outline_cache_dir = pathlib.Path(d)
+		outlinecache._outline_cache.clear()
+		try:
+			start = time.perf_counter()
+			for county_name, city_name in cities:
+				_LegacyGetCityInCounty(gdf, county_name, city_name)
+			legacy = (time.perf_counter() - start) / len(cities)
+
+			first, _ = TimeCall(GetCityInCounty, gdf, *cities[0], repeat=1)
+			start = time.perf_counter()
+			for county_name, city_name in cities:
+				GetCityInCounty(gdf, county_name, city_name)
+			cached = (time.perf_counter() - start) / len(cities)
+
+			outlinecache._outline_cache.clear()
+			from_disk, _ = TimeCall(GetCityInCounty, gdf, *cities[0], repeat=1)
+		finally:
+			outlinecache.outline_cache_dir = cache_dir
+			outlinecache._outline_cache.clear()
+
+	results = {'legacy': legacy, 'first_call': first, 'cached': cached, 'from_disk': from_disk, 'lookups': len(cities)}
+	print(f'GetCityInCounty ({len(gdf):,} wards, {len(cities)} cities):')
+	print(f'  legacy union per call: {legacy * 1000:.1f} ms per city')
+	print(f'  first call, dissolving every outline: {first:.3f} s')
+	print(f'  cached: {cached * 1000:.1f} ms per city')
+	print(f'  first call in a new process, from stored outlines: {from_disk:.3f} s')
+	return results
+
+
+def ProcessMemory():
+	"""
+	Return the memory of this process in bytes: 'rss', and where the platform reports them 'pss'
+	(shared pages split between the processes sharing them) and 'uss' (pages of this process alone).
+	Empty without psutil.
+	"""
+	if psutil is None:
+		return {}
+	info = psutil.Process().memory_full_info()
+	return {name: getattr(info, name) for name in ['rss', 'pss', 'uss'] if hasattr(info, name)}
+
+
+def _GeometryStoreWorker(ward_bounds_file, county_names, store_dir, barrier, results):
+	"""
+	One web worker serving a few counties, which then reports its memory while every worker is alive.
+	Without a store it loads the state's wards and geojson when it starts and keeps them, as the apps do; with one
+	it keeps only the store and reads each county through it.
+	"""
+	before = ProcessMemory()
+	start = time.perf_counter()
+	if store_dir is None:
+		wards_gdf, _ = GetWardsInState(ward_bounds_file)
+	else:
+		layercache.geometry_store_dir = store_dir
+	for county_name in county_names:
+		if store_dir is None:
+			gdf = wards_gdf.loc[wards_gdf['CNTY_NAME'] == county_name]
+		else:
+			_, gdf = ComputeRegionCentroids(layercache.ReadLayer(ward_bounds_file, where={'CNTY_NAME': county_name}))
+			gdf['id'] = gdf['LABEL']
+			gdf['z_layer'] = 0
+		ConvertGDFtoGJSN(gdf[common_cols])
+	seconds = time.perf_counter() - start
+	gc.collect()
+	barrier.wait()
+	results.put({'before': before, 'after': ProcessMemory(), 'seconds': seconds})
+	barrier.wait()
+
+
+def _RunWorkers(n_workers, ward_bounds_file, county_names, store_dir):
+	context = multiprocessing.get_context('spawn')
+	barrier = context.Barrier(n_workers)
+	results = context.Queue()
+	workers = [
+		context.Process(target=_GeometryStoreWorker, args=(ward_bounds_file, county_names, store_dir, barrier, results))
+		for _ in range(n_workers)
+	]
+	for w in workers:
+		w.start()
+	reports = [results.get(timeout=600) for _ in workers]
+	for w in workers:
+		w.join()
+	return reports
+
+
+def BenchmarkGeometryStore(gdf=None, n_workers=4, n_counties=8, vertices_per_edge=32):
+	"""
+	Measure the memory of a set of web workers serving the same county requests, with each worker
+	keeping its own copy of the state's wards, and with every worker reading through one shared
+	geometry store. Also time a county read and a whole-state read through the store.
+
+	Each worker is a fresh process. Memory is taken once every worker has finished, so pages the
+	workers share are shared at that moment: 'pss' splits them between the workers and 'uss' leaves
+	them out. Needs psutil.
+
+	Returns:
+	- dict: For each mode, the mean rss, pss and uss per worker, their growth over the worker's
+	  memory after imports, and the time the requests took.
+	"""
+	if psutil is None:
+		print('psutil is not installed; cannot measure worker memory.')
+		return None
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape, vertices_per_edge=vertices_per_edge)
+	county_names = list(gdf['CNTY_NAME'].drop_duplicates()[:n_counties])
+	all_results = {}
+	with tempfile.TemporaryDirectory() as d:
+		ward_bounds_file = pathlib.Path(d) / 'wards.shp'
+		gdf.to_file(ward_bounds_file)
+		store_dir = pathlib.Path(d) / 'stores'
+		build_time, _ = TimeCall(geometrystore.BuildGeometryStore, ward_bounds_file, store_root=store_dir, repeat=1)
+		store_bytes = sum(f.stat().st_size for f in store_dir.rglob('*') if f.is_file())
+		print(f'Geometry store ({len(gdf):,} wards): {store_bytes / 2**20:.1f} MB, built in {build_time:.2f} s')
+		store = geometrystore.GetGeometryStore(ward_bounds_file, store_root=store_dir)
+		county_time, _ = TimeCall(geometrystore.ReadStoredLayer, ward_bounds_file, where={'CNTY_NAME': county_names[0]}, store_root=store_dir)
+		state_time, _ = TimeCall(store.frame)
+		print(f'  read from the store: one county {county_time * 1000:.1f} ms, the whole state {state_time:.3f} s')
+		print(f'  {n_workers} workers, each serving {len(county_names)} counties:')
+		for mode, root in [('per-worker layers', None), ('shared store', store_dir)]:
+			reports = _RunWorkers(n_workers, ward_bounds_file, county_names, root)
+			results = {'seconds': float(np.mean([r['seconds'] for r in reports]))}
+			for name in reports[0]['after']:
+				results[name] = float(np.mean([r['after'][name] for r in reports]))
+				results[f'{name}_growth'] = float(np.mean([r['after'][name] - r['before'][name] for r in reports]))
+			all_results[mode] = results
+			memory = ', '.join(
+				f"{name} {results[name] / 2**20:.0f} MB (+{results[f'{name}_growth'] / 2**20:.0f})"
+				for name in reports[0]['after']
+			)
+			print(f"  {mode}: per worker {memory}; startup and requests took {results['seconds']:.2f} s")
+	all_results['store_bytes'] = store_bytes
+	all_results['build_seconds'] = build_time
+	all_results['county_read_seconds'] = county_time
+	all_results['state_read_seconds'] = state_time
+	return all_results
+
+
+def _LegacyConvertDFToGDF(df, crs='EPSG:4326'):
+	df['geometry'] = df['geometry'].apply(lambda poly: poly.wkt)
+	return gpd.GeoDataFrame(df, geometry=df['geometry'].apply(wkt.loads), crs=crs)
+
+
+def _LegacySpreadsheetGeometry(df, epsg=4326):
+	gs = gpd.GeoSeries(wkt.loads(df['geometry'])).set_crs(epsg=epsg)
+	return gpd.GeoDataFrame(df, geometry=gs, crs=f'EPSG:{epsg}')
+
+
+def BenchmarkGeometryCodec(n_polygons=100000, repeat=3):
+	"""
+	Time turning a DataFrame's geometry column into a GeoDataFrame: ConvertDFToGDF before and after
+	(a column of geometries), and the spreadsheet branch of InitializeGeoDataFrames before and after
+	(a column of WKT, and the new option of a column of hex WKB).
+
+	Returns:
+	- dict: Seconds for each case.
+	"""
+	n_rows = int(np.sqrt(n_polygons * state_ward_grid_shape[0] / state_ward_grid_shape[1]))
+	gdf = MakeSyntheticWardGrid(n_rows, n_polygons // n_rows)
+	df = pd.DataFrame(gdf)
+	wkt_df = df.assign(geometry=EncodeGeometries(gdf.geometry.values, 'wkt'))
+	hex_df = df.assign(geometry=EncodeGeometries(gdf.geometry.values, 'hex'))
+
+	results = {
+		'polygons': len(df),
+		'legacy_convert': TimeCall(lambda: _LegacyConvertDFToGDF(df.copy()), repeat=repeat)[0],
+		'convert': TimeCall(lambda: ConvertDFToGDF(df.copy()), repeat=repeat)[0],
+		'legacy_wkt': TimeCall(lambda: _LegacySpreadsheetGeometry(wkt_df.copy()), repeat=repeat)[0],
+		'wkt': TimeCall(GeometryFrame, wkt_df, crs='EPSG:4326', repeat=repeat)[0],
+		'hex': TimeCall(GeometryFrame, hex_df, crs='EPSG:4326', repeat=repeat)[0],
+	}
+	print(f'Geometry decoding ({len(df):,} polygons):')
+	print(f"  ConvertDFToGDF, via WKT: {results['legacy_convert']:.3f} s; geometries used as they are: {results['convert']:.3f} s "
+		f"({results['legacy_convert'] / results['convert']:.0f}x)")
+	print(f"  spreadsheet WKT, wkt.loads: {results['legacy_wkt']:.3f} s; GeometryFrame: {results['wkt']:.3f} s")
+	print(f"  spreadsheet hex WKB, GeometryFrame: {results['hex']:.3f} s ({results['legacy_wkt'] / results['hex']:.1f}x the WKT load)")
+	return results
+
+
+def BenchmarkChoroplethPayloads(gdf=None, county_name='Milwaukee'):
+	"""
+	Report the bytes a choropleth payload (id-only geojson plus attribute table) saves over geojson
+	with every column as a property, for the state's wards and for one county's wards with the
+	population columns GetWardDataForCounty adds.
+
+	Returns:
+	- DataFrame: The ReportPayloadSavings of each layer.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	_, gdf = ComputeRegionCentroids(gdf)
+	gdf['id'] = gdf['LABEL']
+	gdf['z_layer'] = 0
+	county = gdf.loc[gdf['CNTY_NAME'] == county_name].rename(columns={
+		'PERSONS18': 'VAP', 'HISPANIC18': 'LatinxVAP', 'BLACK18': 'BlackVAP', 'ASIAN18': 'AsianVAP'})
+	county = AddVAPPercentages(county).reset_index()
+	print('Choropleth payloads:')
+	return ReportPayloadSavings({'state wards': gdf, f'{county_name} wards': county})
+
+
+def MakeSyntheticDistricts(wards_gdf, n=99, seed=0):
+	"""
+	Build n districts as the Voronoi cells of random points over a ward layer, so their edges cut
+	across the wards the way assembly districts cut across wards that were drawn later.
+
+	Returns:
+	- gdf (GeoDataFrame): Columns DISTRICT and geometry, in the crs of wards_gdf.
+	"""
+	rng = np.random.default_rng(seed)
+	xmin, ymin, xmax, ymax = wards_gdf.total_bounds
+	points = shapely.points(rng.uniform(xmin, xmax, n), rng.uniform(ymin, ymax, n))
+	extent = shapely.box(xmin, ymin, xmax, ymax)
+	cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(points), extend_to=extent))
+	cells = shapely.intersection(cells, extent)
+	return gpd.GeoDataFrame({'DISTRICT': np.arange(1, len(cells) + 1).astype(str)}, geometry=cells, crs=wards_gdf.crs)
+
+
+def _LegacyApportionByOverlay(wards_gdf, districts_gdf, columns):
+	"""The ad-hoc rollup: an overlay of the two layers, then each count scaled by its piece's share of the ward."""
+	wards = wards_gdf[['GEOID', *columns, 'geometry']].to_crs(crosswalk.equal_area_crs)
+	wards['ward_area'] = wards.area
+	pieces = gpd.overlay(wards, districts_gdf.to_crs(crosswalk.equal_area_crs), keep_geom_type=True)
+	fraction = pieces.area / pieces['ward_area']
+	pieces = pieces.loc[fraction >= crosswalk.min_overlap_fraction]
+	pieces[columns] = pieces[columns].mul(fraction[fraction >= crosswalk.min_overlap_fraction], axis=0)
+	return pd.DataFrame(pieces.groupby('DISTRICT')[columns].sum())
+
+
+def BenchmarkOverlapMatrix(gdf=None, n_districts=99, n_columns=40, repeat=3):
+	"""
+	Time apportioning many ward columns to districts: with an overlay per rollup, with the crosswalk
+	join, and with an OverlapMatrix built once (and loaded from disk) and applied as a sparse product.
+
+	Returns:
+	- dict: The timings, in seconds.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape)
+	districts_gdf = MakeSyntheticDistricts(gdf, n_districts)
+	rng = np.random.default_rng(0)
+	extra = pd.DataFrame(rng.integers(0, 1000, (len(gdf), n_columns)), columns=[f'COL{i}' for i in range(n_columns)])
+	wards_df = pd.concat([pd.DataFrame(gdf.drop(columns='geometry')), extra], axis=1)
+	columns = ['PERSONS18', 'HISPANIC18', *extra.columns]
+
+	results = {}
+	results['legacy_overlay'], legacy = TimeCall(
+		_LegacyApportionByOverlay, gpd.GeoDataFrame(wards_df, geometry=gdf.geometry.values, crs=gdf.crs), districts_gdf, columns, repeat=1)
+	results['build'], overlaps = TimeCall(BuildOverlapMatrix, gdf, districts_gdf, 'GEOID', 'DISTRICT', repeat=1)
+	results['apportion'], totals = TimeCall(overlaps.apportion, wards_df, columns, source_id='GEOID', repeat=repeat)
+	xwalk = crosswalk.BuildCrosswalk(gdf, {'districts': (districts_gdf, 'DISTRICT')})
+	results['crosswalk_apportion'], _ = TimeCall(crosswalk.ApportionToDistricts, xwalk, wards_df, 'districts', columns, repeat=repeat)
+
+	with tempfile.TemporaryDirectory() as d:
+		d = pathlib.Path(d)
+		gdf[['GEOID', 'geometry']].to_file(d / 'wards.gpkg')
+		districts_gdf.to_file(d / 'districts.gpkg')
+		GetOverlapMatrix(d / 'wards.gpkg', d / 'districts.gpkg', 'GEOID', 'DISTRICT', cache_dir=d)
+		overlapmatrix._loaded.clear()
+		results['cached_load'], _ = TimeCall(
+			GetOverlapMatrix, d / 'wards.gpkg', d / 'districts.gpkg', 'GEOID', 'DISTRICT', cache_dir=d, rebuild=False, repeat=1)
+
+	legacy = legacy.reindex(totals.index).fillna(0)
+	assert np.allclose(legacy[columns].to_numpy(), totals[columns].to_numpy(), rtol=1e-6, atol=1e-3)
+
+	print(f'Overlap apportionment ({len(gdf):,} wards -> {len(districts_gdf)} districts, {len(columns)} columns, '
+		f'{overlaps.areas.nnz:,} overlaps):')
+	print(f"  overlay + groupby: {results['legacy_overlay']:.3f} s")
+	print(f"  build matrix: {results['build']:.3f} s; apportion: {results['apportion'] * 1000:.1f} ms "
+		f"(crosswalk join: {results['crosswalk_apportion'] * 1000:.1f} ms)")
+	print(f"  stored matrix, first call of a new process: {results['cached_load']:.3f} s")
+	return results
+
+
+def MakeSyntheticInvalidWards(gdf, fraction=0.01, seed=0):
+	"""Replace a fraction of the wards with bowties across their bounding boxes, which are invalid."""
+	rng = np.random.default_rng(seed)
+	gdf = gdf.copy()
+	rows = np.sort(rng.choice(len(gdf), max(1, int(len(gdf) * fraction)), replace=False))
+	x0, y0, x1, y1 = shapely.bounds(gdf.geometry.values[rows]).T
+	gdf.loc[gdf.index[rows], 'geometry'] = shapely.polygons(
+		[[(a, b), (c, d), (c, b), (a, d), (a, b)] for a, b, c, d in zip(x0, y0, x1, y1)])
+	return gdf
+
+
+def _LegacyRepairLayer(gdf):
+	"""Repair every geometry of a layer, as a whole-layer fix does whether or not a geometry needs it."""
+	gdf = gdf.copy()
+	gdf['geometry'] = shapely.make_valid(np.asarray(gdf.geometry.values))
+	return gdf
+
+
+def BenchmarkGeometryRepair(gdf=None, fraction=0.01, repeat=3):
+	"""
+	Time repairing a ward layer with a few invalid wards: make_valid on every ward, RepairLayer on a
+	layer it has not seen, and RepairLayer on the same layer again.
+
+	Returns:
+	- dict: The timings, in seconds.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape, vertices_per_edge=32)
+	gdf = MakeSyntheticInvalidWards(gdf, fraction)
+
+	def first_repair():
+		geometryrepair._repairs.clear()
+		gdftools._frame_fingerprints.clear()
+		return RepairLayer(gdf)
+
+	results = {}
+	results['legacy'], _ = TimeCall(_LegacyRepairLayer, gdf, repeat=repeat)
+	results['repair'], (repaired, report) = TimeCall(first_repair, repeat=repeat)
+	results['cached'], _ = TimeCall(RepairLayer, gdf, repeat=repeat)
+	assert shapely.is_valid(repaired.geometry.values).all()
+
+	print(f'Geometry repair ({len(gdf):,} wards, {len(report):,} invalid):')
+	print(f"  make_valid on every ward: {results['legacy']:.3f} s")
+	print(f"  is_valid, then make_valid on the invalid wards: {results['repair']:.3f} s "
+		f"({results['legacy'] / results['repair']:.1f}x)")
+	print(f"  same layer again, from the repair cache: {results['cached']:.3f} s")
+	return results
+
+
+def BenchmarkLayerReload(gdf=None, vertices_per_edge=32):
+	"""
+	Time the first request after the state ward file is rewritten: when the request itself re-reads
+	the file, and when a LayerWatcher reloads it in the background (the request is served the old
+	layer until the swap, and the centroids of the new layer are ready after it).
+
+	Returns:
+	- dict: The timings, in seconds.
+	"""
+	if gdf is None:
+		gdf = MakeSyntheticWardGrid(*state_ward_grid_shape, vertices_per_edge=vertices_per_edge)
+	results = {}
+	with tempfile.TemporaryDirectory() as d:
+		path = pathlib.Path(d) / 'wards.shp'
+		gdf.to_file(path)
+
+		def request(cache):
+			_, wards = ComputeRegionCentroids(cache.read(path))
+			return wards
+
+		for name in ['in_request', 'watched']:
+			cache = layercache.LayerCache()
+			request(cache)
+			watcher = LayerWatcher(cache, interval=3600)
+			if name == 'watched':
+				watcher.start()
+			gdf.assign(PERSONS=gdf['PERSONS'] + 1, geometry=gdf.geometry.translate(1e-6, 0)).to_file(path)
+			if name == 'watched':
+				watcher._wake.set()
+				results['during_reload'], _ = TimeCall(request, cache, repeat=1)
+				while watcher.reloads == 0:
+					time.sleep(0.05)
+				watcher.stop()
+			results[name], _ = TimeCall(request, cache, repeat=1)
+			gdf.to_file(path)
+
+	print(f'Layer reload ({len(gdf):,} wards, file rewritten):')
+	print(f"  first request, re-reading in the request: {results['in_request']:.3f} s")
+	print(f"  with a LayerWatcher: {results['during_reload']:.3f} s while the reload runs (old layer), "
+		f"{results['watched']:.3f} s after the swap")
+	return results
+
+
+### roughly the number of MCDs (towns, villages and cities) in the state
+state_mcd_count = 1900
+
+
+def _SyntheticPlaceName(i):
+	### no digits, which the WEC loaders would read as ward numbers
+	consonants, vowels = 'bdfgklmnprstvz', 'aeiou'
+	name = ''
+	for _ in range(3):
+		i, c = divmod(i, len(consonants))
+		i, v = divmod(i, len(vowels))
+		name += consonants[c] + vowels[v]
+	return name.title()
+
+
+def MakeSyntheticGeocodes(n_mcds=state_mcd_count, counties=wisconsin_counties, n_names=1200, seed=0):
+	"""
+	Make a Census geocode table like the one the WEC loaders take: a row per county (Area_Name
+	'<county> County', a blank MCD_NAME, a 5 digit GEOID) and a row per MCD ('Town of Bakemi', a
+	10 digit GEOID). MCD names are drawn from n_names places, so many recur in other counties.
+	"""
+	rng = np.random.default_rng(seed)
+	codes = [str(2 * i + 1).zfill(3) for i in range(len(counties))]
+	rows = [(f'{county} County', code, '', f'55{code}') for county, code in zip(counties, codes)]
+	seen = set()
+	while len(seen) < n_mcds:
+		county = int(rng.integers(len(counties)))
+		name = f"{rng.choice(['Town', 'Village', 'City'])} of {_SyntheticPlaceName(int(rng.integers(n_names)))}"
+		if (county, name) not in seen:
+			seen.add((county, name))
+			rows.append((name, codes[county], name, f'55{codes[county]}{len(seen):05d}'))
+	return pd.DataFrame(rows, columns=['Area_Name', 'County_Code', 'MCD_NAME', 'GEOID'])
+
+
+def MakeSyntheticRegistrationFile(geocodes, out_file, wards_per_mcd=4, n_unmatched=5, seed=0):
+	"""
+	Write a voter registration csv like the WEC's, a row per ward of every MCD in `geocodes`, plus
+	n_unmatched rows of MCDs missing from it.
+
+	Returns:
+	- list: The target counties, as in the County column, and the {county name: county FIPS} dict.
+	"""
+	rng = np.random.default_rng(seed)
+	counties = geocodes.loc[geocodes['MCD_NAME'] == '']
+	county_names = counties['Area_Name'].str.replace(' County', '')
+	### keyed as CreateVoterRegistrationData title-cases the County column
+	fips_dict = dict(zip(county_names.str.upper().str.title(), counties['GEOID']))
+	county_of = dict(zip(counties['County_Code'], county_names.str.upper() + ' COUNTY'))
+	mcds = geocodes.loc[geocodes['MCD_NAME'] != '']
+	rows = []
+	for mcd in mcds.itertuples(index=False):
+		for ward in range(1, int(rng.integers(1, 2 * wards_per_mcd)) + 1):
+			rows.append((county_of[mcd.County_Code], f'{mcd.MCD_NAME.upper()} - {mcd.GEOID}', f'WARD {ward}', int(rng.integers(0, 3000))))
+	for i in range(n_unmatched):
+		rows.append((county_of[mcds['County_Code'].iloc[i]], f'TOWN OF NOWHERE {i} - 55000', 'WARD 1', 0))
+	pd.DataFrame(rows, columns=['County', 'Muni', 'ward', 'Registered']).to_csv(out_file, index=False)
+	return [sorted(county_of.values()), fips_dict]
+
+
+def _LegacyCreateVoterRegistrationData(target_counties, columns_to_keep, fips_dict, geocode_df, path, file, skiprows = 0):
+	"""CreateVoterRegistrationData with the MCD FIPS assigned by a mask over every row per geocode row."""
+	df = map_wards_to_reporting_units.InitializeDataFrames(path, file, remote_file=False, kwargs = {'skiprows': skiprows})
+
+	df = df[df['County'].isin(target_counties)].reset_index(drop=True)
+	df['CNTY_NAME'] = df['County'].str.replace(" COUNTY", "").str.title()
+	df['Muni'] = df['Muni'].str.split('-').str[0].str.strip().str.title()
+	df['Muni'] = df['Muni'].str.replace("Of","of")
+	df.rename(columns={'Muni': 'MCD_NAME'}, inplace=True)
+	df['Ward'] = df['ward'].apply(lambda x: map_wards_to_reporting_units.compute_ward(x))
+
+	df['CNTY_FIPS'] = df['CNTY_NAME'].map(fips_dict)
+	df['County_Code'] = df['CNTY_FIPS'].str[-3:]
+	df['MCD_FIPS'] = '0'
+
+	for row in geocode_df.itertuples():
+		name = row.MCD_NAME.strip()
+		code = row.County_Code.zfill(3)
+		id = row.GEOID
+		df.loc[((df['MCD_NAME'].str.strip() == name) &
+				(df['County_Code'].str.strip() == code)), 'MCD_FIPS'] = id
+
+	df['GEOID'] = df['MCD_FIPS'] + df['Ward']
+	df['GEOID'] = df['GEOID'].astype(str)
+	df = df[columns_to_keep]
+	df.reset_index(inplace=True, drop=True)
+	return df
+
+
+def MakeSyntheticElectionResults(geocodes, seed=0):
+	"""
+	Make a WEC election results sheet, as InitializeDataFrames reads it, with two reporting units per
+	MCD in `geocodes` (a single ward and a range of wards) and the county totals.
+
+	Returns:
+	- list: The target counties, as CreateElectionData takes them, and the sheet.
+	"""
+	rng = np.random.default_rng(seed)
+	counties = geocodes.loc[geocodes['MCD_NAME'] == '']
+	mcds = geocodes.loc[geocodes['MCD_NAME'] != '']
+	rows = []
+	for county in counties.itertuples(index=False):
+		name = county.Area_Name.replace(' County', '')
+		names = mcds.loc[mcds['County_Code'] == county.County_Code, 'MCD_NAME'].str.upper()
+		units = [f'{mcd} WARD 1' for mcd in names] + [f'{mcd} WARDS 2-{int(rng.integers(3, 6))}' for mcd in names]
+		for i, unit in enumerate(units):
+			dem, rep = int(rng.integers(0, 2000)), int(rng.integers(0, 2000))
+			rows.append((name.upper() if i == 0 else np.nan, unit, dem + rep, dem, rep, 0))
+		rows.append((np.nan, 'County Totals:', 0, 0, 0, 0))
+	df = pd.DataFrame(rows, columns=['Unnamed: 0', 'Unnamed: 1', 'Unnamed: 2', 'DEM', 'REP', 'SCATTERING'])
+	return [list(counties['Area_Name'].str.replace(' County', '').str.title()), df]
+
+
+def _LegacyCreateElectionData(target_counties, columns_to_keep, geocode_df, str_to_append, path, file, skiprows = 0, sheet_name = 'Sheet1'):
+	"""CreateElectionData with the MCD FIPS assigned by a mask over every row per geocode row."""
+	df = map_wards_to_reporting_units.InitializeDataFrames(path, file, remote_file=False, kwargs={'skiprows': skiprows, 'sheet_name': sheet_name})
+	_, voter_df = map_wards_to_reporting_units.PreprocessData(df, str_to_append, target_counties)
+	result = pd.concat([voter_df, voter_df['ReportingUnit'].apply(
+		lambda s: pd.Series(map_wards_to_reporting_units.ProcessReportingUnitString(s), dtype='object'))], axis=1)
+	result['Wards'] = result.apply(
+		map_wards_to_reporting_units.ConvertWardFormat, args=(map_wards_to_reporting_units.ConvertWardStrings,), axis=1)
+	result['data'] = result['data'].astype(str)
+	result['data'] = result['data'].fillna('None')
+	result['MCD_NAME'] = result['ReportingUnit'].map(map_wards_to_reporting_units.ConvertRow)
+	result['MCD_FIPS'] = '0'
+
+	result = map_wards_to_reporting_units.SetIntersection(
+		result, geocode_df[['Area_Name', 'County_Code']], left_on = 'CNTY_NAME', right_on = 'Area_Name').drop(columns = 'Area_Name')
+	for row in geocode_df.itertuples():
+		result.loc[(result['MCD_NAME'] == row.MCD_NAME) & (result['County_Code'] == row.County_Code), 'MCD_FIPS'] = row.GEOID
+	result['MCD_FIPS'] = result['MCD_FIPS'].astype(np.int64).astype(str)
+	result['EXPANDEDGEOID'] = result.apply(map_wards_to_reporting_units.ExpandFips, axis = 1)
+	result = result[columns_to_keep]
+	return result
+
+
+def _LegacyAssignMcdFips(df, geocodes):
+	"""The MCD FIPS loop of InitializeWECDataFrames and CreateElectionData."""
+	df = df.copy()
+	df['MCD_FIPS'] = '0'
+	for row in geocodes.itertuples():
+		df.loc[(df['MCD_NAME'] == row.MCD_NAME) & (df['County_Code'] == row.County_Code), 'MCD_FIPS'] = row.GEOID
+	return df
+
+
+def BenchmarkFipsAssignment(n_mcds=state_mcd_count, wards_per_mcd=4, repeat=3):
+	"""
+	Time assigning MCD FIPS codes statewide: CreateVoterRegistrationData from a registration file,
+	and the reporting-unit step of InitializeWECDataFrames and CreateElectionData, with a mask per
+	geocode row and with LookupFips.
+
+	Returns:
+	- dict: The timings, in seconds.
+	"""
+	if map_wards_to_reporting_units is None:
+		print('map_wards_to_reporting_units cannot be imported -- skipping the FIPS assignment benchmark.')
+		return {}
+	geocodes = MakeSyntheticGeocodes(n_mcds)
+	columns = ['GEOID', 'CNTY_NAME', 'CNTY_FIPS', 'MCD_NAME', 'MCD_FIPS', 'Registered']
+	results = {}
+	with tempfile.TemporaryDirectory() as d:
+		target_counties, fips_dict = MakeSyntheticRegistrationFile(geocodes, pathlib.Path(d) / 'registration.csv', wards_per_mcd)
+		args = (target_counties, columns, fips_dict, geocodes, d + '/', 'registration.csv')
+		results['legacy_registration'], legacy = TimeCall(_LegacyCreateVoterRegistrationData, *args, repeat=1)
+		results['registration'], registration = TimeCall(map_wards_to_reporting_units.CreateVoterRegistrationData, *args, repeat=repeat)
+	pd.testing.assert_frame_equal(legacy, registration, check_dtype=False)
+
+	### a reporting unit per MCD, and as many again for the MCDs reporting their wards in groups
+	units = registration.drop_duplicates(['MCD_NAME', 'CNTY_FIPS'])
+	units = pd.concat([units, units]).assign(County_Code=lambda df: df['CNTY_FIPS'].str[-3:])[['MCD_NAME', 'County_Code']]
+	units = units.reset_index(drop=True)
+	results['legacy_units'], legacy = TimeCall(_LegacyAssignMcdFips, units, geocodes, repeat=1)
+	results['units'], fips = TimeCall(
+		map_wards_to_reporting_units.LookupFips, units, geocodes, geocodes['GEOID'], '0', 'MCD', repeat=repeat)
+	assert (legacy['MCD_FIPS'] == fips).all()
+
+	print(f'MCD FIPS assignment ({n_mcds:,} MCDs):')
+	print(f"  voter registration ({len(registration):,} wards): {results['legacy_registration']:.3f} s with a mask per geocode, "
+		f"{results['registration']:.3f} s with a join ({results['legacy_registration'] / results['registration']:.0f}x)")
+	print(f"  reporting units ({len(units):,}): {results['legacy_units']:.3f} s with a mask per geocode, "
+		f"{results['units'] * 1000:.1f} ms with a join ({results['legacy_units'] / results['units']:.0f}x)")
+	return results
+
+
+def MakeSyntheticBlockGrid(wards_gdf, blocks_per_side=3, seed=0):
+	"""
+	Cut every ward of a synthetic ward layer into census blocks along a grid finer than the wards.
+
+	Parameters:
+	- wards_gdf (GeoDataFrame): A layer from MakeSyntheticWardGrid.
+	- blocks_per_side (int): Grid cells per ward width; a ward is cut into about its square.
+	- seed (int): Seed for how the ward counts are shared between its blocks.
+
+	Returns:
+	- gdf (GeoDataFrame): One row per block, with a 15 digit GEOID, the county, MCD and ward of its
+	  ward, and the ward's population counts split between its blocks by area.
+	"""
+	rng = np.random.default_rng(seed)
+	wards = np.asarray(wards_gdf.geometry.values)
+	xmin, ymin, xmax, ymax = wards_gdf.total_bounds
+	ward_bounds = shapely.bounds(wards)
+	d = np.median(ward_bounds[:, 2] - ward_bounds[:, 0]) / blocks_per_side
+	rows, cols = np.divmod(np.arange(int(np.ceil((ymax - ymin) / d)) * int(np.ceil((xmax - xmin) / d))), int(np.ceil((xmax - xmin) / d)))
+	cells = shapely.box(xmin + cols * d, ymin + rows * d, xmin + (cols + 1) * d, ymin + (rows + 1) * d)
+
+	ward_idx, cell_idx = shapely.STRtree(cells).query(wards, predicate='intersects')
+	blocks = shapely.intersection(wards[ward_idx], cells[cell_idx])
+	keep = np.isin(shapely.get_type_id(blocks), [3, 6]) & (shapely.area(blocks) > 1e-6 * d * d)
+	ward_idx, blocks = ward_idx[keep], blocks[keep]
+
+	df = pd.DataFrame(wards_gdf[['CNTY_FIPS', 'CNTY_NAME', 'MCD_FIPS', 'MCD_NAME', 'CTV', 'WARDID']]).iloc[ward_idx].reset_index(drop=True)
+	block_num = df.groupby(ward_idx).cumcount().to_numpy()
+	df.insert(0, 'GEOID', df['CNTY_FIPS'] + pd.Series(ward_idx).astype(str).str.zfill(6) + pd.Series(block_num).astype(str).str.zfill(4))
+	share = shapely.area(blocks) * rng.uniform(0.5, 1.5, len(blocks))
+	share = share / np.bincount(ward_idx, weights=share, minlength=len(wards))[ward_idx]
+	for col in ['PERSONS', 'PERSONS18', 'WHITE18', 'BLACK18', 'HISPANIC18', 'ASIAN18']:
+		df[col] = (wards_gdf[col].to_numpy()[ward_idx] * share).astype(int)
+	return gpd.GeoDataFrame(df, geometry=blocks, crs=wards_gdf.crs)
+
+
+### the layers RunBenchmarkSuite times the hot paths on: one county, and the state
+benchmark_scales = {
+	'county': {'shape': milwaukee_ward_grid_shape, 'bounds': milwaukee_bounds, 'districts': 12},
+	'state': {'shape': state_ward_grid_shape, 'bounds': wisconsin_bounds, 'districts': 99},
+}
+
+### where RunBenchmarkSuite appends its results, one JSON record per run
+benchmark_history_file = pathlib.Path('./benchmarks/history.json')
+
+### a case taking this many times as long as in the previous run, and at least regression_min_seconds
+### longer, is reported as a regression; the floor keeps the timer noise of fast cases out of the report
+regression_threshold = 1.25
+regression_min_seconds = 0.02
+
+
+def MakeSyntheticLayers(scale='state', vertices_per_edge=8):
+	"""
+	Build the reproducible ward, block and district layers of one of the benchmark_scales.
+
+	Returns:
+	- dict: 'wards', 'blocks' and 'districts' GeoDataFrames; 'ward_data' and 'district_data', the
+	  wards and districts with the columns GetWardDataFromList and GetDistrictsInBounds give them; 'bounds', the outline of the first county; and the names of
+	  that county and of its city.
+	"""
+	spec = benchmark_scales[scale]
+	wards = MakeSyntheticWardGrid(*spec['shape'], vertices_per_edge=vertices_per_edge, bounds=spec['bounds'])
+	county_name = wards['CNTY_NAME'].iloc[0]
+	ward_data = wards.rename(columns={
+		'PERSONS': 'Total', 'PERSONS18': 'VAP', 'HISPANIC': 'LATINX', 'WHITE18': 'WhiteVAP',
+		'BLACK18': 'BlackVAP', 'HISPANIC18': 'LatinxVAP', 'ASIAN18': 'AsianVAP'})
+	ward_data['id'] = ward_data['LABEL']
+	ward_data['z_layer'] = 0
+	districts = MakeSyntheticDistricts(wards, spec['districts'])
+	_, district_data = ComputeRegionCentroids(districts.rename(columns={'DISTRICT': 'id'}).assign(z_layer=0))
+	return {
+		'wards': wards,
+		'blocks': MakeSyntheticBlockGrid(wards),
+		'districts': districts,
+		'district_data': district_data[common_cols],
+		'ward_data': ward_data,
+		'bounds': MakeSyntheticBounds(wards, county_name, buffer=0.0),
+		'county_name': county_name,
+		'city_name': county_name,
+	}
+
+
+def _ClearDerivedCaches():
+	"""Empty every cache a hot path could be served from, so each call is timed cold."""
+	_ClearLayerCaches()
+	gdftools._frame_fingerprints.clear()
+	outlinecache._outline_cache.clear()
+	geometryrepair._repairs.clear()
+
+
+def _SuiteCases(layers):
+	wards, county_name, city_name = layers['wards'], layers['county_name'], layers['city_name']
+	county_wards = wards.loc[wards['CNTY_NAME'] == county_name]
+	return {
+		'ConvertGDFtoGJSN': (ConvertGDFtoGJSN, (wards,), len(wards)),
+		'ComputeRegionCentroids': (ComputeRegionCentroids, (wards,), len(wards)),
+		'ComputeRegionCentroids (blocks)': (ComputeRegionCentroids, (layers['blocks'],), len(layers['blocks'])),
+		'GetBoundedGeometry': (GetBoundedGeometry, (layers['districts'], layers['bounds']), len(layers['districts'])),
+		'TrimGDFToBounds': (TrimGDFToBounds, (layers['district_data'], layers['bounds']), len(layers['districts'])),
+		'GetWardDataForCounty': (GetWardDataForCounty, (layers['ward_data'], county_name), len(wards)),
+		'GetCityInCounty': (GetCityInCounty, (county_wards, county_name, city_name), len(county_wards)),
+	}
+
+
+def MeasureCall(func, *args, repeat=3):
+	"""
+	Time func(*args) cold, with the derived caches emptied before every call, and measure its peak memory.
+
+	Returns:
+	- dict: 'seconds', the best of `repeat` calls, and 'peak_mb', the most memory allocated at once
+	  during one more call, as traced by tracemalloc (numpy and pandas buffers, not GEOS's own).
+	"""
+	best = None
+	for _ in range(repeat):
+		_ClearDerivedCaches()
+		start = time.perf_counter()
+		func(*args)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	_ClearDerivedCaches()
+	gc.collect()
+	tracemalloc.start()
+	try:
+		func(*args)
+		_, peak = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	return {'seconds': best, 'peak_mb': peak / 2**20}
+
+
+def _GitCommit():
+	try:
+		return subprocess.run(
+			['git', 'rev-parse', 'HEAD'], cwd=pathlib.Path(__file__).parent, capture_output=True, text=True, check=True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def ReadBenchmarkHistory(history_file=None):
+	"""Return the records RunBenchmarkSuite has appended to the history file, oldest first."""
+	history_file = pathlib.Path(history_file or benchmark_history_file)
+	if not history_file.exists():
+		return []
+	with history_file.open() as f:
+		return json.load(f)
+
+
+def FindRegressions(record, previous, threshold=regression_threshold, min_seconds=regression_min_seconds):
+	"""
+	Compare the results of two suite runs.
+
+	Returns:
+	- dict: {case: seconds now / seconds before} for every case that slowed down by more than
+	  threshold, and by more than min_seconds.
+	"""
+	if previous is None:
+		return {}
+	ratios = {}
+	for case, result in record['results'].items():
+		before = previous['results'].get(case)
+		if before and before['seconds'] > 0:
+			ratio = result['seconds'] / before['seconds']
+			if ratio > threshold and result['seconds'] - before['seconds'] > min_seconds:
+				ratios[case] = ratio
+	return ratios
+
+
+def RunBenchmarkSuite(scales=('county', 'state'), repeat=3, history_file=None, vertices_per_edge=8):
+	"""
+	Time the gdftools hot paths (ConvertGDFtoGJSN, ComputeRegionCentroids, GetBoundedGeometry,
+	TrimGDFToBounds, GetWardDataForCounty and GetCityInCounty) on synthetic layers at each scale,
+	record their peak memory, and append the results to a JSON history. Cases that slowed down since
+	the last run in the history are reported.
+
+	Parameters:
+	- scales (tuple): Keys of benchmark_scales.
+	- repeat (int): Calls per case; the best time is kept.
+	- history_file (str or Path): The history to append to; defaults to benchmark_history_file.
+	  False keeps the results out of any history.
+
+	Returns:
+	- dict: The record appended, with 'results' {"scale/case": {'seconds', 'peak_mb', 'rows'}} and
+	  'regressions' {"scale/case": slowdown}.
+	"""
+	record = {
+		'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+		'commit': _GitCommit(),
+		'python': platform.python_version(),
+		'machine': platform.platform(),
+		'results': {},
+	}
+	outline_dir = outlinecache.outline_cache_dir
+	outlinecache.outline_cache_dir = None
+	try:
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore')
+			for scale in scales:
+				layers = MakeSyntheticLayers(scale, vertices_per_edge)
+				for name, (func, args, rows) in _SuiteCases(layers).items():
+					result = MeasureCall(func, *args, repeat=repeat)
+					result['rows'] = rows
+					record['results'][f'{scale}/{name}'] = result
+	finally:
+		outlinecache.outline_cache_dir = outline_dir
+
+	history = [] if history_file is False else ReadBenchmarkHistory(history_file)
+	record['regressions'] = FindRegressions(record, history[-1] if history else None)
+	if history_file is not False:
+		history_file = pathlib.Path(history_file or benchmark_history_file)
+		history_file.parent.mkdir(parents=True, exist_ok=True)
+		with history_file.open('w') as f:
+			json.dump([*history, record], f, indent=1)
+
+	print('Benchmark suite:')
+	for case, result in record['results'].items():
+		flag = f"  <- {record['regressions'][case]:.2f}x slower" if case in record['regressions'] else ''
+		print(f"  {case:<40} {result['rows']:>8,} rows {result['seconds']:>8.3f} s {result['peak_mb']:>8.1f} MB{flag}")
+	return record
+
+
+if __name__ == '__main__':
+	BenchmarkConvertGDFtoGJSN()
+	BenchmarkClipGDFToBounds()
+	BenchmarkComputeRegionCentroids()
+	BenchmarkCountyScopedRead()
+	BenchmarkLocatePoints()
+	BenchmarkLODPyramid()
+	BenchmarkTopoJSON()
+	BenchmarkVectorTiles()
+	BenchmarkDistrictLoader()
+	BenchmarkCountyArtifacts()
+	BenchmarkVAPPercentages()
+	BenchmarkCompactFrames()
+	BenchmarkCityOutlines()
+	BenchmarkGeometryStore()
+	BenchmarkGeometryCodec()
+	BenchmarkChoroplethPayloads()
+	BenchmarkOverlapMatrix()
+	BenchmarkGeometryRepair()
+	BenchmarkLayerReload()
+	BenchmarkFipsAssignment()
+	RunBenchmarkSuite()
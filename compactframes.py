@@ -0,0 +1,142 @@
+"""
+A compact in-memory layout for statewide ward and block frames.
+
+As read, CNTY_NAME, MCD_NAME, CTV, WARDID and the FIPS codes are object columns holding one Python
+string per row, although a statewide frame has only a few thousand distinct values among them, and
+the population counts are int64. CompactFrame stores:
+- text columns with many repeated values as categoricals,
+- the remaining text columns (GEOID and other per-row identifiers) as Arrow strings, when pyarrow is
+  installed: one contiguous buffer instead of a Python object per row,
+- integer columns as the smallest signed type holding the column's total, so a sum over any subset
+  of rows still fits.
+
+Each integer column is sized on its own total only. Arithmetic across columns (BlackVAP + LatinxVAP,
+a numerator built from several columns) can overflow the compact types and wrap around silently;
+ExpandFrame, or astype("int64") on the columns involved, first. ratiotools works in float64 and is
+not affected.
+
+Values read back from a compact frame are the same Python strings and ints, and comparisons, isin,
+query, merge, sorting and the .str accessor work as before. Grouping on a categorical column should
+pass observed=True, or pandas adds an empty group for every category. The fiona writer behind to_file
+does not accept categoricals or Arrow strings; ExpandFrame converts a frame back first.
+
+usage:
+	wards = GetWardDataFromList(ward_bounds_file, county_list, headers, numeric, geometry, compact=True)
+	print(CompareMemory(before_gdf, CompactFrame(before_gdf)))
+"""
+import numpy as np
+import pandas as pd
+
+try:
+	import pyarrow
+except ImportError:  # pragma: no cover - pyarrow is an optional extra
+	pyarrow = None
+
+### text columns with at most this share of distinct values become categoricals
+max_category_ratio = 0.5
+
+_integer_dtypes = [np.int8, np.int16, np.int32, np.int64]
+
+
+def SmallestIntegerDtype(values):
+	"""
+	Return the smallest signed integer dtype that holds the sum of the absolute values of an integer
+	column, and so every value and every partial sum of it. Sums with other columns may not fit.
+	"""
+	values = np.asarray(values)
+	if len(values) == 0:
+		return np.dtype(np.int8)
+	total = int(np.abs(values.astype(np.int64)).sum(dtype=np.int64))
+	for dtype in _integer_dtypes:
+		if total <= np.iinfo(dtype).max:
+			return np.dtype(dtype)
+	return np.dtype(np.int64)
+
+
+def _IsText(series):
+	return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == "string"
+
+
+def CompactFrame(df, category_ratio=max_category_ratio, exclude=()):
+	"""
+	Return a copy of a (Geo)DataFrame with its text and integer columns in the compact layout.
+
+	Parameters:
+	- df (DataFrame or GeoDataFrame): The frame to compact.
+	- category_ratio (float): Text columns with at most this share of distinct values become categoricals.
+	- exclude (list): Columns to leave as they are.
+
+	Returns:
+	- DataFrame or GeoDataFrame: The compacted copy.
+	"""
+	geometry = df.geometry.name if hasattr(df, "geometry") else None
+	converted = {}
+	for col in df.columns:
+		if col == geometry or col in exclude:
+			continue
+		series = df[col]
+		if pd.api.types.is_integer_dtype(series.dtype) and not pd.api.types.is_extension_array_dtype(series.dtype):
+			dtype = SmallestIntegerDtype(series.to_numpy())
+			if dtype.itemsize < series.dtype.itemsize:
+				converted[col] = series.astype(dtype)
+		elif _IsText(series):
+			if series.nunique(dropna=True) <= category_ratio * max(len(series), 1):
+				converted[col] = series.astype("category")
+			elif pyarrow is not None:
+				converted[col] = series.astype("string[pyarrow]")
+	return df.assign(**converted) if converted else df.copy()
+
+
+def ExpandFrame(df):
+	"""
+	Return a copy of a compact frame with its categorical and Arrow string columns back as object
+	columns of Python strings, as to_file needs them, and its integer columns back as int64, so
+	arithmetic across columns cannot overflow.
+	"""
+	converted = {}
+	for col in df.columns:
+		dtype = df[col].dtype
+		if isinstance(dtype, pd.CategoricalDtype) or isinstance(dtype, pd.StringDtype):
+			converted[col] = df[col].astype(object).where(df[col].notna(), None)
+		elif dtype in _integer_dtypes[:-1]:
+			converted[col] = df[col].astype(np.int64)
+	return df.assign(**converted) if converted else df.copy()
+
+
+def MemoryUsage(df):
+	"""
+	Return the bytes held by each column of a frame, counting the Python objects of object columns.
+	The geometry column is counted as its array of pointers; the GEOS geometries themselves are the
+	same in any layout.
+	"""
+	return pd.DataFrame(df).memory_usage(index=False, deep=True)
+
+
+def CompareMemory(before, after):
+	"""
+	Compare the memory of a frame before and after CompactFrame.
+
+	Returns:
+	- DataFrame: One row per column, and a 'total' row, with the dtypes, the bytes before and after
+	  and the bytes saved.
+	"""
+	report = pd.DataFrame({
+		"dtype_before": before.dtypes.astype(str),
+		"dtype_after": after.dtypes.astype(str),
+		"bytes_before": MemoryUsage(before),
+		"bytes_after": MemoryUsage(after),
+	})
+	report.loc["total"] = ["", "", report["bytes_before"].sum(), report["bytes_after"].sum()]
+	report["bytes_saved"] = report["bytes_before"] - report["bytes_after"]
+	return report
+
+
+def ReportMemorySaved(before, after, label="frame"):
+	"""Print one line with the memory of a frame before and after CompactFrame, and return CompareMemory."""
+	report = CompareMemory(before, after)
+	total = report.loc["total"]
+	print(
+		f"{label}: {total['bytes_before'] / 2**20:.1f} MB -> {total['bytes_after'] / 2**20:.1f} MB "
+		f"({total['bytes_saved'] / 2**20:.1f} MB saved, {total['bytes_saved'] / max(total['bytes_before'], 1):.0%})"
+	)
+	return report
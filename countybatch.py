@@ -0,0 +1,221 @@
+"""
+Build the county population, target ward and passive ward artifacts for many counties in one pass.
+
+GetWardDataForCounty, GetTargetWardsInCounty and GetPassiveWardsInCounty work on one county at a time:
+each call re-sorts its county, recomputes centroids and writes its files, and building all of the
+VDLF target counties is a long serial loop. Here the per-county figures (mean VAP, target ward cutoff,
+top five wards, target wards and focal point) come out of one groupby over the statewide frame, with
+the centroids and percentages computed once for every ward. Only the encoding and writing of each
+county's files is done per county, on a pool of processes.
+
+A manifest in the output directory records a hash of the rows and settings each county's files were
+built from, so counties whose inputs have not changed are skipped.
+
+usage:
+	counties_gdf = GetWardDataFromList(ward_bounds_file, vdlf_target_counties, headers, numeric, geometry)
+	summaries = BuildCountyArtifacts(counties_gdf, vdlf_target_counties, out_dir="./static")
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from compactframes import ExpandFrame
+from filesig import ReplaceAtomically
+from gdftools import AddVAPPercentages, ComputeRegionCentroids, StreamGDFtoGJSN
+from vdlfcommon import vdlf_target_counties
+
+### the file types written for each artifact; the .xlsx files need openpyxl
+artifact_formats = ("geojson", "shp", "xlsx")
+
+manifest_name = "county_artifacts.json"
+
+
+def ComputeCountySummaries(counties_gdf, target_variable="LatinxVAP", vap_multiplier=2.0, top_n=5, lat=None, lon=None):
+	"""
+	Compute, with one groupby over all counties, the figures GetWardDataForCounty computes for one.
+
+	Parameters:
+	- counties_gdf (GeoDataFrame): The wards of every county, as returned by GetWardDataFromList.
+	- target_variable (str): The column the target wards are picked by.
+	- vap_multiplier (float): The target ward cutoff, as a multiple of the county mean of target_variable.
+	- top_n (int): The number of wards in the top ward lists.
+	- lat, lon (array-like): The centroid of each ward, in the order of counties_gdf, if already
+	  computed; otherwise they are computed here.
+
+	Returns:
+	- DataFrame: One row per county, indexed on CNTY_NAME, with 'mean_vap', 'target_ward_cutoff',
+	  'id_list', 'ward_list', 'pop_list', 'focal_point_lat' and 'focal_point_lon'.
+	"""
+	df = pd.DataFrame(counties_gdf[["CNTY_NAME", "GEOID", "WARDID", target_variable]]).astype({"CNTY_NAME": object})
+	if lat is None or lon is None:
+		lat, lon = ComputeRegionCentroids(counties_gdf[["geometry"]])[1][["lat", "lon"]].T.to_numpy()
+	df["lat"], df["lon"] = np.asarray(lat), np.asarray(lon)
+	df = df.sort_values(target_variable, ascending=False, kind="stable")
+	groups = df.groupby("CNTY_NAME", sort=False)
+
+	summaries = pd.DataFrame({"mean_vap": groups[target_variable].mean().astype(int)})
+	summaries["target_ward_cutoff"] = vap_multiplier * summaries["mean_vap"]
+
+	top = groups.head(top_n).groupby("CNTY_NAME", sort=False)
+	summaries["ward_list"] = top["WARDID"].agg(list)
+	summaries["pop_list"] = top["GEOID"].agg(list)
+
+	targets = df[df[target_variable] >= df["CNTY_NAME"].map(summaries["target_ward_cutoff"])]
+	target_groups = targets.groupby("CNTY_NAME", sort=False)
+	summaries["id_list"] = target_groups["GEOID"].agg(list).reindex(summaries.index)
+	summaries["id_list"] = summaries["id_list"].map(lambda ids: ids if isinstance(ids, list) else [])
+	summaries["focal_point_lat"] = target_groups["lat"].mean()
+	summaries["focal_point_lon"] = target_groups["lon"].mean()
+	summaries.index.name = "CNTY_NAME"
+	return summaries.sort_index()
+
+
+def _InputsHash(gdf, summary, target_variable, formats):
+	"""A hash of a county's rows and of everything else its files are built from."""
+	h = hashlib.sha256()
+	h.update(pd.util.hash_pandas_object(pd.DataFrame(gdf.drop(columns="geometry")), index=True).to_numpy().tobytes())
+	for wkb in shapely.to_wkb(np.asarray(gdf.geometry.values)):
+		h.update(wkb)
+	h.update(str(gdf.crs).encode())
+	settings = [target_variable, float(summary["target_ward_cutoff"]), list(formats), list(gdf.columns)]
+	h.update(json.dumps(settings, default=str).encode())
+	return h.hexdigest()
+
+
+def _ArtifactFiles(out_dir, county_name, formats):
+	out_dir = Path(out_dir)
+	files = []
+	for stem in ["population", "targetwards", "passivewards"]:
+		for fmt in formats:
+			if fmt == "xlsx" and stem == "population":
+				files += [out_dir / f"{county_name}_population_data.xlsx", out_dir / f"{county_name}_population_arrays.xlsx"]
+			else:
+				files.append(out_dir / f"{county_name}_{stem}.{fmt}")
+	return files
+
+
+def _WriteGDF(gdf, out_stem, formats):
+	if "geojson" in formats:
+		with open(f"{out_stem}.geojson", "wb") as f:
+			f.writelines(StreamGDFtoGJSN(gdf))
+	if "shp" in formats:
+		ExpandFrame(gdf).to_file(f"{out_stem}.shp", driver="ESRI Shapefile")
+
+
+def _WriteCountyArtifacts(county_name, gdf, summary, out_dir, target_variable, formats):
+	"""
+	Write the files GetWardDataForCounty, GetTargetWardsInCounty and GetPassiveWardsInCounty write for
+	one county, from its prepared population frame. Runs in a worker process.
+	"""
+	out_dir = Path(out_dir)
+	cutoff = summary["target_ward_cutoff"]
+
+	_WriteGDF(gdf, out_dir / f"{county_name}_population", formats)
+	if "xlsx" in formats:
+		data = {
+			"target_ward_cutoff": cutoff,
+			"focal_point_lat": summary["focal_point_lat"],
+			"focal_point_lon": summary["focal_point_lon"],
+		}
+		pd.DataFrame(data, index=[0]).to_excel(out_dir / f"{county_name}_population_data.xlsx")
+		data = {"ward_list": summary["ward_list"], "pop_list": summary["pop_list"]}
+		pd.DataFrame.from_dict(data).to_excel(out_dir / f"{county_name}_population_arrays.xlsx")
+
+	for stem, rows in [("targetwards", gdf[target_variable] >= cutoff), ("passivewards", gdf[target_variable] < cutoff)]:
+		part = gdf.loc[rows]
+		part.reset_index(inplace=True)
+		_WriteGDF(part, out_dir / f"{county_name}_{stem}", formats)
+		if "xlsx" in formats:
+			part.to_excel(out_dir / f"{county_name}_{stem}.xlsx")
+	return county_name
+
+
+def _ReadManifest(manifest_file):
+	if manifest_file.exists():
+		with manifest_file.open() as f:
+			return json.load(f)
+	return {}
+
+
+def BuildCountyArtifacts(
+	counties_gdf,
+	county_names=vdlf_target_counties,
+	out_dir="./static",
+	target_variable="LatinxVAP",
+	vap_multiplier=2.0,
+	formats=artifact_formats,
+	max_workers=None,
+	rebuild=False,
+):
+	"""
+	Build the population, target ward and passive ward files of many counties at once.
+
+	The per-county figures come from ComputeCountySummaries, and the centroids and VAP percentages
+	are computed once for all the wards. Each county whose rows or settings changed since its files
+	were last built, or whose files are missing, is then encoded and written on a process pool.
+
+	Parameters:
+	- counties_gdf (GeoDataFrame): The wards of every county, as returned by GetWardDataFromList.
+	- county_names (list): The counties to build.
+	- out_dir (str or Path): Where to write the files and the manifest.
+	- target_variable (str): The column the target wards are picked by.
+	- vap_multiplier (float): The target ward cutoff, as a multiple of the county mean.
+	- formats (tuple): The file types to write, out of "geojson", "shp" and "xlsx".
+	- max_workers (int): The number of worker processes; 1 writes every county in this process.
+	- rebuild (bool): Build every county even if its files are up to date.
+
+	Returns:
+	- DataFrame: The county summaries, with a 'status' column of 'built' or 'skipped'.
+	"""
+	out_dir = Path(out_dir)
+	out_dir.mkdir(parents=True, exist_ok=True)
+	county_names = list(county_names)
+	counties_gdf = counties_gdf.loc[counties_gdf["CNTY_NAME"].isin(county_names)]
+
+	_, prepared = ComputeRegionCentroids(counties_gdf)
+	summaries = ComputeCountySummaries(
+		counties_gdf, target_variable, vap_multiplier, lat=prepared["lat"], lon=prepared["lon"]).reindex(county_names)
+	prepared = AddVAPPercentages(prepared)
+	county_frames = {name: gdf.reset_index() for name, gdf in prepared.groupby("CNTY_NAME", sort=False, observed=True)}
+
+	manifest_file = out_dir / manifest_name
+	manifest = _ReadManifest(manifest_file)
+	todo = {}
+	summaries["status"] = "skipped"
+	for county_name in county_names:
+		if county_name not in county_frames:
+			print("No wards found for", county_name, "county.")
+			summaries.loc[county_name, "status"] = None
+			continue
+		gdf = county_frames[county_name]
+		inputs = _InputsHash(gdf, summaries.loc[county_name], target_variable, formats)
+		files_exist = all(f.exists() for f in _ArtifactFiles(out_dir, county_name, formats))
+		if rebuild or not files_exist or manifest.get(county_name) != inputs:
+			todo[county_name] = inputs
+
+	if max_workers is None:
+		max_workers = os.cpu_count() or 1
+	max_workers = max(1, min(max_workers, len(todo)))
+	args = [
+		(county_name, county_frames[county_name], summaries.loc[county_name].to_dict(), out_dir, target_variable, tuple(formats))
+		for county_name in todo
+	]
+	if max_workers == 1:
+		done = [_WriteCountyArtifacts(*a) for a in args]
+	else:
+		with ProcessPoolExecutor(max_workers=max_workers) as executor:
+			done = list(executor.map(_WriteCountyArtifacts, *zip(*args)))
+
+	for county_name in done:
+		manifest[county_name] = todo[county_name]
+		summaries.loc[county_name, "status"] = "built"
+	### renamed into place whole, so an interrupted run cannot leave a corrupt manifest that forces a full rebuild
+	with ReplaceAtomically(manifest_file, "w") as f:
+		json.dump(manifest, f, indent=1, sort_keys=True)
+	return summaries
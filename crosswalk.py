@@ -0,0 +1,312 @@
+"""
+A precomputed crosswalk from ward GEOID to the districts (assembly, senate, county board, aldermanic,
+school, ...) each ward falls in, with areal overlap fractions.
+
+The crosswalk is built once per boundary vintage with BuildCrosswalkFromFiles and stored as a small
+long-format table: one row per (district type, ward, district) overlap, with the fraction of the
+ward's area that lies in the district. Loaded with LoadCrosswalk it is indexed on (district type, GEOID),
+so district membership and apportionment of ward data become joins instead of overlays.
+
+usage:
+	xwalk = BuildCrosswalkFromFiles(ward_bounds_file, {
+		"assembly": (assembly_districts_file, "ASM2021"),
+		"senate": (senate_districts_file, "SEN2021"),
+	}, "./static/ward_crosswalk.parquet")
+	assembly = GetWardDistricts(xwalk, "assembly")                 # GEOID -> district
+	totals = ApportionToDistricts(xwalk, wards_df, "senate", ["PERSONS18", "HISPANIC18"])
+"""
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from layercache import ReadLayer, SourceSignature
+from sidecarcache import FileHash
+
+### areas are compared in the same equal-area projection gdftools uses for areaKMSq
+equal_area_crs = "epsg:6933"
+
+crosswalk_columns = ["district_type", "GEOID", "district", "fraction"]
+
+### overlaps smaller than this fraction of a ward are digitizing noise along shared edges
+min_overlap_fraction = 1e-4
+
+
+def ComputeOverlapAreas(sources, targets):
+	"""
+	Find every pair of overlapping polygons between two arrays and the area of each overlap.
+
+	Candidate pairs come from an STRtree query. A source lying wholly inside its target, or a target
+	wholly inside its source, overlaps by its own area; only the remaining pairs are intersected,
+	in one vectorized call.
+
+	Parameters:
+	- sources, targets: Arrays of polygons, in the same (equal-area) crs.
+
+	Returns:
+	- source_idx, target_idx (numpy.ndarray): The positions of each overlapping pair.
+	- overlap (numpy.ndarray): The area of each pair's intersection.
+	- source_areas (numpy.ndarray): The area of every source polygon.
+	"""
+	tree = shapely.STRtree(targets)
+	source_idx, target_idx = tree.query(sources, predicate="intersects")
+
+	shapely.prepare(targets)
+	source_areas = shapely.area(sources)
+	overlap = source_areas[source_idx].copy()
+	crossing = np.flatnonzero(~shapely.contains(targets[target_idx], sources[source_idx]))
+	if len(crossing):
+		shapely.prepare(sources)
+		holds = shapely.contains(sources[source_idx[crossing]], targets[target_idx[crossing]])
+		overlap[crossing[holds]] = shapely.area(targets[target_idx[crossing[holds]]])
+		crossing = crossing[~holds]
+		overlap[crossing] = shapely.area(
+			shapely.intersection(sources[source_idx[crossing]], targets[target_idx[crossing]])
+		)
+	return source_idx, target_idx, overlap, source_areas
+
+
+def ComputeOverlapFractions(wards_gdf, districts_gdf, district_column, ward_id="GEOID", min_fraction=min_overlap_fraction):
+	"""
+	Compute, for every ward, the fraction of its area lying in each district it overlaps.
+
+	Parameters:
+	- wards_gdf (GeoDataFrame): The wards, with a `ward_id` column.
+	- districts_gdf (GeoDataFrame): The districts, with a `district_column` column.
+	- district_column (str): The column holding the district identifier.
+	- ward_id (str): The column holding the ward identifier.
+	- min_fraction (float): Overlaps covering less than this fraction of a ward are dropped.
+
+	Returns:
+	- DataFrame: Columns GEOID, district and fraction, one row per overlapping (ward, district) pair.
+	"""
+	wards = np.asarray(wards_gdf.geometry.to_crs(equal_area_crs).values)
+	districts = np.asarray(districts_gdf.geometry.to_crs(equal_area_crs).values)
+
+	ward_idx, district_idx, overlap, ward_areas = ComputeOverlapAreas(wards, districts)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		fraction = np.where(ward_areas[ward_idx] > 0, overlap / ward_areas[ward_idx], 0.0)
+
+	keep = fraction >= min_fraction
+	result = pd.DataFrame({
+		"GEOID": wards_gdf[ward_id].astype(str).to_numpy()[ward_idx[keep]],
+		"district": districts_gdf[district_column].astype(str).to_numpy()[district_idx[keep]],
+		"fraction": np.minimum(fraction[keep], 1.0).astype("float32"),
+	})
+	return result.sort_values(["GEOID", "district"], ignore_index=True)
+
+
+def BuildCrosswalk(wards_gdf, districts, ward_id="GEOID", min_fraction=min_overlap_fraction):
+	"""
+	Build a crosswalk from wards to several district layers.
+
+	Parameters:
+	- wards_gdf (GeoDataFrame): The wards, with a `ward_id` column.
+	- districts (dict): {district_type: (districts_gdf, district_column)}.
+	- ward_id (str): The column holding the ward identifier.
+	- min_fraction (float): Overlaps covering less than this fraction of a ward are dropped.
+
+	Returns:
+	- DataFrame: The crosswalk, indexed for lookups as LoadCrosswalk returns it.
+	"""
+	frames = []
+	for district_type, (districts_gdf, district_column) in districts.items():
+		df = ComputeOverlapFractions(wards_gdf, districts_gdf, district_column, ward_id, min_fraction)
+		df.insert(0, "district_type", district_type)
+		frames.append(df)
+	xwalk = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=crosswalk_columns)
+	return _IndexCrosswalk(xwalk)
+
+
+def _Compact(xwalk):
+	xwalk = xwalk[crosswalk_columns].copy()
+	for col in ["district_type", "GEOID", "district"]:
+		xwalk[col] = xwalk[col].astype(str).astype("category")
+	xwalk["fraction"] = xwalk["fraction"].astype("float32")
+	return xwalk
+
+
+def _IndexCrosswalk(xwalk):
+	return _Compact(xwalk).set_index(["district_type", "GEOID"]).sort_index()
+
+
+def WriteCrosswalk(xwalk, out_file, sources=None):
+	"""
+	Write a crosswalk to `out_file`: parquet if the name ends in .parquet, otherwise csv (compressed
+	if the name ends in .gz). `sources`, if given, is recorded next to it in a .json file so
+	BuildCrosswalkFromFiles can tell whether the boundary files have changed since.
+	"""
+	out_file = Path(out_file)
+	xwalk = _Compact(xwalk.reset_index())
+	if out_file.suffix == ".parquet":
+		xwalk.to_parquet(out_file, index=False)
+	else:
+		xwalk.to_csv(out_file, index=False)
+	if sources is not None:
+		with _MetaPath(out_file).open("w") as f:
+			json.dump(sources, f)
+	return out_file
+
+
+def _MetaPath(out_file):
+	return out_file.with_name(out_file.name + ".json")
+
+
+def _ReadCrosswalk(in_file):
+	if in_file.suffix == ".parquet":
+		return pd.read_parquet(in_file)
+	return pd.read_csv(in_file, dtype={"district_type": str, "GEOID": str, "district": str, "fraction": "float32"})
+
+
+### loaded crosswalks, least recently used first
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+crosswalk_cache_size = 8
+
+### the content hash of each boundary file, with the SourceSignature it was taken at
+_source_hashes = OrderedDict()
+_source_hashes_lock = threading.Lock()
+source_hash_cache_size = 64
+
+
+def LoadCrosswalk(in_file):
+	"""
+	Load a crosswalk written by WriteCrosswalk, indexed on (district_type, GEOID).
+	The last crosswalk_cache_size tables loaded are kept in memory and reloaded only if the file changes.
+	"""
+	in_file = Path(in_file)
+	key = str(in_file.resolve())
+	signature = SourceSignature(in_file)
+	with _loaded_lock:
+		entry = _loaded.get(key)
+		if entry is not None and entry[0] == signature:
+			_loaded.move_to_end(key)
+			return entry[1]
+	xwalk = _IndexCrosswalk(_ReadCrosswalk(in_file))
+	with _loaded_lock:
+		_loaded[key] = (signature, xwalk)
+		_loaded.move_to_end(key)
+		while len(_loaded) > crosswalk_cache_size:
+			_loaded.popitem(last=False)
+	return xwalk
+
+
+def _SourceHash(path):
+	"""
+	The FileHash of a boundary file, hashed again only when its SourceSignature has changed since
+	the last time, so checking a stored crosswalk costs a stat per file.
+	"""
+	key = str(Path(path).resolve())
+	signature = SourceSignature(path)
+	with _source_hashes_lock:
+		entry = _source_hashes.get(key)
+		if entry is not None and entry[0] == signature:
+			_source_hashes.move_to_end(key)
+			return entry[1]
+	digest = FileHash(path)
+	with _source_hashes_lock:
+		_source_hashes[key] = (signature, digest)
+		_source_hashes.move_to_end(key)
+		while len(_source_hashes) > source_hash_cache_size:
+			_source_hashes.popitem(last=False)
+	return digest
+
+
+def _Sources(ward_bounds_file, district_files, ward_id, min_fraction):
+	return {
+		"wards": [str(ward_bounds_file), _SourceHash(ward_bounds_file), ward_id],
+		"districts": {
+			district_type: [str(f), _SourceHash(f), column]
+			for district_type, (f, column) in district_files.items()
+		},
+		"min_fraction": min_fraction,
+	}
+
+
+def BuildCrosswalkFromFiles(ward_bounds_file, district_files, out_file, ward_id="GEOID", min_fraction=min_overlap_fraction, rebuild=False):
+	"""
+	Build the crosswalk for a boundary vintage from files and store it, or load the stored one if
+	none of the boundary files have changed since it was built.
+
+	Parameters:
+	- ward_bounds_file (str or Path): The ward boundary file.
+	- district_files (dict): {district_type: (district_file, district_column)}.
+	- out_file (str or Path): Where to store the crosswalk (.parquet, .csv or .csv.gz).
+	- ward_id (str): The column holding the ward identifier.
+	- min_fraction (float): Overlaps covering less than this fraction of a ward are dropped.
+	- rebuild (bool): Build the crosswalk even if the stored one is up to date.
+
+	Returns:
+	- DataFrame: The crosswalk, indexed on (district_type, GEOID).
+	"""
+	out_file = Path(out_file)
+	sources = _Sources(ward_bounds_file, district_files, ward_id, min_fraction)
+	meta_file = _MetaPath(out_file)
+	if not rebuild and out_file.exists() and meta_file.exists():
+		with meta_file.open() as f:
+			if json.load(f) == sources:
+				return LoadCrosswalk(out_file)
+
+	wards_gdf = ReadLayer(ward_bounds_file, columns=[ward_id])
+	districts = {
+		district_type: (ReadLayer(f, columns=[column]), column)
+		for district_type, (f, column) in district_files.items()
+	}
+	xwalk = BuildCrosswalk(wards_gdf, districts, ward_id, min_fraction)
+	WriteCrosswalk(xwalk, out_file, sources)
+	return LoadCrosswalk(out_file)
+
+
+def GetWardDistricts(xwalk, district_type):
+	"""
+	Return the district each ward belongs to, for one district type. A ward split between districts
+	is assigned to the one holding the largest share of its area.
+
+	Returns:
+	- Series: The district, indexed by GEOID.
+	"""
+	df = xwalk.loc[district_type].reset_index()
+	df = df.sort_values(["GEOID", "fraction"], ascending=[True, False]).drop_duplicates("GEOID")
+	return df.set_index("GEOID")["district"].astype(str).rename(district_type)
+
+
+def GetWardsInDistrict(xwalk, district_type, district):
+	"""
+	Return the wards overlapping a district, with the fraction of each ward lying in it.
+
+	Returns:
+	- DataFrame: Columns GEOID and fraction.
+	"""
+	df = xwalk.loc[district_type].reset_index()
+	df = df.loc[df["district"] == str(district), ["GEOID", "fraction"]]
+	return df.reset_index(drop=True)
+
+
+def ApportionToDistricts(xwalk, ward_df, district_type, columns, ward_id="GEOID"):
+	"""
+	Apportion ward-level counts to districts by areal overlap: each ward contributes its value
+	times the fraction of its area in the district.
+
+	Parameters:
+	- xwalk (DataFrame): A crosswalk from LoadCrosswalk or BuildCrosswalk.
+	- ward_df (DataFrame): Ward-level data with a `ward_id` column.
+	- district_type (str): The district type to apportion to.
+	- columns (list): The count columns to apportion.
+	- ward_id (str): The column of `ward_df` holding the ward identifier.
+
+	Returns:
+	- DataFrame: The apportioned totals, indexed by district.
+	"""
+	pairs = xwalk.loc[district_type].reset_index()
+	pairs["GEOID"] = pairs["GEOID"].astype(str)
+	values = pd.DataFrame(ward_df[columns]).set_axis(ward_df[ward_id].astype(str), axis=0)
+	joined = pairs.join(values, on="GEOID", how="inner")
+	joined[columns] = joined[columns].mul(joined["fraction"].astype("float64"), axis=0)
+	result = joined.groupby(joined["district"].astype(str))[columns].sum()
+	result.index.name = "district"
+	return result
@@ -13,6 +13,7 @@ import numpy as np
 import sys
 sys.path.append('./')
 from testVPNConnection import testVPNConnection
+from instrumentation import CurrentCall, FileBytes, Instrumented
 
 epochDate = '1970-01-01 00:00:00'
 cutoffDate = '2021-11-01 00:00:00'
@@ -186,9 +187,11 @@ def CleanPhone(df, phone_column = 'phone', format = 'INTERNATIONAL'):
     return df
     
 
+@Instrumented
 def InitializeDataFrames(path, data_file, remote_file = True, kwargs={}):
     """
-    Given a path and a file name, load a Pandas Dataframe
+    Given a path and a file name, load a Pandas Dataframe. The time taken and the bytes read
+    are recorded by instrumentation rather than printed.
     usage: df = InitializeDataFrames(path, file, True, {'sheet_name': '<SheetName>'})
 
     Args:
@@ -217,14 +220,13 @@ def InitializeDataFrames(path, data_file, remote_file = True, kwargs={}):
     print('Loading data from file...')
 
     sfx = pathlib.Path(data_file).suffix
-    start = time.time()
+    CurrentCall().bytes_read += FileBytes(inFile)
     if sfx == '.json':
         df = pd.read_json(inFile, typ = 'series', orient = 'records', **kwargs)
     elif sfx == '.csv':
         df = pd.read_csv(inFile,  **kwargs)
     elif sfx == '.xlsx':
         df = pd.read_excel(inFile, **kwargs)
-    print('Data loaded, elapsed time:', round((time.time() - start), 2), 'seconds.')
     return df
 
 
@@ -0,0 +1,66 @@
+"""
+Cheap signatures of data files, for telling whether a file has changed since it was last read, and
+atomic replacement of the cache files written next to them.
+
+Kept free of the geo stack so that modules like instrumentation, which edatools and geocoders
+import, can use them without pulling in geopandas.
+"""
+import os
+import threading
+from pathlib import Path
+
+### shapefiles keep their attributes in sidecar files, which can change without the .shp changing
+shapefile_sidecars = [".shp", ".dbf", ".shx", ".prj", ".cpg"]
+
+
+def SourceSignature(path):
+	"""
+	Return a cheap signature of a data file: (suffix, mtime_ns, size) for the file and, for
+	a shapefile, each of its sidecar files. The signature changes whenever any of them is rewritten.
+	"""
+	path = Path(path)
+	if path.suffix.lower() == ".shp":
+		files = [path.with_suffix(sfx) for sfx in shapefile_sidecars]
+	else:
+		files = [path]
+	signature = []
+	for f in files:
+		if f.exists():
+			st = f.stat()
+			signature.append((f.suffix, st.st_mtime_ns, st.st_size))
+	return tuple(signature)
+
+
+class ReplaceAtomically:
+	"""
+	Write a file under a private name next to `path`, and rename it over `path` once it is closed, so
+	a reader, or a run that is interrupted, never sees it partly written. On an error the private
+	file is removed and `path` is left as it was.
+
+	usage:
+		with ReplaceAtomically(meta_file, "w") as f:
+			json.dump(meta, f)
+		with ReplaceAtomically(sidecar) as tmp_path:    # mode None: write the path yourself
+			gdf.to_parquet(tmp_path)
+	"""
+
+	def __init__(self, path, mode="wb"):
+		self.path = Path(path)
+		self.tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+		self.mode = mode
+		self.file = None
+
+	def __enter__(self):
+		if self.mode is None:
+			return self.tmp
+		self.file = open(self.tmp, self.mode)
+		return self.file
+
+	def __exit__(self, exc_type, exc, tb):
+		if self.file is not None:
+			self.file.close()
+		if exc_type is None:
+			os.replace(self.tmp, self.path)
+		else:
+			self.tmp.unlink(missing_ok=True)
+		return False
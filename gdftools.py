@@ -1,14 +1,22 @@
+import asyncio
+import datetime
+import functools
+import hashlib
+import json
 import pathlib
-import random
-import time
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import IO
 
 import geojson
 import geopandas as gpd
+import numpy as np
 import pandas as pd
+import pyproj
 import shapely
-from shapely import wkt
 import matplotlib.pyplot as plt
 
 world_epsg = 4326  
@@ -18,6 +26,14 @@ wisconsin_epsg = 3070 #3070 is the Wisconsin Mercator Projection
 wisconsin_crs = 'EPSG:' + str(wisconsin_epsg)
 
 from testVPNConnection import testVPNConnection
+import layercache
+from layercache import ReadLayer
+from sidecarcache import ReadSidecar, SidecarPath, WriteSidecar
+from instrumentation import CurrentCall, FileBytes, Instrumented
+from topojsontools import EncodeTopology, default_quantization
+from ratiotools import AddRatioColumns
+from compactframes import CompactFrame, ExpandFrame, ReportMemorySaved
+from geometrycodec import GeometryFrame
 
 common_cols = ["id", "lat", "lon", "geometry", "z_layer"]
 
@@ -26,28 +42,163 @@ county_cols = ["GEOID", "CNTY_FIPS", "CNTY_NAME", *common_cols]
 city_cols = ["OBJECTID", "MCD_FIPS", "MCD_NAME", "CTV", *common_cols]
 
 
-def ConvertGDFtoGJSN(gdf):
-	"""_summary_
-	This random string is a workaround to fix a problem with
-	processes hanging on to a file handle after it has been closed.
+def _GeoJSONCrs(crs):
 	"""
-	randstr = str(random.randint(0, 1000))
-	out_file = pathlib.Path(f"./static/{randstr}.geojson")
-	out_file.parent.mkdir(parents=True, exist_ok=True)
-	gdf.to_file(out_file, driver="GeoJSON")
-	with out_file.open() as f:
-		gjsn = geojson.load(f)
-	out_file.unlink()
-	return gjsn
+	Return the 'crs' member the GDAL GeoJSON driver writes for a given crs,
+	or None if the frame has no crs.
+	"""
+	if crs is None:
+		return None
+	epsg = crs.to_epsg()
+	if epsg == world_epsg:
+		name = "urn:ogc:def:crs:OGC:1.3:CRS84"
+	elif epsg is not None:
+		name = f"urn:ogc:def:crs:EPSG::{epsg}"
+	else:
+		return None
+	return {"type": "name", "properties": {"name": name}}
+
+
+def _JSONProperty(value):
+	"""
+	Encode a property json cannot: dates and times as ISO 8601 strings, as the GDAL GeoJSON writer
+	wrote them (2024-01-02T03:04:05, milliseconds only when there are any), anything else as its str().
+	"""
+	if isinstance(value, datetime.datetime):
+		return value.isoformat(timespec="milliseconds" if value.microsecond else "seconds")
+	if isinstance(value, (datetime.date, datetime.time)):
+		return value.isoformat()
+	return str(value)
+
+
+def _EncodeGDFProperties(gdf):
+	"""
+	Encode the non-geometry columns of every row of a GeoDataFrame as a JSON object string;
+	NaN/None are written as null, dates and times as ISO 8601 strings and anything else json cannot
+	encode as its str().
+	"""
+	props = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+	props = props.astype(object).where(props.notna(), None)
+	if len(props.columns):
+		return [json.dumps(rec, default=_JSONProperty) for rec in props.to_dict("records")]
+	return ["{}"] * len(props)
+
+
+def _EncodeGDFFeatures(gdf, precision=geojson.geometry.DEFAULT_PRECISION):
+	"""
+	Encode every row of a GeoDataFrame as a GeoJSON Feature string.
+
+	The geometry column is written in one vectorized call to shapely.to_geojson,
+	after rounding all coordinates at once to `precision` decimal places (the
+	same rounding geojson.load applies). The remaining columns become the
+	feature properties; NaN/None are written as null.
+	"""
+	geoms = np.asarray(gdf.geometry.values)
+	if precision is not None:
+		geoms = shapely.transform(geoms, lambda coords: np.round(coords, precision))
+	geom_strs = shapely.to_geojson(geoms)
+	prop_strs = _EncodeGDFProperties(gdf)
+	return [
+		f'{{"type": "Feature", "properties": {p}, "geometry": {g if g is not None else "null"}}}'
+		for p, g in zip(prop_strs, geom_strs)
+	]
+
+
+def StreamGDFtoGJSN(gdf, chunk_size=1000, precision=geojson.geometry.DEFAULT_PRECISION):
+	"""
+	Encode a GeoDataFrame as a GeoJSON FeatureCollection, yielding UTF-8 bytes in chunks
+	of `chunk_size` features. Suitable for handing straight to a streaming Flask Response.
+
+	Parameters:
+	- gdf (GeoDataFrame): The frame to encode.
+	- chunk_size (int): The number of features per yielded chunk.
+	- precision (int): Decimal places kept in the coordinates, None keeps full precision.
+	"""
+	head = '{"type": "FeatureCollection", '
+	crs = _GeoJSONCrs(gdf.crs)
+	if crs is not None:
+		head += f'"crs": {json.dumps(crs)}, '
+	yield (head + '"features": [').encode("utf-8")
+	for start in range(0, len(gdf), chunk_size):
+		features = _EncodeGDFFeatures(gdf.iloc[start : start + chunk_size], precision)
+		sep = ", " if start > 0 else ""
+		yield (sep + ", ".join(features)).encode("utf-8")
+	yield b"]}"
+
+
+@Instrumented
+def ConvertGDFtoGJSN(gdf, precision=geojson.geometry.DEFAULT_PRECISION):
+	"""
+	Convert a GeoDataFrame to a geojson FeatureCollection in memory.
+
+	The result is the same collection the GDAL GeoJSON driver plus geojson.load used to
+	produce through a temporary file in ./static, without the disk write or the file
+	handle and name collision problems that came with it.
+
+	Parameters:
+	- gdf (GeoDataFrame): The frame to convert.
+	- precision (int): Decimal places kept in the coordinates, None keeps full precision.
+
+	Returns:
+	- gjsn (geojson.FeatureCollection): One feature per row, with every non-geometry column as a property.
+	"""
+	features = json.loads("[" + ", ".join(_EncodeGDFFeatures(gdf, precision)) + "]")
+	crs = _GeoJSONCrs(gdf.crs)
+	if crs is None:
+		return geojson.FeatureCollection(features)
+	return geojson.FeatureCollection(features, crs=crs)
+
+def ConvertGDFtoChoroplethGJSN(gdf, id_column="id", precision=geojson.geometry.DEFAULT_PRECISION):
+	"""
+	Convert a GeoDataFrame to the geojson a choropleth needs: the geometry, and 'id' as the only
+	property, for plotly's featureidkey 'properties.id'. The z and hover values come from the frame
+	itself (see payloadtools.AttributeTable), so the other columns are left out of every feature.
+
+	Parameters:
+	- gdf (GeoDataFrame): The frame to convert.
+	- id_column (str): The column holding the feature ids.
+	- precision (int): Decimal places kept in the coordinates, None keeps full precision.
+
+	Returns:
+	- gjsn (geojson.FeatureCollection): One feature per row, with only an 'id' property.
+	"""
+	ids = gdf[[id_column]].rename(columns={id_column: "id"})
+	return ConvertGDFtoGJSN(gpd.GeoDataFrame(ids, geometry=gdf.geometry.values, crs=gdf.crs), precision)
+
+
+def ConvertGDFtoTopoJSON(gdf, object_name="layer", quantization=default_quantization):
+	"""
+	Convert a GeoDataFrame of polygons to a TopoJSON Topology, an alternative to ConvertGDFtoGJSN
+	for layers whose polygons share boundaries. Each shared boundary is stored once, as an arc, and
+	coordinates are quantized and delta-encoded.
+
+	Parameters:
+	- gdf (GeoDataFrame): The frame to convert, with Polygon/MultiPolygon geometry.
+	- object_name (str): The name of the layer in the topology's objects.
+	- quantization (int): The number of grid steps across the layer's extent on each axis.
+
+	Returns:
+	- topo (dict): The topology, with every non-geometry column as a property of each geometry.
+	  It is for clients that decode TopoJSON themselves; plotly takes only GeoJSON, so figures built
+	  with plotlytools should keep using ConvertGDFtoGJSN.
+	"""
+	properties = json.loads("[" + ", ".join(_EncodeGDFProperties(gdf)) + "]")
+	return EncodeTopology(gdf.geometry.values, properties, object_name, quantization)
+
 
 def ConvertDFToGDF(df, crs = world_crs):
+	"""
+	Make a GeoDataFrame of a DataFrame with a 'geometry' column of shapely geometries, WKT, hex WKB
+	or WKB bytes (see geometrycodec). Geometries are used as they are, without a trip through WKT,
+	and df itself is left unchanged. Returns None if df has no 'geometry' column.
+	"""
 	if 'geometry' not in df.columns:
 		return None
-	df['geometry'] = df['geometry'].apply(lambda poly: poly.wkt)
-	return gpd.GeoDataFrame(df, geometry = df['geometry'].apply(wkt.loads), crs = crs)
+	return GeometryFrame(df, crs = crs)
 
 
-def InitializeGeoDataFrames(path, data_file, epsg = 4326, remote_file=True, kwargs={}):
+@Instrumented
+def InitializeGeoDataFrames(path, data_file, epsg = 4326, remote_file=True, kwargs={}, columns=None, use_sidecar=True, repair=None):
 	"""
 	InitializeGeoDataFrames is a function that initializes and returns a GeoDataFrame object by loading data from a file.
 
@@ -57,6 +208,9 @@ def InitializeGeoDataFrames(path, data_file, epsg = 4326, remote_file=True, kwar
 	- epsg (int): The EPSG code for the coordinate reference system.
 	- remote_file (bool): A flag indicating whether the data file is located remotely or not. Defaults to True.
 	- kwargs (dict): Additional keyword arguments to be passed to the underlying read_file method.
+	- columns (list): The attribute columns to return, or None for all of them. Defaults to None.
+	- use_sidecar (bool): Load from, and save to, a GeoParquet sidecar of the data file. Defaults to True.
+	- repair (bool): Repair invalid geometries as they are loaded (see geometryrepair). Defaults to layercache.repair_geometries.
 
 	Returns:
 	- gdf (GeoDataFrame): The initialized GeoDataFrame object containing the loaded data.
@@ -64,10 +218,12 @@ def InitializeGeoDataFrames(path, data_file, epsg = 4326, remote_file=True, kwar
 	If the remote_file flag is set to True and a VPN connection cannot be established using the testVPNConnection function, then an empty DataFrame is returned.
 	If the path specified does not exist, an empty GeoDataFrame is returned.
 	If the data file specified does not exist, an empty DataFrame is returned. The user may be prompted to enter network credentials.
-	The function first checks the file extension of the data file. If the extension is '.shp', the data is read using the read_file method with the specified kwargs. Otherwise, an 'unknown file type' message is printed, and an empty GeoDataFrame is returned.
-	The function also measures the time taken to load the geodata and prints the elapsed time.
+	If use_sidecar is set and an up-to-date GeoParquet sidecar of the data file exists (see sidecarcache), only the requested columns are read from it, already in the requested epsg.
+	Otherwise the function checks the file extension of the data file. If the extension is '.zip', '.shp' or '.xlsx' (with a 'geometry' column of WKT or hex WKB), the data is read with the specified kwargs, reprojected, and written to the sidecar for next time. Otherwise, an 'unknown file type' message is printed, and an empty GeoDataFrame is returned.
+	If repair is set, invalid geometries are repaired before the sidecar is written, and the repaired data is kept in a sidecar of its own.
+	The time taken and the bytes read are recorded by the instrumentation registry (see instrumentation) instead of printed.
 
-	Note: This function requires the geopandas library to be installed.
+	Note: This function requires the geopandas library to be installed. The sidecar also requires pyarrow; without it the data file is parsed on every load.
 
 	Example usage:
 	InitializeGeoDataFrames('/path/to/data', 'data.shp', remote_file=True)
@@ -85,42 +241,138 @@ def InitializeGeoDataFrames(path, data_file, epsg = 4326, remote_file=True, kwar
 		return gpd.GeoDataFrame()
 	print("Loading data from file...")
 
+	if repair is None:
+		repair = layercache.repair_geometries
+	### repaired data has a sidecar of its own, so turning repair on or off never reads the other kind
+	sidecar_kwargs = {**kwargs, "repaired": True} if repair else kwargs
+
 	sfx = pathlib.Path(data_file).suffix
-	start_time = time.time()
+	gdf = ReadSidecar(in_file, epsg, columns, sidecar_kwargs) if use_sidecar else None
+	if gdf is not None:
+		CurrentCall().bytes_read += FileBytes(SidecarPath(in_file, epsg, sidecar_kwargs))
+		return gdf
+	CurrentCall().bytes_read += FileBytes(in_file)
 	if sfx == ".zip":
 		zipfile = f"zip://{in_file}"
 		gdf = gpd.read_file(zipfile).to_crs(epsg=epsg)
-		elapsed_time = time.time() - start_time
-		print(
-			"Geodata loaded, elapsed time:",
-			time.strftime("%H:%M:%S", time.gmtime(elapsed_time)),
-		)
-		return gdf
-	if sfx == ".shp":
+	elif sfx == ".shp":
 		gdf = gpd.read_file(in_file, typ="series", orient="records", **kwargs).to_crs(epsg=epsg)
-		elapsed_time = time.time() - start_time
-		print(
-			"Geodata loaded, elapsed time:",
-			time.strftime("%H:%M:%S", time.gmtime(elapsed_time)),
-		)
-		return gdf
-	if sfx == ".xlsx":
+	elif sfx == ".xlsx":
 		df = pd.read_excel(in_file, **kwargs)
 		if "geometry" not in df.columns:
 			print("No 'geometry' column in DataFrame. Returning empty GeoDataFrame.")
 			return gpd.GeoDataFrame()
-		gs = gpd.GeoSeries(wkt.loads(df['geometry'])).set_crs(epsg=epsg)
-		gdf = gpd.GeoDataFrame(df, geometry=gs, crs=f"EPSG:{epsg}")  
-		elapsed_time = time.time() - start_time
-		print(
-			"Geodata loaded, elapsed time:",
-			time.strftime("%H:%M:%S", time.gmtime(elapsed_time)),
-		)
-		return gdf
+		### WKT or hex WKB, parsed in one vectorized pass
+		gdf = GeometryFrame(df, crs=f"EPSG:{epsg}")
 	else:
 		print("unknown file type:", sfx)
 		return gpd.GeoDataFrame()
 
+	if repair:
+		from geometryrepair import RepairLayer
+
+		gdf, _ = RepairLayer(gdf, source=in_file)
+	if use_sidecar:
+		WriteSidecar(gdf, in_file, epsg, sidecar_kwargs)
+	if columns is not None:
+		gdf = gdf[list(dict.fromkeys([*columns, gdf.geometry.name]))]
+	return gdf
+
+@functools.lru_cache(maxsize=64)
+def GetTransformer(crs_from, crs_to):
+	"""
+	Return a cached pyproj Transformer (in x, y order) between two coordinate reference systems.
+	Building a Transformer is far more expensive than using one, so they are built once per process.
+	"""
+	return pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+def TransformGeometries(geoms, crs_from, crs_to):
+	"""
+	Reproject an array of geometries with a cached Transformer, transforming all of their coordinates in one call.
+	"""
+	transformer = GetTransformer(crs_from, crs_to)
+	return shapely.transform(geoms, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+
+
+def _GeometryDigest(geoms):
+	"""A hash of all of the coordinates of an array of geometries and of how they split into geometries."""
+	h = hashlib.blake2b(shapely.get_coordinates(geoms).tobytes(), digest_size=16)
+	h.update(shapely.get_num_coordinates(geoms).tobytes())
+	h.update(shapely.get_type_id(geoms).tobytes())
+	return h.hexdigest()
+
+
+def _LayerFingerprint(geoms, crs):
+	"""A content key for an array of geometries in a crs."""
+	return (crs.to_string() if crs is not None else None, _GeometryDigest(geoms))
+
+
+_frame_fingerprints = {}
+_frame_fingerprints_lock = threading.Lock()
+
+
+def _FrameFingerprint(gdf):
+	"""
+	The _LayerFingerprint of a frame's geometry. Hashing every coordinate of a statewide layer takes
+	longer than a lookup should, so the key is remembered for as long as the frame keeps the same
+	geometry array; assigning new geometry to the frame gives it a new array.
+	"""
+	values = gdf.geometry.values
+	with _frame_fingerprints_lock:
+		entry = _frame_fingerprints.get(id(values))
+	if entry is not None and entry[0]() is values and entry[1] == gdf.crs:
+		return entry[2]
+	key = _LayerFingerprint(np.asarray(values), gdf.crs)
+
+	def forget(_, array_id=id(values)):
+		with _frame_fingerprints_lock:
+			_frame_fingerprints.pop(array_id, None)
+
+	with _frame_fingerprints_lock:
+		_frame_fingerprints[id(values)] = (weakref.ref(values, forget), gdf.crs, key)
+	return key
+
+
+_centroid_cache = OrderedDict()
+_centroid_cache_lock = threading.Lock()
+centroid_cache_size = 64
+
+
+def ComputeCentroidLatLon(geoms, crs):
+	"""
+	Compute the centroid of every geometry in an array, in the equal-area 'epsg:3035', and return the
+	latitude and longitude of each centroid in 'epsg:4326'.
+
+	The geometries are projected once and the centroids are computed and transformed as arrays. Results
+	are cached per layer, keyed on the coordinates of the geometries, so repeated calls on the same
+	frame only pay for the cache lookup.
+
+	Parameters:
+	- geoms: An array of geometries.
+	- crs: The coordinate reference system of the geometries.
+
+	Returns:
+	- lat, lon (numpy.ndarray): The latitude and longitude of each centroid.
+	"""
+	key = _LayerFingerprint(geoms, crs)
+	with _centroid_cache_lock:
+		if key in _centroid_cache:
+			_centroid_cache.move_to_end(key)
+			lat, lon = _centroid_cache[key]
+			return lat.copy(), lon.copy()
+
+	centroids = shapely.centroid(TransformGeometries(geoms, crs, "EPSG:3035"))
+	lon, lat = GetTransformer("EPSG:3035", world_crs).transform(shapely.get_x(centroids), shapely.get_y(centroids))
+
+	with _centroid_cache_lock:
+		_centroid_cache[key] = (lat, lon)
+		while len(_centroid_cache) > centroid_cache_size:
+			_centroid_cache.popitem(last=False)
+	return lat.copy(), lon.copy()
+
+
+@Instrumented
 def ComputeRegionCentroids(gdf):
 	"""
 	Compute the centroids of the regions in the given GeoDataFrame.
@@ -130,31 +382,37 @@ def ComputeRegionCentroids(gdf):
 
 	Returns:
 	- focal_point (list): A list containing the latitude and longitude coordinates of the focal point.
-	- gdf (GeoDataFrame): The modified input GeoDataFrame with additional columns for latitude and longitude.
+	- gdf (GeoDataFrame): A copy of the input GeoDataFrame in 'epsg:4326' with additional columns for latitude and longitude.
 
 	Note:
 	- The input GeoDataFrame must have a valid coordinate reference system.
-	- The input GeoDataFrame will be modified in place.
+	- The centroids are computed in 'epsg:3035' by ComputeCentroidLatLon, and cached per layer.
+	- Invalid geometries that make the centroids fail are repaired (see geometryrepair) and the centroids computed again.
+	  If they still cannot be computed, lat and lon are set to 0.0.
 	"""
+	if gdf.crs is None:
+		raise ValueError("Cannot transform naive geometries. Please set a crs on the object first.")
+
 	# Make sure we're using the correct coordinate reference system
-	gdf = gdf.to_crs("epsg:3035")
-	gdf["Center_point"] = gdf["geometry"].centroid.to_crs("epsg:4326")
-	gdf = gdf.to_crs("epsg:4326")
+	geoms = np.asarray(gdf.geometry.values)
+	try:
+		lat, lon = ComputeCentroidLatLon(geoms, gdf.crs)
+	except shapely.errors.GEOSException:
+		from geometryrepair import RepairGeometries
+
+		try:
+			lat, lon = ComputeCentroidLatLon(RepairGeometries(geoms)[0], gdf.crs)
+		except shapely.errors.GEOSException:
+			lat, lon = np.zeros(len(gdf)), np.zeros(len(gdf))
+	gdf = gdf.copy() if gdf.crs.to_epsg() == world_epsg else gdf.to_crs(world_crs)
 
 	# We want to figure the center point of the geometry so we can focus the visualization there
-	focal_point = [gdf["Center_point"].y.mean(), gdf["Center_point"].x.mean()]
+	focal_point = [pd.Series(lat).mean(), pd.Series(lon).mean()]
 
 	# We want the center point of each polygon
 	idx = list(gdf.columns).index("geometry")
-	try:
-		gdf.insert(idx, "lat", gdf.Center_point.map(lambda p: p.y), True)
-		gdf.insert(idx + 1, "lon", gdf.Center_point.map(lambda p: p.x), True)
-	except shapely.errors.GEOSException:
-		gdf.insert(idx, "lat", 0.0)
-		gdf.insert(idx + 1, "lon", 0.0)
-
-	# Don't need it any more
-	gdf.drop("Center_point", axis=1, inplace=True)
+	gdf.insert(idx, "lat", lat, True)
+	gdf.insert(idx + 1, "lon", lon, True)
 
 	return focal_point, gdf
 
@@ -177,6 +435,84 @@ def ComputeAreaInKMSq(gdf):
 	return float(areaInKMSq.iloc[0])
 
 
+def ComputeAreasInKMSq(geoms, crs):
+	"""
+	Compute the area in square kilometers of every geometry in an array, with a single projection
+	of the geometries (and nothing else) to the equal-area 'epsg:6933'.
+
+	Parameters:
+	- geoms: An array or GeoSeries of geometries.
+	- crs: The coordinate reference system of the geometries.
+
+	Returns:
+	- numpy.ndarray: The area of each geometry in square kilometers.
+	"""
+	return gpd.GeoSeries(geoms, crs=crs).to_crs("epsg:6933").area.to_numpy() / 10**6
+
+
+def _KeepPolygonalParts(geoms):
+	"""
+	Reduce clipped geometries to their polygonal parts, the way gpd.overlay does with keep_geom_type:
+	collections keep their polygons, and lines or points left over from touching edges become empty.
+	"""
+	geoms = geoms.copy()
+	type_ids = shapely.get_type_id(geoms)
+	for i in np.flatnonzero(type_ids == 7):
+		parts = shapely.get_parts(geoms[i])
+		parts = parts[np.isin(shapely.get_type_id(parts), [3, 6])]
+		geoms[i] = shapely.union_all(parts) if len(parts) else shapely.Polygon()
+	geoms[~np.isin(shapely.get_type_id(geoms), [3, 6])] = shapely.Polygon()
+	return geoms
+
+
+@Instrumented
+def ClipGDFToBounds(gdf, bounds, area_cutoff=0.0):
+	"""
+	Clip the polygons of a GeoDataFrame to the polygons of a bounds GeoDataFrame and drop slivers.
+
+	This produces the same rows as gpd.overlay(gdf, bounds[["geometry"]], how="intersection"), but
+	an STRtree over gdf picks out the candidates that touch the bounds at all, polygons lying entirely
+	inside the bounds are passed through untouched, and only the polygons that cross the boundary
+	are actually intersected. Areas are computed in one equal-area pass over the clipped geometry.
+
+	Parameters:
+	- gdf (GeoDataFrame): The polygons to clip.
+	- bounds (GeoDataFrame): The bounding polygons. They are reprojected to the crs of gdf if needed.
+	- area_cutoff (float): Pieces with an area (in square kilometers) not above this are dropped.
+
+	Returns:
+	- gdf (GeoDataFrame): The clipped rows in the order gpd.overlay returns them: the attributes of gdf,
+	  then the geometry, then a new 'areaKMSq' column.
+	"""
+	if bounds.crs is not None and gdf.crs is not None and bounds.crs != gdf.crs:
+		bounds = bounds.to_crs(gdf.crs)
+	bounds_geoms = np.asarray(bounds.geometry.values)
+	geoms = np.asarray(gdf.geometry.values)
+
+	tree = shapely.STRtree(geoms)
+	bounds_idx, gdf_idx = tree.query(bounds_geoms, predicate="intersects")
+	order = np.lexsort((bounds_idx, gdf_idx))
+	bounds_idx, gdf_idx = bounds_idx[order], gdf_idx[order]
+
+	### prepare a private copy: the bounds usually come from the layer cache, which hands every caller
+	### the same geometry objects, and a GEOS prepared geometry must not be used from two threads at once
+	bounds_geoms = shapely.from_wkb(shapely.to_wkb(bounds_geoms))
+	shapely.prepare(bounds_geoms)
+	clipped = geoms[gdf_idx]
+	crossing = ~shapely.contains(bounds_geoms[bounds_idx], clipped)
+	if crossing.any():
+		pieces = shapely.intersection(clipped[crossing], bounds_geoms[bounds_idx[crossing]])
+		pieces = _KeepPolygonalParts(pieces)
+		clipped[crossing] = shapely.buffer(pieces, 0)
+	keep = ~shapely.is_empty(clipped)
+
+	result = pd.DataFrame(gdf.drop(columns=gdf.geometry.name)).iloc[gdf_idx[keep]].reset_index(drop=True)
+	result = gpd.GeoDataFrame(result, geometry=gpd.GeoSeries(clipped[keep], crs=gdf.crs), crs=gdf.crs)
+	result["areaKMSq"] = ComputeAreasInKMSq(result.geometry.values, gdf.crs)
+	return result[result["areaKMSq"].gt(area_cutoff)]
+
+
+@Instrumented
 def GetCountyBounds(county_bounds_file: IO, county_name=None, write_files=False):
 	"""
 	GetCountyBounds function retrieves the county bounds for a given county name.
@@ -193,14 +529,14 @@ def GetCountyBounds(county_bounds_file: IO, county_name=None, write_files=False)
 
 	"""
 	if county_bounds_file.exists():
-		gdf = gpd.read_file(county_bounds_file)
+		gdf = ReadLayer(county_bounds_file)
 		if county_name is not None:
 			gdf = gdf[gdf["COUNTY_NAM"] == county_name]
 		focal_point, gdf = ComputeRegionCentroids(gdf)
 		gdf["id"] = gdf["COUNTY_NAM"]
 		gdf["z_layer"] = [0] * len(gdf)
 		gdf.reset_index(inplace=True)
-		gjsn = ConvertGDFtoGJSN(gdf)
+		gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 
 		if write_files:
 			out_file = pathlib.Path(f"./static/{county_name}_bounds.geojson")
@@ -216,6 +552,7 @@ def GetCountyBounds(county_bounds_file: IO, county_name=None, write_files=False)
 		print(" ".join(["County boundary file", county_bounds_file, "not found!"]))
 
 
+@Instrumented
 def GetBoundedGeometry(gdf, bounds, compute_focal_point=True):
 	"""
 	Calculate the bounded geometry of a GeoDataFrame within a given bounding box.
@@ -233,7 +570,7 @@ def GetBoundedGeometry(gdf, bounds, compute_focal_point=True):
 	- The function first calculates the area of the bounding box using the ComputeAreaInKMSq() function.
 	- It then filters out any slivers of districts where the area of the sliver is less than 0.1% of the area of the boundary.
 	- If the crs of the GeoDataFrame is None, it is set to 'epsg:4326'.
-	- The function overlays the geometry of the GeoDataFrame with the boundary geometry, keeping only the intersecting parts.
+	- The function clips the geometry of the GeoDataFrame to the boundary geometry with ClipGDFToBounds, keeping only the intersecting parts.
 	- The function also converts the geometry coordinates to 'epsg:4326' and calculates the area in square kilometers.
 	- The resulting GeoDataFrame is further filtered based on the area cutoff.
 	- If compute_focal_point is True, the function computes the focal point of the bounded geometry using the ComputeRegionCentroids() function.
@@ -245,19 +582,14 @@ def GetBoundedGeometry(gdf, bounds, compute_focal_point=True):
 	### of the area of the boundary
 	area_cutoff = bounds_area * 0.001
 
-	# TODO: think about this, it's very expensive on a big gdf
 	if gdf.crs is None:
 		gdf.crs = "epsg:4326"
 
 	gdf.to_crs("epsg:4326", inplace=True)
 
-	# Overlay the geometry only, you don't want other data from the bounds
+	# Clip the geometry only, you don't want other data from the bounds
 	# merged into your target gdf
-	gdf = gpd.overlay(gdf, bounds[["geometry"]], how="intersection")
-	temp = gdf.copy(deep=True)
-	temp.to_crs("epsg:6933", inplace=True)
-	gdf["areaKMSq"] = temp["geometry"].area / 10**6
-	gdf = gdf[gdf["areaKMSq"].gt(area_cutoff)]
+	gdf = ClipGDFToBounds(gdf, bounds, area_cutoff)
 	focal_point = []
 	if compute_focal_point:
 		[focal_point, gdf] = ComputeRegionCentroids(gdf)
@@ -290,10 +622,7 @@ def GetCountyBoardDistrictsInBounds(county_bounds_file: IO, bounds_gdf=None):
 	- If the county bounds file does not exist, it prints an error message.
 	"""
 	if county_bounds_file.exists():
-		if bounds_gdf is not None:
-			gdf = gpd.read_file(county_bounds_file, bbox=bounds_gdf)
-		else:
-			gdf = gpd.read_file(county_bounds_file)
+		gdf = ReadLayer(county_bounds_file, bbox=bounds_gdf)
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf = gdf.rename(columns={"SUPERID": "id"})
 		gdf["z_layer"] = [0] * len(gdf)
@@ -327,8 +656,7 @@ def GetCountyBoardDistrictsInCounty(county_bounds_file: IO, county_name: str):
 	If the county bounds file does not exist, the function prints an error message.
 	"""
 	if county_bounds_file.exists():
-		gdf = gpd.read_file(county_bounds_file)
-		gdf = gdf.loc[gdf["COUNTY_NAM"] == county_name]
+		gdf = ReadLayer(county_bounds_file, where={"COUNTY_NAM": county_name})
 		gdf = gdf.rename(columns={"SUPERID": "DISTRICT"})
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf.reset_index(inplace=True)
@@ -372,6 +700,7 @@ def GetCountyBoardDistrictByNumber(
 		)
 
 
+@Instrumented
 def GetAssemblyDistrictsInCounty(
 	assembly_districts_file: IO, county_bounds_file: IO, county_name: str
 ):
@@ -390,7 +719,7 @@ def GetAssemblyDistrictsInCounty(
 
 	If the files assembly_districts_file and county_bounds_file exist, the function proceeds with the following steps:
 	1. Get the county bounds using the GetCountyBounds function.
-	2. Read the assembly districts file using gpd.read_file.
+	2. Read the assembly districts file through the process-wide layer cache (ReadLayer).
 	3. Rename the 'ASM2021' column to 'DISTRICT' in the GeoDataFrame.
 	4. Get the bounded geometry using the GetBoundedGeometry function.
 	5. Rename the 'DISTRICT' column to 'id' in the GeoDataFrame.
@@ -405,12 +734,12 @@ def GetAssemblyDistrictsInCounty(
 	"""
 	if assembly_districts_file.exists() and county_bounds_file.exists():
 		[countyBounds, _, _] = GetCountyBounds(county_bounds_file, county_name)
-		gdf = gpd.read_file(assembly_districts_file, bbox=countyBounds)
+		gdf = ReadLayer(assembly_districts_file, bbox=countyBounds)
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf = gdf.rename(columns={"ASM2021": "id"})
 		gdf["z_layer"] = [0] * len(gdf)
 		gdf.reset_index(inplace=True)
-		gjsn = ConvertGDFtoGJSN(gdf)
+		gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 		return [gdf, gjsn]
 	else:
 		print(
@@ -435,15 +764,12 @@ def GetAssemblyDistrictsInBounds(assembly_districts_file: IO, bounds_gdf=None):
 	- If the assembly_districts_file does not exist, an error message will be printed.
 	"""
 	if assembly_districts_file.exists():
-		if bounds_gdf is not None:
-			gdf = gpd.read_file(assembly_districts_file, bbox=bounds_gdf)
-		else:
-			gdf = gpd.read_file(assembly_districts_file)
+		gdf = ReadLayer(assembly_districts_file, bbox=bounds_gdf)
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf = gdf.rename(columns={"ASM2021": "id"})
 		gdf["z_layer"] = [0] * len(gdf)
 		gdf.reset_index(inplace=True)
-		gjsn = ConvertGDFtoGJSN(gdf)
+		gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 		return [gdf, gjsn]
 	else:
 		print(
@@ -451,6 +777,7 @@ def GetAssemblyDistrictsInBounds(assembly_districts_file: IO, bounds_gdf=None):
 		)
 
 
+@Instrumented
 def GetSenateDistrictsInCounty(
 	senate_districts_file: IO, county_bounds_file: IO, county_name
 ):
@@ -474,12 +801,12 @@ def GetSenateDistrictsInCounty(
 	"""
 	if senate_districts_file.exists() and county_bounds_file.exists():
 		[countyBounds, _, _] = GetCountyBounds(county_bounds_file, county_name)
-		gdf = gpd.read_file(senate_districts_file, bbox=countyBounds)
+		gdf = ReadLayer(senate_districts_file, bbox=countyBounds)
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf = gdf.rename(columns={"SEN2021": "id"})
 		gdf["z_layer"] = [0] * len(gdf)
 		gdf.reset_index(inplace=True)
-		gjsn = ConvertGDFtoGJSN(gdf)
+		gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 		return [gdf, gjsn]
 	else:
 		print(" ".join(["Senate district file", senate_districts_file, "not found!"]))
@@ -502,15 +829,12 @@ def GetSenateDistrictsInBounds(senate_districts_file: IO, bounds_gdf=None):
 			FileNotFoundError: If the senate districts file does not exist.
 	"""
 	if senate_districts_file.exists():
-		if bounds_gdf is not None:
-			gdf = gpd.read_file(senate_districts_file, bbox=bounds_gdf)
-		else:
-			gdf = gpd.read_file(senate_districts_file)
+		gdf = ReadLayer(senate_districts_file, bbox=bounds_gdf)
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf = gdf.rename(columns={"SEN2021": "id"})
 		gdf["z_layer"] = [0] * len(gdf)
 		gdf.reset_index(inplace=True)
-		gjsn = ConvertGDFtoGJSN(gdf)
+		gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 		return [gdf, gjsn]
 	else:
 		print(" ".join(["Senate district file", senate_districts_file, "not found!"]))
@@ -519,7 +843,7 @@ def GetSenateDistrictsInBounds(senate_districts_file: IO, bounds_gdf=None):
 def GetAldermanicDistrictsInBounds(aldermanic_districts_file: IO, bounds_gdf):
 	if aldermanic_districts_file.exists():
 		print(bounds_gdf.head())
-		gdf = gpd.read_file(aldermanic_districts_file, bbox=bounds_gdf)
+		gdf = ReadLayer(aldermanic_districts_file, bbox=bounds_gdf)
 		print(gdf.columns)
 		print(gdf.head())
 		gdf = gdf.rename(columns={"ALDERID20": "DISTRICT"})
@@ -562,14 +886,15 @@ def GetAldermanicDistrictsInCity(
 	If the aldermanic districts file does not exist, it prints a file not found error message.
 	"""
 	if aldermanic_districts_file.exists():
-		gdf = gpd.read_file(aldermanic_districts_file)
 		if not using_local_file:
-			gdf = gdf.loc[
-				(gdf["CNTY_NAME"] == county_name) & (gdf["MCD_NAME"] == city_name)
-			]
+			gdf = ReadLayer(
+				aldermanic_districts_file,
+				where={"CNTY_NAME": county_name, "MCD_NAME": city_name},
+			)
 			gdf["id"] = gdf["ALDERID20"].apply(lambda x: x[-4:].lstrip("0"))
 
 		else:
+			gdf = ReadLayer(aldermanic_districts_file)
 			gdf["id"] = gdf["DISTRICT"]
 
 		_, gdf = ComputeRegionCentroids(gdf)
@@ -599,7 +924,7 @@ def GetPublicSchoolDistrictsInBounds(
 	- If the file does not exist, prints an error message and returns None, None.
 	"""
 	if school_districts_file.exists():
-		gdf = gpd.read_file(school_districts_file)
+		gdf = ReadLayer(school_districts_file)
 		gdf = gdf.loc[gdf.DISTRICT == city_name]
 
 		if not gdf.empty:
@@ -628,7 +953,7 @@ def _extracted_from_GetPublicSchoolDistrictsInBounds_23(gdf, county_bounds):
 	gdf["z_layer"] = [0] * len(gdf)
 	gdf["temp"] = gdf["z_layer"]
 	gdf.reset_index(inplace=True)
-	gjsn = ConvertGDFtoGJSN(gdf)
+	gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 	return [gdf, gjsn]
 
 
@@ -672,6 +997,7 @@ def GetAldermanicDistrictByNumber(
 		)
 
 
+@Instrumented
 def GetWardsInState(ward_bounds_file: IO):
 	"""
 	Gets the wards in a state based on the provided ward boundaries file.
@@ -688,7 +1014,7 @@ def GetWardsInState(ward_bounds_file: IO):
 	- FileNotFoundError: If the ward boundaries file does not exist.
 	"""
 	if ward_bounds_file.exists():
-		gdf = gpd.read_file(ward_bounds_file)
+		gdf = ReadLayer(ward_bounds_file)
 		_, gdf = ComputeRegionCentroids(gdf)
 		# gdf['STR_WARDS'] = gdf['STR_WARDS'].apply(lambda x : x.lstrip('0'))
 		gdf["id"] = gdf["LABEL"]
@@ -700,6 +1026,7 @@ def GetWardsInState(ward_bounds_file: IO):
 		print(" ".join(["Ward boundary file", ward_bounds_file, "not found!"]))
 
 
+@Instrumented
 def GetWardsInCounty(ward_bounds_file: IO, county_name: str):
 	"""
 	GetWardsInCounty function retrieves the wards in a specific county.
@@ -715,8 +1042,7 @@ def GetWardsInCounty(ward_bounds_file: IO, county_name: str):
 
 	"""
 	if ward_bounds_file.exists():
-		gdf = gpd.read_file(ward_bounds_file)
-		gdf = gdf.loc[gdf["CNTY_NAME"] == county_name]
+		gdf = ReadLayer(ward_bounds_file, where={"CNTY_NAME": county_name})
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf["STR_WARDS"] = gdf["STR_WARDS"].apply(lambda x: x.lstrip("0"))
 		gdf["id"] = gdf["LABEL"]
@@ -727,6 +1053,7 @@ def GetWardsInCounty(ward_bounds_file: IO, county_name: str):
 		print(" ".join(["Ward boundary file", ward_bounds_file, "not found!"]))
 
 
+@Instrumented
 def GetWardsInCity(ward_bounds_file: IO, county_name: str, city_name: str):
 	"""
 	GetWardsInCity is a function that takes in two parameters: ward_bounds_file of type IO and city_name of type str.
@@ -743,10 +1070,9 @@ def GetWardsInCity(ward_bounds_file: IO, county_name: str, city_name: str):
 	- list: A list containing two elements: gdf and gjsn.
 	"""
 	if ward_bounds_file.exists():
-		gdf = gpd.read_file(ward_bounds_file)
-		gdf = gdf.loc[
-			(gdf["CNTY_NAME"] == county_name) & (gdf["MCD_NAME"] == city_name)
-		]
+		gdf = ReadLayer(
+			ward_bounds_file, where={"CNTY_NAME": county_name, "MCD_NAME": city_name}
+		)
 		print(gdf.shape, gdf.head())
 		_, gdf = ComputeRegionCentroids(gdf)
 		gdf["ALDERID20"] = gdf["ALDERID20"].apply(lambda x: x.lstrip("0"))
@@ -772,8 +1098,7 @@ def GetCityWardByNumber(ward_bounds_file: IO, city_name: str, ward_number: int):
 	The second element is a GeoJSON object representing the ward geometry.
 	"""
 	if ward_bounds_file.exists():
-		gdf = gpd.read_file(ward_bounds_file)
-		gdf = gdf.loc[gdf["MCD_NAME"] == city_name]
+		gdf = ReadLayer(ward_bounds_file, where={"MCD_NAME": city_name})
 		gdf["ALDERID20"] = gdf["ALDERID20"].apply(lambda x: x.lstrip("0"))
 		gdf = gdf.loc[gdf["ALDERID20"] == str(ward_number)]
 		gdf["id"] = gdf["STR_WARDS"]
@@ -785,35 +1110,32 @@ def GetCityWardByNumber(ward_bounds_file: IO, city_name: str, ward_number: int):
 		print(" ".join(["Ward boundary file", ward_bounds_file, "not found!"]))
 
 
+@Instrumented
 def GetCityInCounty(county_ward_gdf, county_name, city_name):
 	"""
-	Given a GeoDataFrame and a city name, this function extracts the data for the specified city from the GeoDataFrame
-	and creates a new GeoDataFrame and saves it as a GeoJSON file. The function takes two parameters:
-	- `county_ward_gdf`: A GeoDataFrame containing data for all counties and wards.
-	- `city_name`: The name of the city for which the data needs to be extracted.
-
-	The function performs the following steps:
-	1. Filters the `county_ward_gdf` to get the data for the specified `city_name`.
-	2. Creates a new GeoDataFrame with the filtered data.
-	3. Adds additional columns (`id`, `z_layer`, `temp`) to the new GeoDataFrame.
-	4. Saves the new GeoDataFrame as a GeoJSON file.
-	5. Reads the saved GeoJSON file using the `geojson` library.
-	6. Removes the saved GeoJSON file.
-	7. Returns a list containing the new GeoDataFrame and the loaded GeoJSON data.
-
-	Note: The `county_ward_gdf` parameter should have a column named `MCD_NAME` which contains the city names.
-
-	:param county_ward_gdf: A GeoDataFrame containing data for all counties and wards.
-	:param city_name: The name of the city for which the data needs to be extracted.
-	:return: A list containing a GeoDataFrame and the loaded GeoJSON data.
-	"""
-	gdf = county_ward_gdf.loc[
-		(county_ward_gdf["CNTY_NAME"] == county_name)
-		& (county_ward_gdf["MCD_NAME"] == city_name)
-	].copy(deep=True)
-	gdf = gpd.GeoDataFrame(geometry=gpd.GeoSeries(gdf.unary_union))
-	gdf = gdf.set_crs("epsg:4326")
-	gdf = gdf.to_crs("epsg:4326")
+	Return the outline of a city (or any MCD) of a county, dissolved from its wards.
+
+	The outlines of every MCD and county of `county_ward_gdf` are dissolved together the first time
+	the layer is seen, and stored (see outlinecache); later calls for any city of the same layer are
+	lookups.
+
+	Parameters:
+	- county_ward_gdf (GeoDataFrame): The wards, with 'CNTY_NAME' and 'MCD_NAME' columns.
+	- county_name (str): The county the city is in.
+	- city_name (str): The MCD_NAME of the city.
+
+	Returns:
+	- list: A one-row GeoDataFrame in 'epsg:4326' with the outline, its centroid, 'id' (the city name)
+	  and 'z_layer', and the geojson of its common_cols.
+	"""
+	from outlinecache import GetOutlineCache
+
+	result = GetOutlineCache(county_ward_gdf).city_result(county_name, city_name)
+	if result is not None:
+		return result
+
+	### no such city: the union of no wards, as before
+	gdf = gpd.GeoDataFrame(geometry=gpd.GeoSeries([shapely.GeometryCollection()]), crs=world_crs)
 	_, gdf = ComputeRegionCentroids(gdf)
 	gdf["id"] = city_name
 	gdf["z_layer"] = [0] * len(gdf)
@@ -826,8 +1148,9 @@ def ComputeIdForMapLabel(row):
 		return " ".join([row["CTV"], row["MCD_NAME"], "Ward", row["WARDID"]])
 
 
+@Instrumented
 def GetWardDataFromList(
-	in_file: IO, county_list, headers, numeric, geometry, write_files=False
+	in_file: IO, county_list, headers, numeric, geometry, write_files=False, compact=False
 ):
 	"""
 	GetWardDataFromList is a function that reads ward data from a file and performs various operations on it.
@@ -838,18 +1161,20 @@ def GetWardDataFromList(
 	- headers: A list of column names to include in the resulting DataFrame.
 	- numeric: A list of column names representing numeric data to include in the resulting DataFrame.
 	- geometry: A list of column names representing geometric data to include in the resulting DataFrame.
+	- compact: If True, return the frame in the compact layout of compactframes.CompactFrame
+	  (categorical names, Arrow string GEOIDs, small integer counts) and print the memory saved.
 
 	Returns:
 	- gdf: A GeoDataFrame containing the filtered and processed ward data.
 	"""
 	if in_file.exists():
-		gdf = gpd.read_file(in_file)
-		print("number of wards in state:", len(gdf))
-		gdf = gdf.loc[gdf["CNTY_NAME"].isin(county_list)]
-
+		gdf = ReadLayer(
+			in_file,
+			where={"CNTY_NAME": list(county_list)},
+			columns=headers + numeric + geometry,
+		)
 		print("number of wards in listed counties:", len(gdf))
 
-		gdf = gdf[headers + numeric + geometry]
 		gdf = gdf.to_crs("epsg:4326")
 
 		# Do a little renaming
@@ -878,18 +1203,60 @@ def GetWardDataFromList(
 		else:
 			gdf['WARDID'] = gdf['GEOID'].apply(lambda x: x[-4:].lstrip("0"))
 
-		gdf["id"] = gdf.apply(lambda row: ComputeIdForMapLabel(row), axis=1)
+		gdf["id"] = gdf.apply(lambda row: ComputeIdForMapLabel(row), axis=1, result_type="reduce")
 		gdf["z_layer"] = [0] * len(gdf)
 
 		shp_file = pathlib.Path("./static/target_counties.shp")
 		if write_files and not shp_file.exists():
 			gdf.to_file(shp_file, driver="ESRI Shapefile")
 
+		if compact:
+			compact_gdf = CompactFrame(gdf)
+			ReportMemorySaved(gdf, compact_gdf, "wards in listed counties")
+			gdf = compact_gdf
+
 		return gdf
 	else:
 		print(" ".join(["Ward data file", in_file, "not found!"]))
 
 
+### the columns of the county population maps
+county_population_cols = [
+	"MCD_NAME",
+	"CTV",
+	"WARDID",
+	*county_cols,
+	"AsianVAPPct",
+	"AsianVAP",
+	"BlackVAPPct",
+	"BlackVAP",
+	"LatinxVAPPct",
+	"LatinxVAP",
+	"VAP",
+]
+
+
+### the voting age population shares of the county population maps: {column: (numerator, denominator)}
+vap_ratios = {
+	"BlackVAPPct": ("BlackVAP", "VAP"),
+	"LatinxVAPPct": ("LatinxVAP", "VAP"),
+	"AsianVAPPct": ("AsianVAP", "VAP"),
+}
+
+
+@Instrumented
+def AddVAPPercentages(gdf):
+	"""
+	Insert the Black, Latinx and Asian shares of the voting age population, rounded to two places,
+	after the 'AsianVAP' column. Wards with no voting age population get 0.
+
+	Returns:
+	- gdf (GeoDataFrame): A copy of the frame with the 'BlackVAPPct', 'LatinxVAPPct' and 'AsianVAPPct' columns added.
+	"""
+	return AddRatioColumns(gdf, vap_ratios, after="AsianVAP", decimals=2)
+
+
+@Instrumented
 def GetWardDataForCounty(
 	counties_gdf,
 	county_name,
@@ -932,47 +1299,21 @@ def GetWardDataForCounty(
 	_, gdf = ComputeRegionCentroids(gdf)
 	focal_point, _ = ComputeRegionCentroids(temp)
 
-	# Compute values for voting age population percentages
-	idx = list(gdf.columns).index("AsianVAP") + 1
-	gdf.insert(idx, "BlackVAPPct", gdf["BlackVAP"] / gdf["VAP"])
-	gdf["BlackVAPPct"] = gdf["BlackVAPPct"].fillna(0)
-	gdf["BlackVAPPct"] = gdf["BlackVAPPct"].map(lambda x: "{:.2f}".format(x))
-	gdf["BlackVAPPct"] = gdf["BlackVAPPct"].astype(float)
-
-	gdf.insert(idx + 1, "LatinxVAPPct", gdf["LatinxVAP"] / gdf["VAP"])
-	gdf["LatinxVAPPct"] = gdf["LatinxVAPPct"].fillna(0)
-	gdf["LatinxVAPPct"] = gdf["LatinxVAPPct"].map(lambda x: "{:.2f}".format(x))
-	gdf["LatinxVAPPct"] = gdf["LatinxVAPPct"].astype(float)
-
-	gdf.insert(idx + 2, "AsianVAPPct", gdf["AsianVAP"] / gdf["VAP"])
-	gdf["AsianVAPPct"] = gdf["AsianVAPPct"].fillna(0)
-	gdf["AsianVAPPct"] = gdf["AsianVAPPct"].map(lambda x: "{:.2f}".format(x))
-	gdf["AsianVAPPct"] = gdf["AsianVAPPct"].astype(float)
+	gdf = AddVAPPercentages(gdf)
 
 	gdf.reset_index(inplace=True)
-	cols = [
-		"MCD_NAME",
-		"CTV",
-		"WARDID",
-		*county_cols,
-		"AsianVAPPct",
-		"AsianVAP",
-		"BlackVAPPct",
-		"BlackVAP",
-		"LatinxVAPPct",
-		"LatinxVAP",
-		"VAP",
-	]
-	gjsn = ConvertGDFtoGJSN(gdf[cols])
+	gjsn = ConvertGDFtoGJSN(gdf[county_population_cols])
 
 	if write_files:
+		### the file writers do not take the categorical and Arrow columns of a compact frame
+		out_gdf = ExpandFrame(gdf)
 		out_file = pathlib.Path("./static/" + county_name + "_population.geojson")
 		if not out_file.exists():
-			gdf.to_file(out_file, driver="GeoJSON")
+			out_gdf.to_file(out_file, driver="GeoJSON")
 
 		out_file = pathlib.Path("./static/" + county_name + "_population.shp")
 		if not out_file.exists():
-			gdf.to_file(out_file, driver="ESRI Shapefile")
+			out_gdf.to_file(out_file, driver="ESRI Shapefile")
 
 		out_file = pathlib.Path("./static/" + county_name + "_population_data.xlsx")
 		if not out_file.exists():
@@ -996,6 +1337,7 @@ def GetWardDataForCounty(
 	return [target_ward_cutoff, id_list, ward_list, pop_list, focal_point, gdf, gjsn]
 
 
+@Instrumented
 def GetTargetWardsInCounty(
 	gdf, target_ward_cutoff, target_variable="LatinxVAP", write_files=False
 ):
@@ -1010,29 +1352,31 @@ def GetTargetWardsInCounty(
 	Returns:
 			list: A list containing two elements:
 					- gdf (GeoDataFrame): The filtered GeoDataFrame.
-					- gjsn (GeoJSON): The GeoJSON representation of the filtered GeoDataFrame.
+					- gjsn (GeoJSON): The geometry and id of the filtered wards; their other columns are in gdf.
 	"""
 	county_name = gdf.iloc[0].CNTY_NAME
 	gdf = gdf.loc[gdf[target_variable] >= target_ward_cutoff]
 	gdf.reset_index(inplace=True)
-	gjsn = ConvertGDFtoGJSN(gdf)
+	gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 
 	if write_files:
+		out_gdf = ExpandFrame(gdf)
 		out_file = pathlib.Path("./static/" + county_name + "_targetwards.geojson")
 		if not out_file.exists():
-			gdf.to_file(out_file, driver="GeoJSON")
+			out_gdf.to_file(out_file, driver="GeoJSON")
 
 		out_file = pathlib.Path("./static/" + county_name + "_targetwards.shp")
 		if not out_file.exists():
-			gdf.to_file(out_file, driver="ESRI Shapefile")
+			out_gdf.to_file(out_file, driver="ESRI Shapefile")
 
 		out_file = pathlib.Path("./static/" + county_name + "_targetwards.xlsx")
 		if not out_file.exists():
-			gdf.to_excel(out_file)
+			out_gdf.to_excel(out_file)
 
 	return [gdf, gjsn]
 
 
+@Instrumented
 def GetPassiveWardsInCounty(
 	gdf, target_ward_cutoff, target_variable="LatinxVAP", write_files=False
 ):
@@ -1045,29 +1389,31 @@ def GetPassiveWardsInCounty(
 	- write_files: Optional parameter indicating whether to write the data to an Excel file. Default is False.
 
 	Returns:
-	- A list containing the GeoDataFrame and the geojson representation of the data.
+	- A list containing the GeoDataFrame and the geojson of its geometry and id.
 	"""
 	county_name = gdf.iloc[0].CNTY_NAME
 	gdf = gdf.loc[gdf[target_variable] < target_ward_cutoff]
 	gdf.reset_index(inplace=True)
-	gjsn = ConvertGDFtoGJSN(gdf)
+	gjsn = ConvertGDFtoChoroplethGJSN(gdf)
 
 	if write_files:
+		out_gdf = ExpandFrame(gdf)
 		out_file = pathlib.Path("./static/" + county_name + "_passivewards.geojson")
 		if not out_file.exists():
-			gdf.to_file(out_file, driver="GeoJSON")
+			out_gdf.to_file(out_file, driver="GeoJSON")
 
 		out_file = pathlib.Path("./static/" + county_name + "_passivewards.shp")
 		if not out_file.exists():
-			gdf.to_file(out_file, driver="ESRI Shapefile")
+			out_gdf.to_file(out_file, driver="ESRI Shapefile")
 
 		out_file = pathlib.Path("./static/" + county_name + "_passivewards.xlsx")
 		if not out_file.exists():
-			gdf.to_excel(out_file)
+			out_gdf.to_excel(out_file)
 
 	return [gdf, gjsn]
 
 
+@Instrumented
 def TrimGDFToBounds(gdf, bounds, bounds_area=None):
 	"""
 	Trims a GeoDataFrame (gdf) to the provided bounds and computes the area of
@@ -1084,11 +1430,7 @@ def TrimGDFToBounds(gdf, bounds, bounds_area=None):
 	if bounds_area is None:
 		bounds_area = ComputeAreaInKMSq(bounds)
 	area_cutoff = bounds_area * 0.001
-	gdf = gpd.overlay(gdf, bounds[["geometry"]], how="intersection")
-	temp = gdf.copy(deep=True)
-	temp = temp.to_crs("epsg:6933")
-	gdf["areaKMSq"] = temp["geometry"].area / 10**6
-	gdf = gdf[gdf["areaKMSq"].gt(area_cutoff)]
+	gdf = ClipGDFToBounds(gdf, bounds, area_cutoff)
 	gdf.reset_index(inplace=True)
 	gjsn = ConvertGDFtoGJSN(gdf[common_cols])
 	return [gdf, gjsn]
@@ -1097,7 +1439,8 @@ def TrimGDFToBounds(gdf, bounds, bounds_area=None):
 	##### functions to support asynchronous processing
 
 
-def GetDistrictsInBounds(datafile, rename_column, bounds_gdf=None):
+@Instrumented
+def GetDistrictsInBounds(datafile, rename_column, bounds_gdf=None, bounds_area=None):
 	"""
 	Reads a datafile containing district information and returns the districts within specified bounds.
 
@@ -1105,21 +1448,118 @@ def GetDistrictsInBounds(datafile, rename_column, bounds_gdf=None):
 		datafile (str): Path to the datafile.
 		rename_column (str): Name of the column to be renamed as 'id'.
 		bounds_gdf (GeoDataFrame, optional): Bounds to filter the districts. Defaults to None.
+		bounds_area (float, optional): The area of the bounds in square kilometers, if already known.
 
 	Returns:
 		GeoDataFrame: Districts within the specified bounds.
 	"""
+	datafile = Path(datafile)
 	if datafile.exists():
-		if bounds_gdf is not None:
-			gdf = gpd.read_file(datafile, bbox=bounds_gdf)
-		else:
-			gdf = gpd.read_file(datafile)
+		gdf = ReadLayer(datafile, bbox=bounds_gdf)
 		gdf = gdf.rename(columns={rename_column: "id"})
 		gdf["z_layer"] = [0] * len(gdf)
 		focal_point, gdf = ComputeRegionCentroids(gdf)
-		return TrimGDFToBounds(gdf[common_cols], bounds_gdf)
+		return TrimGDFToBounds(gdf[common_cols], bounds_gdf, bounds_area)
 	else:
-		print(" ".join(["Data file", datafile, "not found!"]))
+		print(" ".join(["Data file", str(datafile), "not found!"]))
+
+
+### the most district layers loaded at once; the files usually sit on a network share, so much of
+### a load is spent waiting on I/O, and shapely releases the GIL for the clipping
+district_loader_workers = 4
+
+### the loader threads are kept for the life of the process: each new thread pays to set up its
+### own PROJ and GDAL contexts, which would otherwise cost more than the first layer it loads
+_district_loaders = {}
+_district_loaders_lock = threading.Lock()
+
+
+def _GetDistrictLoader(max_workers):
+	max_workers = max(1, int(max_workers))
+	with _district_loaders_lock:
+		if max_workers not in _district_loaders:
+			_district_loaders[max_workers] = ThreadPoolExecutor(
+				max_workers=max_workers, thread_name_prefix="district-loader")
+		return _district_loaders[max_workers]
+
+
+def _DistrictBoundsArea(bounds_gdf):
+	"""
+	Compute the area of the bounds once, rather than once per layer.
+	"""
+	if bounds_gdf is None:
+		return None
+	return ComputeAreaInKMSq(bounds_gdf)
+
+
+def IterDistrictsInBounds(specs, bounds_gdf=None, max_workers=district_loader_workers):
+	"""
+	Load several district layers at once, on a pool of threads, and yield each one as soon as it is ready.
+
+	Parameters:
+	- specs (list): (datafile, rename_column) pairs, as passed to GetDistrictsInBounds.
+	- bounds_gdf (GeoDataFrame): The bounds every layer is clipped to.
+	- max_workers (int): The most layers read at the same time.
+
+	Returns:
+	- generator: (position in specs, [gdf, gjsn]) in order of completion; [gdf, gjsn] is None for a
+	  missing datafile. An error loading a layer is raised when that layer comes up.
+	"""
+	specs = list(specs)
+	bounds_area = _DistrictBoundsArea(bounds_gdf)
+	executor = _GetDistrictLoader(max_workers)
+	futures = {
+		executor.submit(GetDistrictsInBounds, datafile, rename_column, bounds_gdf, bounds_area): i
+		for i, (datafile, rename_column) in enumerate(specs)
+	}
+	try:
+		for future in as_completed(futures):
+			yield futures[future], future.result()
+	finally:
+		for future in futures:
+			future.cancel()
+
+
+def GetDistrictsInBoundsConcurrently(specs, bounds_gdf=None, max_workers=district_loader_workers):
+	"""
+	Load several district layers at once and return them in the order of `specs`.
+
+	Returns:
+	- list: One [gdf, gjsn] (or None for a missing datafile) per spec.
+	"""
+	specs = list(specs)
+	results = [None] * len(specs)
+	for i, result in IterDistrictsInBounds(specs, bounds_gdf, max_workers):
+		results[i] = result
+	return results
+
+
+async def GetDistrictsInBoundsAsync(specs, bounds_gdf=None, max_workers=district_loader_workers):
+	"""
+	The asyncio form of IterDistrictsInBounds: an async generator of (position in specs, [gdf, gjsn])
+	in order of completion, with the layers loaded on a pool of threads so the event loop stays free.
+
+	usage:
+		async for i, (gdf, gjsn) in GetDistrictsInBoundsAsync(specs, county_bounds):
+			...
+	"""
+	specs = list(specs)
+	loop = asyncio.get_running_loop()
+	executor = _GetDistrictLoader(max_workers)
+	bounds_area = await loop.run_in_executor(executor, _DistrictBoundsArea, bounds_gdf)
+
+	async def load(i, datafile, rename_column):
+		result = await loop.run_in_executor(
+			executor, GetDistrictsInBounds, datafile, rename_column, bounds_gdf, bounds_area)
+		return i, result
+
+	tasks = [asyncio.ensure_future(load(i, *spec)) for i, spec in enumerate(specs)]
+	try:
+		for task in asyncio.as_completed(tasks):
+			yield await task
+	finally:
+		for task in tasks:
+			task.cancel()
 
 
 def PlotGDF(gdf, color = 'indigo', width = 5, height = 5, alpha = 0.65, edgecolor = 'black', linewidth = 1.0):
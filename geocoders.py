@@ -1,9 +1,9 @@
 
-import time
-from datetime import datetime
 import pandas as pd
 import googlemaps
 
+from instrumentation import CurrentCall, Instrumented
+
 from empowerJSONhelpers import IsBlank as is_blank
 from empowerJSONhelpers import IsNotBlank as is_not_blank
 
@@ -68,11 +68,11 @@ def google_geocode(row, missed = 0):
 
 
 
+@Instrumented
 def nominatim_geocode(geocode, inputdf):
+    CurrentCall().rows_in = len(inputdf)
     df = inputdf.copy(deep = True)
     print('before geocode df shape is:',df.shape)
-    start = time.time()
-    print("begin: ", datetime.now().strftime("%H:%M:%S"))
     
     df['FullAddress'] = df['Address'] + ', ' + df['City'] + ', ' + df['State']
     df['gcode'] = df['FullAddress'].apply(geocode)
@@ -87,8 +87,6 @@ def nominatim_geocode(geocode, inputdf):
     gdf = gpd.GeoDataFrame(df, geometry = gpd.points_from_xy(df.latitude, df.longitude))
     gdf.set_crs('epsg:4326', inplace = True)
     print('after conversion to geodataframe gdf shape is:', gdf.shape)
-    elapsed = time.time() - start
-    print(time.strftime("elapsed: %H:%M:%S", time.gmtime(elapsed)) )   
     return gdf
    
 ### usage:   
@@ -0,0 +1,134 @@
+"""
+Vectorized decoding and encoding of geometry columns.
+
+Geometry reaches the loaders in several forms: WKT text in spreadsheets, hex-encoded WKB in
+spreadsheets exported from a database, raw WKB from parquet or SQL, or shapely geometries already.
+DecodeGeometries takes a column holding any mix of these, and None or NaN for missing values, and
+parses each kind with one call of shapely's vectorized from_wkt or from_wkb. A column of geometries
+is used as it is, so nothing is written out to text and parsed back.
+
+usage:
+	geoms = DecodeGeometries(df["geometry"])
+	gdf = GeometryFrame(df, crs="EPSG:4326")
+	df["geometry"] = EncodeGeometries(gdf.geometry.values, "hex")
+"""
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from geopandas.array import GeometryArray
+
+geometry_formats = ("wkb", "hex", "wkt")
+
+### hex WKB starts with its byte order marker, 00 or 01; WKT starts with a letter
+_hex_wkb_prefixes = ("00", "01")
+
+
+def _DecodeHex(text, on_invalid):
+	### GEOS reads hex an order of magnitude slower than bytes, so unhex in Python first
+	try:
+		wkb = [bytes.fromhex(s) for s in text]
+	except ValueError:
+		return shapely.from_wkb(text, on_invalid=on_invalid)
+	return shapely.from_wkb(wkb, on_invalid=on_invalid)
+
+
+def _DecodeText(text, on_invalid):
+	is_hex = pd.Series(text, dtype=object).str.startswith(_hex_wkb_prefixes).to_numpy(dtype=bool)
+	geoms = np.empty(len(text), dtype=object)
+	if is_hex.any():
+		geoms[is_hex] = _DecodeHex(text[is_hex], on_invalid)
+	if not is_hex.all():
+		geoms[~is_hex] = shapely.from_wkt(text[~is_hex], on_invalid=on_invalid)
+	return geoms
+
+
+def DecodeGeometries(values, on_invalid="raise"):
+	"""
+	Decode a column of geometries given as WKT, hex WKB, WKB bytes or shapely geometries, in any mix.
+
+	Parameters:
+	- values (array-like): The column. None, NaN and empty strings decode to None.
+	- on_invalid (str): What to do with text or bytes that do not parse: "raise", "warn" or "ignore"
+	  (which gives None), as for shapely.from_wkt.
+
+	Returns:
+	- numpy.ndarray: An object array of shapely geometries.
+	"""
+	values = np.asarray(values, dtype=object)
+	if len(values) == 0:
+		return np.empty(0, dtype=object)
+	kind = pd.api.types.infer_dtype(values, skipna=True)
+	missing = pd.isna(values)
+
+	if kind == "string" or kind == "bytes":
+		### one kind throughout: no need to look at each value's type
+		is_text = ~missing if kind == "string" else np.zeros(len(values), dtype=bool)
+		is_bytes = ~missing if kind == "bytes" else np.zeros(len(values), dtype=bool)
+		is_geometry = np.zeros(len(values), dtype=bool)
+	else:
+		is_geometry = shapely.is_geometry(values)
+		if (is_geometry | missing).all():
+			return np.where(is_geometry, values, None)
+		types = np.array([type(v) for v in values], dtype=object)
+		is_text = (types == str) & ~missing
+		is_bytes = ((types == bytes) | (types == bytearray) | (types == memoryview)) & ~missing
+		other = ~(is_geometry | is_text | is_bytes | missing)
+		if other.any():
+			raise TypeError(f"Cannot decode a geometry from a {type(values[other][0]).__name__}: {values[other][0]!r}")
+
+	### empty cells of a spreadsheet come through as empty strings
+	if is_text.any():
+		text_rows = np.flatnonzero(is_text)
+		is_text[text_rows[pd.Series(values[text_rows], dtype=object).str.len().to_numpy() == 0]] = False
+
+	geoms = np.full(len(values), None, dtype=object)
+	geoms[is_geometry] = values[is_geometry]
+	if is_text.any():
+		geoms[is_text] = _DecodeText(values[is_text], on_invalid)
+	if is_bytes.any():
+		geoms[is_bytes] = shapely.from_wkb([bytes(v) for v in values[is_bytes]], on_invalid=on_invalid)
+	return geoms
+
+
+def EncodeGeometries(geoms, geometry_format="wkb"):
+	"""
+	Encode an array of geometries in one vectorized call.
+
+	Parameters:
+	- geoms (array-like): Shapely geometries; None stays None.
+	- geometry_format (str): "wkb" for bytes, "hex" for hex-encoded WKB, or "wkt".
+
+	Returns:
+	- numpy.ndarray: An object array of bytes or str.
+	"""
+	geoms = np.asarray(geoms, dtype=object)
+	if geometry_format == "wkb":
+		return shapely.to_wkb(geoms)
+	if geometry_format == "hex":
+		return shapely.to_wkb(geoms, hex=True)
+	if geometry_format == "wkt":
+		return shapely.to_wkt(geoms, rounding_precision=-1)
+	raise ValueError(f"geometry_format must be one of {geometry_formats}, not {geometry_format!r}")
+
+
+def GeometryFrame(df, geometry="geometry", crs=None, on_invalid="raise"):
+	"""
+	Make a GeoDataFrame of a DataFrame whose geometry column holds WKT, hex WKB, WKB bytes or
+	geometries. The DataFrame passed in is not modified.
+
+	Parameters:
+	- df (DataFrame): The frame.
+	- geometry (str): The name of the geometry column.
+	- crs: The crs of the geometries.
+	- on_invalid (str): As for DecodeGeometries.
+
+	Returns:
+	- GeoDataFrame: A frame with the same columns, the geometry column decoded.
+	"""
+	geoms = DecodeGeometries(df[geometry].to_numpy(dtype=object), on_invalid)
+	### DecodeGeometries only gives geometries and None, so the array needs no checking
+	gdf = gpd.GeoDataFrame(pd.DataFrame(df).drop(columns=geometry), geometry=GeometryArray(geoms), crs=crs)
+	if geometry != "geometry":
+		gdf = gdf.rename_geometry(geometry)
+	return gdf[list(df.columns)]
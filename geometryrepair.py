@@ -0,0 +1,148 @@
+"""
+Validation and repair of the geometries of a layer as it is loaded.
+
+Invalid polygons (self-intersecting rings, bowties, rings touching at a line) make overlays and
+centroids raise a GEOSException part way through a layer. RepairLayer checks every geometry of a
+layer in one vectorized shapely.is_valid call and runs make_valid on the invalid ones only. Polygons
+keep only their polygonal parts, so a repaired ward is still a (multi)polygon. What was changed is
+returned as a report, one row per repaired geometry, and kept in the repair log.
+
+Repairs are cached per layer, keyed on its coordinates, so a layer read again (or another frame
+holding the same geometries) is patched from the cache without checking or repairing it again.
+
+The loaders repair what they read when asked to:
+	layercache.repair_geometries = True                    # ReadLayer, and the gdftools readers built on it
+	gdf = InitializeGeoDataFrames(path, data_file, repair=True)
+
+usage:
+	gdf, report = RepairLayer(wards_gdf, source="wards.shp")
+	GetRepairLog()                                         # every repair made in this process
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+from geopandas.array import GeometryArray
+
+from gdftools import _FrameFingerprint, _KeepPolygonalParts
+
+repair_columns = ["position", "reason", "type_before", "type_after", "area_before", "area_after", "valid"]
+
+_type_names = np.array(
+	["Point", "LineString", "LinearRing", "Polygon", "MultiPoint", "MultiLineString", "MultiPolygon", "GeometryCollection"],
+	dtype=object,
+)
+
+_repairs = OrderedDict()
+_repairs_lock = threading.Lock()
+repair_cache_size = 64
+
+
+def _TypeNames(geoms):
+	type_ids = shapely.get_type_id(geoms)
+	return np.where(type_ids >= 0, _type_names[type_ids.clip(min=0)], None)
+
+
+def FindInvalidGeometries(geoms):
+	"""
+	Return the positions of the invalid geometries in an array. Missing geometries are not invalid.
+	"""
+	geoms = np.asarray(geoms, dtype=object)
+	return np.flatnonzero(~shapely.is_valid(geoms) & ~shapely.is_missing(geoms))
+
+
+def RepairGeometries(geoms, positions=None):
+	"""
+	Repair the invalid geometries of an array with make_valid, leaving the valid ones untouched.
+
+	Parameters:
+	- geoms: An array of geometries.
+	- positions: The positions to repair, as from FindInvalidGeometries; None finds them.
+
+	Returns:
+	- geoms (numpy.ndarray): A copy of the array with the invalid geometries repaired.
+	- report (DataFrame): One row per repaired geometry, with the columns of repair_columns: the
+	  position, why it was invalid, its geometry type and area before and after, and whether the
+	  repaired geometry is valid.
+	"""
+	geoms = np.array(geoms, dtype=object)
+	if positions is None:
+		positions = FindInvalidGeometries(geoms)
+	before = geoms[positions]
+	after = shapely.make_valid(before)
+
+	### make_valid can turn part of a polygon into lines; a polygon layer keeps polygons
+	polygonal = np.isin(shapely.get_type_id(before), [3, 6])
+	if polygonal.any():
+		after[polygonal] = _KeepPolygonalParts(after[polygonal])
+	geoms[positions] = after
+
+	report = pd.DataFrame({
+		"position": positions,
+		"reason": shapely.is_valid_reason(before),
+		"type_before": _TypeNames(before),
+		"type_after": _TypeNames(after),
+		"area_before": shapely.area(before),
+		"area_after": shapely.area(after),
+		"valid": shapely.is_valid(after),
+	}, columns=repair_columns)
+	return geoms, report
+
+
+def RepairLayer(gdf, source=None):
+	"""
+	Return a layer with its invalid geometries repaired, along with a report of the repairs.
+
+	The repairs of each layer are cached on the layer's coordinates, so the same geometries are only
+	checked and repaired once per process, and a frame passed in again is not even hashed again.
+
+	Parameters:
+	- gdf (GeoDataFrame): The layer.
+	- source: Where the layer came from, recorded in the repair log.
+
+	Returns:
+	- gdf (GeoDataFrame): The layer itself if every geometry is valid, otherwise a copy with the
+	  invalid geometries replaced.
+	- report (DataFrame): As from RepairGeometries, with 'position' counting rows from 0.
+	"""
+	geoms = np.asarray(gdf.geometry.values)
+	key = _FrameFingerprint(gdf)[1]
+	with _repairs_lock:
+		entry = _repairs.get(key)
+		if entry is not None:
+			_repairs.move_to_end(key)
+	if entry is None:
+		positions = FindInvalidGeometries(geoms)
+		repaired, report = RepairGeometries(geoms, positions)
+		entry = (positions, repaired[positions], report, None if source is None else str(source))
+		if len(positions):
+			print(f"Repaired {len(positions):,} invalid geometries of {len(geoms):,} in", source or "layer")
+		with _repairs_lock:
+			_repairs[key] = entry
+			while len(_repairs) > repair_cache_size:
+				_repairs.popitem(last=False)
+
+	positions, fixed, report = entry[:3]
+	if not len(positions):
+		return gdf, report.copy()
+	repaired = geoms.copy()
+	repaired[positions] = fixed
+	gdf = gdf.copy()
+	gdf[gdf.geometry.name] = GeometryArray(repaired, crs=gdf.crs)
+	return gdf, report.copy()
+
+
+def GetRepairLog():
+	"""
+	Return the repairs made to the layers still in the repair cache.
+
+	Returns:
+	- DataFrame: The reports of every layer with invalid geometries, with a 'source' column first.
+	"""
+	with _repairs_lock:
+		entries = [entry for entry in _repairs.values() if len(entry[0])]
+	if not entries:
+		return pd.DataFrame(columns=["source", *repair_columns])
+	return pd.concat([report.assign(source=source)[["source", *repair_columns]] for _, _, report, source in entries], ignore_index=True)
@@ -0,0 +1,360 @@
+"""
+A read-only, memory-mapped store of boundary and ward layers, shared by the worker processes of a
+deployment.
+
+Every gunicorn worker of the map server parses the ward and district layers into its own
+GeoDataFrames, so a dyno holds one copy per worker. A geometry store is written once per layer, as a
+directory of flat files:
+- geometry.wkb: the WKB of every geometry, back to back,
+- offsets.npy: where each geometry starts in geometry.wkb, with the end of the last one appended,
+- bounds.npy: the (minx, miny, maxx, maxy) of every geometry,
+- index.npy and one cNNN.npy per attribute column; text columns as fixed-width unicode, with a
+  cNNN.isna.npy mask where they have nulls,
+- meta.json: the crs, the columns, and the signature and hash of the source file.
+
+Workers attach to a store with numpy memory maps, read-only, so the arrays are the operating
+system's page cache and every worker shares the same pages. Bounding box and attribute filters are
+evaluated on the mapped arrays, and only the selected rows are decoded into a GeoDataFrame, for the
+one request that needs them.
+
+Stores are named after the source file and a hash of its content, and written to a temporary
+directory that is renamed into place, so workers starting together can all call GetGeometryStore:
+the first one to finish builds the store and the others use it. Build the stores in the gunicorn
+master (an on_starting hook, or --preload) to have them built once per dyno.
+
+Setting layercache.geometry_store_dir sends every ReadLayer call, and so the gdftools getters,
+through the stores in that directory instead of the per-process layer cache.
+
+usage:
+	import layercache
+	layercache.geometry_store_dir = "./static/geometry_store"   # in the app, before the first request
+	[gdf, gjsn] = GetWardsInCounty(ward_bounds_file, "Milwaukee")
+
+	store = GetGeometryStore(ward_bounds_file)
+	rows = store.select(where={"CNTY_NAME": "Dane"})
+	gdf = store.frame(rows, columns=["GEOID", "LABEL"])
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyproj
+import shapely
+
+import layercache
+from layercache import SourceSignature, _ReadLayer, _WhereValues
+from sidecarcache import FileHash
+
+### where GetGeometryStore writes stores when it is not given a directory
+default_store_dir = Path("./static/geometry_store")
+
+store_version = 1
+
+
+def _IsText(series):
+	return pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty")
+
+
+def WriteGeometryStore(gdf, store_dir, source=None):
+	"""
+	Write a GeoDataFrame to a new geometry store.
+
+	Parameters:
+	- gdf (GeoDataFrame): The layer. Attribute columns must be numeric, boolean, datetime or text
+	  (including categoricals of text).
+	- store_dir (str or Path): The store directory, which must not exist yet.
+	- source (dict): Anything to record about where the layer came from, kept in meta.json.
+
+	Returns:
+	- Path: store_dir. If another process wrote the same store first, its store is kept.
+
+	Raises:
+	- TypeError: If an attribute column has a type the store cannot map.
+	"""
+	store_dir = Path(store_dir)
+	geometry = gdf.geometry.name
+	columns = []
+	arrays = {}
+	for i, name in enumerate(c for c in gdf.columns if c != geometry):
+		series = gdf[name]
+		file = f"c{i:03d}"
+		if series.dtype.kind in "biufcmM":
+			arrays[file] = series.to_numpy()
+			columns.append({"name": name, "file": file, "text": False, "nulls": False})
+		elif _IsText(series):
+			values = series.astype(object)
+			isna = values.isna().to_numpy()
+			arrays[file] = np.array(values.where(~isna, ""), dtype=str)
+			if isna.any():
+				arrays[f"{file}.isna"] = isna
+			columns.append({"name": name, "file": file, "text": True, "nulls": bool(isna.any())})
+		else:
+			raise TypeError(f"Column {name!r} of type {series.dtype} cannot be stored; drop it or convert it first.")
+
+	geoms = np.asarray(gdf.geometry.values)
+	wkb = shapely.to_wkb(geoms)
+	lengths = np.array([0 if b is None else len(b) for b in wkb], dtype=np.int64)
+	arrays["offsets"] = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+	arrays["bounds"] = shapely.bounds(geoms)
+	arrays["index"] = gdf.index.to_numpy() if pd.api.types.is_integer_dtype(gdf.index) else np.arange(len(gdf))
+
+	meta = {
+		"version": store_version,
+		"rows": len(gdf),
+		"crs": gdf.crs.to_wkt() if gdf.crs is not None else None,
+		"geometry": geometry,
+		"columns": columns,
+		"source": source or {},
+	}
+
+	### write everything to a private directory, then rename it into place in one step
+	tmp_dir = store_dir.with_name(f".{store_dir.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+	if tmp_dir.exists():
+		shutil.rmtree(tmp_dir)
+	tmp_dir.mkdir(parents=True)
+	try:
+		with open(tmp_dir / "geometry.wkb", "wb") as f:
+			f.writelines(b for b in wkb if b is not None)
+		for file, array in arrays.items():
+			np.save(tmp_dir / f"{file}.npy", array, allow_pickle=False)
+		with open(tmp_dir / "meta.json", "w") as f:
+			json.dump(meta, f, indent=1)
+		try:
+			os.rename(tmp_dir, store_dir)
+		except OSError:
+			if not (store_dir / "meta.json").exists():
+				raise
+	finally:
+		if tmp_dir.exists():
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+	return store_dir
+
+
+class GeometryStore:
+	"""
+	A geometry store attached read-only. Its arrays are memory maps; nothing is decoded until a
+	frame or geometries are asked for.
+	"""
+
+	def __init__(self, store_dir):
+		self.store_dir = Path(store_dir)
+		with open(self.store_dir / "meta.json") as f:
+			self.meta = json.load(f)
+		if self.meta.get("version") != store_version:
+			raise ValueError(f"{self.store_dir} was written by another version of geometrystore")
+		self.crs = pyproj.CRS.from_wkt(self.meta["crs"]) if self.meta["crs"] else None
+		self.geometry_name = self.meta["geometry"]
+		self.columns = [c["name"] for c in self.meta["columns"]]
+		self._columns = {c["name"]: c for c in self.meta["columns"]}
+
+		self._maps = {}
+		self.offsets = self._Load("offsets")
+		self.bounds = self._Load("bounds")
+		self.index = self._Load("index")
+		if self.offsets[-1] > 0:
+			self.wkb = np.memmap(self.store_dir / "geometry.wkb", dtype=np.uint8, mode="r")
+		else:
+			self.wkb = np.zeros(0, dtype=np.uint8)
+
+	def _Load(self, file):
+		values = self._maps.get(file)
+		if values is None:
+			values = np.load(self.store_dir / f"{file}.npy", mmap_mode="r", allow_pickle=False)
+			self._maps[file] = values
+		return values
+
+	def __len__(self):
+		return self.meta["rows"]
+
+	def column(self, name, rows=None):
+		"""
+		Return an attribute column as an array: the memory map itself for a numeric column read whole,
+		and Python strings (None for nulls) for a text column.
+		"""
+		column = self._columns[name]
+		values = self._Load(column["file"])
+		if rows is not None:
+			values = values[rows]
+		if not column["text"]:
+			return values
+		values = values.astype(object)
+		if column["nulls"]:
+			isna = self._Load(f"{column['file']}.isna")
+			values[isna if rows is None else isna[rows]] = None
+		return values
+
+	def geometries(self, rows=None):
+		"""Decode the geometries of some rows, or of all of them, into an array of shapely geometries."""
+		rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+		starts = self.offsets[rows]
+		ends = self.offsets[rows + 1]
+		wkb = np.array([self.wkb[s:e].tobytes() if e > s else None for s, e in zip(starts, ends)], dtype=object)
+		return shapely.from_wkb(wkb)
+
+	def select(self, bbox=None, where=None):
+		"""
+		Return the positions of the rows matching a bounding box and an attribute filter, the way
+		layercache.ReadLayer selects them.
+
+		Parameters:
+		- bbox: A (minx, miny, maxx, maxy) tuple, a geometry, or a GeoSeries or GeoDataFrame (reprojected to
+		  the store's crs); rows whose geometry intersects it are kept.
+		- where (dict): {column: value or list of values}; only rows matching every entry are kept.
+
+		Returns:
+		- numpy.ndarray: The selected row positions, in order.
+		"""
+		mask = np.ones(len(self), dtype=bool)
+		for name, values in (where or {}).items():
+			values = list(_WhereValues(values))
+			column = self._columns[name]
+			if not column["text"]:
+				mask &= np.isin(self._Load(column["file"]), values)
+				continue
+			### compare on the mapped fixed-width strings, without decoding the column
+			matches = np.isin(self._Load(column["file"]), [v for v in values if isinstance(v, str)])
+			if column["nulls"]:
+				isna = self._Load(f"{column['file']}.isna")
+				matches = (matches & ~isna) | (isna if any(v is None for v in values) else False)
+			mask &= matches
+		if bbox is None:
+			return np.flatnonzero(mask)
+
+		box = shapely.box(*self._BboxBounds(bbox))
+		minx, miny, maxx, maxy = box.bounds
+		bounds = self.bounds
+		mask &= (bounds[:, 0] <= maxx) & (bounds[:, 2] >= minx) & (bounds[:, 1] <= maxy) & (bounds[:, 3] >= miny)
+		rows = np.flatnonzero(mask)
+		return rows[shapely.intersects(self.geometries(rows), box)]
+
+	def _BboxBounds(self, bbox):
+		if isinstance(bbox, (gpd.GeoDataFrame, gpd.GeoSeries)):
+			if bbox.crs is not None and self.crs is not None and bbox.crs != self.crs:
+				bbox = bbox.to_crs(self.crs)
+			return tuple(bbox.total_bounds)
+		if isinstance(bbox, shapely.Geometry):
+			return bbox.bounds
+		return tuple(bbox)
+
+	def frame(self, rows=None, columns=None):
+		"""
+		Decode some rows, or all of them, into a GeoDataFrame with the columns of the source layer,
+		or the given subset of them, and the geometry last.
+		"""
+		names = self.columns if columns is None else [c for c in columns if c != self.geometry_name]
+		index = pd.Index(np.array(self.index if rows is None else self.index[rows]))
+		if rows is None and index.equals(pd.RangeIndex(len(index))):
+			index = pd.RangeIndex(len(index))
+		data = {name: self.column(name, rows) for name in names}
+		gdf = gpd.GeoDataFrame(data, index=index, geometry=self.geometries(rows), crs=self.crs)
+		if self.geometry_name != "geometry":
+			gdf = gdf.rename_geometry(self.geometry_name)
+		return gdf
+
+
+def _StoreName(layer_file, columns):
+	return f"{Path(layer_file).stem}_{hashlib.sha256(repr(columns).encode()).hexdigest()[:8]}"
+
+
+def _FindStore(store_root, layer_file, columns, signature=None, content_hash=None):
+	"""Return the directory of a store of layer_file with these columns whose signature or hash matches, or None."""
+	source = str(Path(layer_file).resolve())
+	for meta_file in Path(store_root).glob(f"{_StoreName(layer_file, columns)}_*/meta.json"):
+		try:
+			with meta_file.open() as f:
+				meta = json.load(f)
+		except (OSError, ValueError):
+			continue
+		stored = meta.get("source", {})
+		if meta.get("version") != store_version or stored.get("path") != source:
+			continue
+		if (signature is not None and stored.get("signature") == signature) or (
+			content_hash is not None and stored.get("hash") == content_hash
+		):
+			return meta_file.parent
+	return None
+
+
+def BuildGeometryStore(layer_file, columns=None, store_root=None):
+	"""
+	Return the store of a layer file, writing it if the file has no up-to-date store yet.
+
+	A store whose recorded signature (mtime and size) matches the file is used as it is; otherwise the
+	file's content hash decides, so a file that was only touched or copied keeps its store. Stores of
+	older versions of the file are removed when a new one is written.
+
+	Parameters:
+	- layer_file (str or Path): The shapefile or other data file.
+	- columns (list): The attribute columns to store, or None for all of them.
+	- store_root (str or Path): The directory holding the stores; default_store_dir if None.
+
+	Returns:
+	- Path: The store directory.
+	"""
+	store_root = Path(store_root if store_root is not None else default_store_dir)
+	columns = list(columns) if columns is not None else None
+	### round trip through json so it compares equal to what was stored
+	signature = json.loads(json.dumps(SourceSignature(layer_file)))
+	store_dir = _FindStore(store_root, layer_file, columns, signature=signature)
+	if store_dir is not None:
+		return store_dir
+	content_hash = FileHash(layer_file)
+	store_dir = _FindStore(store_root, layer_file, columns, content_hash=content_hash)
+	if store_dir is not None:
+		return store_dir
+
+	old_stores = list(store_root.glob(f"{_StoreName(layer_file, columns)}_*"))
+	gdf = _ReadLayer(layer_file, columns=columns)
+	source = {"path": str(Path(layer_file).resolve()), "signature": signature, "hash": content_hash}
+	store_dir = WriteGeometryStore(gdf, store_root / f"{_StoreName(layer_file, columns)}_{content_hash[:16]}", source)
+	for old in old_stores:
+		if old != store_dir and not old.name.startswith("."):
+			### a worker may still have the old files mapped; where they cannot be removed yet they are left
+			shutil.rmtree(old, ignore_errors=True)
+	return store_dir
+
+
+_attached = {}
+_attached_lock = threading.Lock()
+
+
+def GetGeometryStore(layer_file, columns=None, store_root=None):
+	"""
+	Return this process's GeometryStore of a layer file, building the store first if need be. A store
+	is attached once per process, and again only when the file changes.
+	"""
+	key = (str(Path(layer_file).resolve()), tuple(columns) if columns is not None else None, str(store_root))
+	signature = SourceSignature(layer_file)
+	with _attached_lock:
+		entry = _attached.get(key)
+	if entry is not None and entry[0] == signature:
+		return entry[1]
+	store = GeometryStore(BuildGeometryStore(layer_file, columns, store_root))
+	with _attached_lock:
+		_attached[key] = (signature, store)
+	return store
+
+
+def ReadStoredLayer(path, bbox=None, columns=None, where=None, store_root=None):
+	"""
+	Read a layer through its geometry store, with the arguments and results of layercache.ReadLayer.
+	Only the selected rows and columns are decoded.
+	"""
+	store = GetGeometryStore(path, store_root=store_root)
+	if bbox is None:
+		return store.frame(store.select(where=where) if where else None, columns)
+
+	rows = store.select(bbox=bbox)
+	if layercache.pyogrio is not None and (where or columns is not None):
+		return store.frame(rows[np.isin(rows, store.select(where=where))] if where else rows, columns)
+	### a plain bbox read numbers the features it returns from 0, as gpd.read_file does
+	keep = np.isin(rows, store.select(where=where)) if where else np.ones(len(rows), dtype=bool)
+	gdf = store.frame(rows[keep], columns)
+	gdf.index = pd.Index(np.flatnonzero(keep)) if where else pd.RangeIndex(len(gdf))
+	return gdf
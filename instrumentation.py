@@ -0,0 +1,237 @@
+"""
+Timing, row counts, bytes read and peak memory of the loaders and hot paths, kept in an in-process
+registry instead of printed.
+
+Functions are wrapped with @Instrumented, or a block of code with `with Instrument(name) as call:`;
+inside a wrapped function CurrentCall() gives the record of the call in progress.
+Every call adds its wall time, the rows of its input and output frames, the bytes it read from
+disk and, when trace_memory is set, the peak memory it allocated to the totals of its name. Nothing
+is printed unless `verbose` is set; the registry is read with GetInstrumentation, or exported with
+ExportJSON or, for a Prometheus scrape endpoint, ExportPrometheus.
+
+usage:
+	instrumentation.trace_memory = True                  # optional: tracemalloc is slow
+	gdf = InitializeGeoDataFrames(path, ward_file)
+	print(GetInstrumentation())                          # one row per function
+	return Response(ExportPrometheus(), mimetype="text/plain")
+"""
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from filesig import SourceSignature
+
+### record calls; when off the wrappers only call through
+instrumentation_enabled = True
+
+### measure the peak memory of each outermost instrumented call with tracemalloc, which slows
+### everything it traces. tracemalloc is process-wide: while calls run at the same time in several
+### threads, each one's peak_bytes counts what every thread allocated, so it is an upper bound
+trace_memory = False
+
+### print a line for every call, as the loaders used to
+verbose = False
+
+### the prefix of the metric names ExportPrometheus writes
+metric_prefix = "common"
+
+instrumentation_columns = [
+	"calls", "seconds", "max_seconds", "rows_in", "rows_out", "bytes_read", "peak_bytes", "errors",
+]
+
+_registry = {}
+_registry_lock = threading.Lock()
+_local = threading.local()
+
+### the calls tracing memory in any thread; the first starts tracemalloc and the last stops it
+_tracing_lock = threading.Lock()
+_tracing_calls = 0
+_tracing_started = False
+
+
+def FileBytes(path):
+	"""The bytes of a data file and, for a shapefile, of its sidecar files; 0 if there is none."""
+	return sum(size for _, _, size in SourceSignature(path)) if path is not None and Path(path).exists() else 0
+
+
+def _Rows(value):
+	"""The rows of a frame or array, or of the first frame in a list or tuple; None for anything else."""
+	if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+		return len(value)
+	if isinstance(value, (list, tuple)):
+		for item in value:
+			if isinstance(item, (pd.DataFrame, pd.Series)):
+				return len(item)
+	return None
+
+
+class Instrument:
+	"""
+	Records one call of `name`. Set rows_in, rows_out and bytes_read on it inside the block; rows
+	left as None are not counted.
+	"""
+
+	def __init__(self, name):
+		self.name = name
+		self.rows_in = None
+		self.rows_out = None
+		self.bytes_read = 0
+		self.seconds = None
+		self.peak_bytes = None
+
+	def __enter__(self):
+		if not instrumentation_enabled:
+			return self
+		if not hasattr(_local, "calls"):
+			_local.calls = []
+		depth = len(_local.calls)
+		_local.calls.append(self)
+		### only the outermost call of a thread traces memory; a nested reset_peak would lose the outer peak
+		self._tracing = trace_memory and depth == 0
+		if self._tracing:
+			_StartTracing(self)
+		self._start = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		### a call that was entered is always finished, even if instrumentation was turned off since
+		if not hasattr(self, "_start"):
+			return False
+		self.seconds = time.perf_counter() - self._start
+		_local.calls.pop()
+		if self._tracing:
+			_StopTracing(self)
+		_Record(self, exc_type is not None)
+		if verbose:
+			rows = "" if self.rows_out is None else f", {self.rows_out:,} rows"
+			print(f"{self.name}: {self.seconds:.2f} seconds{rows}")
+		return False
+
+
+def _StartTracing(call):
+	global _tracing_calls, _tracing_started
+	with _tracing_lock:
+		if _tracing_calls == 0:
+			_tracing_started = not tracemalloc.is_tracing()
+			if _tracing_started:
+				tracemalloc.start()
+			### only with no other call tracing, or the peak of that call would be lost
+			tracemalloc.reset_peak()
+		_tracing_calls += 1
+		call._base = tracemalloc.get_traced_memory()[0]
+
+
+def _StopTracing(call):
+	global _tracing_calls, _tracing_started
+	with _tracing_lock:
+		call.peak_bytes = max(tracemalloc.get_traced_memory()[1] - call._base, 0)
+		_tracing_calls -= 1
+		if _tracing_calls == 0 and _tracing_started:
+			tracemalloc.stop()
+			_tracing_started = False
+
+
+def CurrentCall():
+	"""
+	Return the Instrument of the innermost instrumented call running in this thread, so the function
+	can set its rows_out or add to its bytes_read; outside any call, a throwaway one.
+	"""
+	calls = getattr(_local, "calls", None)
+	return calls[-1] if calls else Instrument(None)
+
+
+def _Record(call, failed):
+	with _registry_lock:
+		entry = _registry.get(call.name)
+		if entry is None:
+			entry = _registry[call.name] = dict.fromkeys(instrumentation_columns, 0)
+		entry["calls"] += 1
+		entry["seconds"] += call.seconds
+		entry["max_seconds"] = max(entry["max_seconds"], call.seconds)
+		entry["rows_in"] += call.rows_in or 0
+		entry["rows_out"] += call.rows_out or 0
+		entry["bytes_read"] += call.bytes_read or 0
+		entry["peak_bytes"] = max(entry["peak_bytes"], call.peak_bytes or 0)
+		entry["errors"] += int(failed)
+
+
+def Instrumented(func=None, name=None):
+	"""
+	Decorate a function so every call is recorded under `name` (by default module.function). The
+	rows of the first argument and of the result are counted when they are frames or arrays, or
+	lists holding a frame; a function returning something else can set CurrentCall().rows_out.
+	"""
+	if func is None:
+		return functools.partial(Instrumented, name=name)
+	call_name = name or f"{func.__module__}.{func.__name__}"
+
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		if not instrumentation_enabled:
+			return func(*args, **kwargs)
+		with Instrument(call_name) as call:
+			call.rows_in = _Rows(args[0]) if args else None
+			result = func(*args, **kwargs)
+			### unless the function set it itself
+			if call.rows_out is None:
+				call.rows_out = _Rows(result)
+		return result
+
+	return wrapper
+
+
+def GetInstrumentation():
+	"""
+	Return the registry as a DataFrame with one row per instrumented name and the columns of
+	instrumentation_columns, plus 'mean_seconds'.
+	"""
+	with _registry_lock:
+		df = pd.DataFrame.from_dict({name: dict(entry) for name, entry in _registry.items()}, orient="index")
+	df = df.reindex(columns=instrumentation_columns).sort_index()
+	df["mean_seconds"] = df["seconds"] / df["calls"]
+	return df
+
+
+def ResetInstrumentation():
+	"""Empty the registry."""
+	with _registry_lock:
+		_registry.clear()
+
+
+def ExportJSON():
+	"""Return the registry as JSON: {name: {column: value}}."""
+	with _registry_lock:
+		return json.dumps({name: dict(entry) for name, entry in sorted(_registry.items())}, indent=1)
+
+
+_prometheus_metrics = [
+	("calls", "calls_total", "counter", "Calls of the function."),
+	("errors", "call_errors_total", "counter", "Calls of the function that raised."),
+	("seconds", "call_seconds_total", "counter", "Wall time spent in the function."),
+	("max_seconds", "call_seconds_max", "gauge", "The longest call of the function."),
+	("rows_in", "rows_in_total", "counter", "Rows of the frames passed to the function."),
+	("rows_out", "rows_out_total", "counter", "Rows of the frames the function returned."),
+	("bytes_read", "bytes_read_total", "counter", "Bytes of the files the function read."),
+	("peak_bytes", "peak_memory_bytes", "gauge", "The most memory one call allocated, when traced."),
+]
+
+
+def ExportPrometheus():
+	"""Return the registry in the Prometheus text exposition format, one series per function."""
+	with _registry_lock:
+		entries = sorted((name, dict(entry)) for name, entry in _registry.items())
+	lines = []
+	for column, metric, kind, description in _prometheus_metrics:
+		metric = f"{metric_prefix}_{metric}"
+		lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+		for name, entry in entries:
+			label = name.replace("\\", "\\\\").replace('"', '\\"')
+			value = entry[column]
+			lines.append(f'{metric}{{function="{label}"}} {value if isinstance(value, int) else repr(float(value))}')
+	return "\n".join(lines) + "\n"
@@ -0,0 +1,306 @@
+"""
+A process-wide cache of parsed boundary and ward layers, so that a long-running map server
+parses each shapefile once per process instead of once per request.
+
+usage:
+	from layercache import ReadLayer
+	gdf = ReadLayer(ward_bounds_file)                     # in place of gpd.read_file(ward_bounds_file)
+	gdf = ReadLayer(assembly_districts_file, bbox=bounds) # bbox reads are cached separately
+	gdf = ReadLayer(ward_bounds_file, where={"CNTY_NAME": "Milwaukee"}, columns=["GEOID", "LABEL"])
+
+Attribute filters (`where`) and column subsets are pushed down to the reader when pyogrio is
+installed, so only the matching features and fields are decoded. Without pyogrio the whole layer
+is read with fiona and filtered afterwards; the result is the same either way.
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from filesig import SourceSignature, shapefile_sidecars
+
+try:
+	import pyogrio
+except ImportError:
+	pyogrio = None
+
+### a directory of geometry stores (see geometrystore); when set, ReadLayer reads through the
+### memory-mapped stores, shared by every worker process, instead of keeping layers in this process
+geometry_store_dir = None
+
+### when set, every layer read through the cache has its invalid geometries repaired (see geometryrepair);
+### the cache holds the repaired layer, so a layer is repaired once per read, not once per request
+repair_geometries = False
+
+
+def _BboxKey(bbox):
+	"""Reduce a bbox argument (tuple, geometry, GeoSeries or GeoDataFrame) to a hashable key."""
+	if bbox is None:
+		return None
+	if isinstance(bbox, (gpd.GeoDataFrame, gpd.GeoSeries)):
+		crs = bbox.crs.to_string() if bbox.crs is not None else None
+		return (tuple(bbox.total_bounds), crs)
+	if isinstance(bbox, shapely.Geometry):
+		return tuple(bbox.bounds)
+	return tuple(bbox)
+
+
+def _LayerBytes(gdf):
+	"""Estimate the memory held by a GeoDataFrame: attribute columns plus 16 bytes per coordinate."""
+	attrs = gdf.drop(columns=gdf.geometry.name).memory_usage(deep=True).sum()
+	coords = shapely.get_num_coordinates(gdf.geometry.values).sum()
+	return int(attrs + 16 * coords)
+
+
+def _WhereKey(where):
+	"""Reduce a where dict of {column: value or list of values} to a hashable key."""
+	if not where:
+		return None
+	return tuple(sorted((col, _WhereValues(values)) for col, values in where.items()))
+
+
+def _WhereValues(values):
+	if isinstance(values, (list, tuple, set, pd.Series, pd.Index)):
+		return tuple(values)
+	return (values,)
+
+
+def _SQLLiteral(value):
+	if isinstance(value, np.generic):
+		### a numpy scalar's repr is np.int64(5) under numpy 2
+		value = value.item()
+	if isinstance(value, str):
+		return "'" + value.replace("'", "''") + "'"
+	return repr(value)
+
+
+def WhereToSQL(where):
+	"""
+	Translate a where dict of {column: value or list of values} into an OGR SQL WHERE clause.
+
+	Example:
+		WhereToSQL({"CNTY_NAME": "Milwaukee", "MCD_NAME": ["Milwaukee", "Wauwatosa"]})
+		gives  "CNTY_NAME" = 'Milwaukee' AND "MCD_NAME" IN ('Milwaukee', 'Wauwatosa')
+
+	An empty list of values matches no rows.
+	"""
+	clauses = []
+	for col, values in where.items():
+		values = _WhereValues(values)
+		if len(values) == 0:
+			### IN () is not valid SQL
+			clauses.append("1=0")
+		elif len(values) == 1:
+			clauses.append(f'"{col}" = {_SQLLiteral(values[0])}')
+		else:
+			clauses.append(f'"{col}" IN ({", ".join(_SQLLiteral(v) for v in values)})')
+	return " AND ".join(clauses)
+
+
+def _WhereMask(gdf, where):
+	mask = pd.Series(True, index=gdf.index)
+	for col, values in where.items():
+		mask &= gdf[col].isin(_WhereValues(values))
+	return mask
+
+
+def _ReadLayer(path, bbox=None, columns=None, where=None):
+	if pyogrio is not None and (where or columns is not None):
+		### push the filter and the column list down to OGR; keep the feature ids as the index
+		### so the rows are labelled exactly as they would be in a full read
+		read_columns = None
+		if columns is not None:
+			read_columns = [c for c in dict.fromkeys([*columns, *(where or {})]) if c != "geometry"]
+		gdf = gpd.read_file(
+			path, engine="pyogrio", bbox=bbox, columns=read_columns, fid_as_index=True,
+			where=WhereToSQL(where) if where else None,
+		)
+		gdf.index.name = None
+	else:
+		gdf = gpd.read_file(path, bbox=bbox)
+	if where:
+		### OGR compares strings case-insensitively, pandas does not
+		gdf = gdf.loc[_WhereMask(gdf, where)]
+	if columns is not None:
+		gdf = gdf[[c for c in columns if c != gdf.geometry.name] + [gdf.geometry.name]]
+	return gdf
+
+
+def _ReadLayerArgs(path, args, repair):
+	gdf = _ReadLayer(path, **args)
+	if repair:
+		from geometryrepair import RepairLayer
+
+		gdf, _ = RepairLayer(gdf, source=path)
+	return gdf
+
+
+class LayerCache:
+	"""
+	A size-bounded, least-recently-used cache of GeoDataFrames read from disk.
+
+	Entries are keyed by the resolved path, the bbox, the attribute filter and the column subset of the read. Each entry
+	remembers the SourceSignature of the file it came from; if the file has changed since, the
+	entry is re-read in place. When the cache holds more than `max_layers` entries or more than
+	`max_bytes` of estimated memory, the least recently used entries are dropped.
+
+	Callers get a copy of the cached frame, so renaming columns or reprojecting in place
+	never leaks into the next request.
+	"""
+
+	def __init__(self, max_layers=32, max_bytes=2 * 1024**3):
+		self.max_layers = max_layers
+		self.max_bytes = max_bytes
+		self._layers = OrderedDict()
+		self._lock = threading.RLock()
+		### paths being reloaded in the background; reads keep getting the old version until the swap
+		self._reloading = set()
+		### set while a LayerWatcher keeps the cache up to date; reads then skip the signature check
+		self.watched = False
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def read(self, path, bbox=None, columns=None, where=None):
+		"""
+		Return the layer at `path`, read with the given bbox, attribute filter and column subset, from the cache if possible.
+
+		Parameters:
+		- path (str or Path): The data file.
+		- bbox: Anything gpd.read_file accepts as a bbox, or None for the whole layer.
+		- columns (list): The attribute columns to keep, or None for all of them.
+		- where (dict): {column: value or list of values}; only features matching every entry are kept.
+
+		Returns:
+		- gdf (GeoDataFrame): A copy of the cached layer.
+		"""
+		key = (
+			str(Path(path).resolve()),
+			_BboxKey(bbox),
+			_WhereKey(where),
+			tuple(columns) if columns is not None else None,
+			repair_geometries,
+		)
+		with self._lock:
+			entry = self._layers.get(key)
+		signature = entry[0] if entry is not None and self.watched else SourceSignature(path)
+		with self._lock:
+			entry = self._layers.get(key)
+			if entry is not None and (entry[0] == signature or key[0] in self._reloading):
+				self._layers.move_to_end(key)
+				self.hits += 1
+				return entry[1].copy()
+			self.misses += 1
+
+		args = {"bbox": bbox, "columns": columns, "where": where}
+		gdf = _ReadLayerArgs(path, args, key[-1])
+
+		with self._lock:
+			self._layers[key] = (signature, gdf, _LayerBytes(gdf), args)
+			self._layers.move_to_end(key)
+			self._Evict()
+		return gdf.copy()
+
+	def sources(self):
+		"""Return {resolved path: the SourceSignature its cached layers were read at}."""
+		with self._lock:
+			return {key[0]: entry[0] for key, entry in self._layers.items()}
+
+	def reload(self, path, prepare=None):
+		"""
+		Re-read every cached read of `path` and swap the new layers in at once. Until the swap, reads
+		of the path keep getting the layers cached before.
+
+		Parameters:
+		- path (str or Path): The data file.
+		- prepare: Called as prepare(old, new) with lists of the old and new layers before the swap,
+		  to build anything derived from the new layers while the old ones are still served.
+
+		Returns:
+		- list: (old, new) GeoDataFrame pairs, one per cached read.
+		"""
+		resolved = str(Path(path).resolve())
+		with self._lock:
+			if resolved in self._reloading:
+				return []
+			self._reloading.add(resolved)
+			entries = [(key, entry) for key, entry in self._layers.items() if key[0] == resolved]
+		try:
+			signature = SourceSignature(path)
+			new = [_ReadLayerArgs(path, entry[3], key[-1]) for key, entry in entries]
+			if prepare is not None:
+				prepare([entry[1] for _, entry in entries], new)
+			with self._lock:
+				for (key, entry), gdf in zip(entries, new):
+					if key in self._layers:
+						self._layers[key] = (signature, gdf, _LayerBytes(gdf), entry[3])
+				self._Evict()
+		finally:
+			with self._lock:
+				self._reloading.discard(resolved)
+		return [(entry[1], gdf) for (_, entry), gdf in zip(entries, new)]
+
+	def retag(self, path, signature):
+		"""Record a new SourceSignature for the cached reads of `path`, for a file touched but not changed."""
+		resolved = str(Path(path).resolve())
+		with self._lock:
+			for key, entry in self._layers.items():
+				if key[0] == resolved:
+					self._layers[key] = (signature, *entry[1:])
+
+	def _Evict(self):
+		while len(self._layers) > 1 and (
+			len(self._layers) > self.max_layers or self.nbytes() > self.max_bytes
+		):
+			self._layers.popitem(last=False)
+			self.evictions += 1
+
+	def nbytes(self):
+		"""The estimated memory held by all cached layers."""
+		with self._lock:
+			return sum(entry[2] for entry in self._layers.values())
+
+	def invalidate(self, path=None):
+		"""Drop every cached read of `path`, or everything if path is None."""
+		with self._lock:
+			if path is None:
+				self._layers.clear()
+				return
+			resolved = str(Path(path).resolve())
+			for key in [k for k in self._layers if k[0] == resolved]:
+				del self._layers[key]
+
+	def stats(self):
+		"""Return the hit, miss and eviction counters along with the current size of the cache."""
+		with self._lock:
+			return {
+				"hits": self.hits,
+				"misses": self.misses,
+				"evictions": self.evictions,
+				"layers": len(self._layers),
+				"bytes": self.nbytes(),
+			}
+
+
+### The cache shared by everything in this process
+layer_cache = LayerCache()
+
+
+def ReadLayer(path, bbox=None, columns=None, where=None):
+	"""
+	A drop-in replacement for gpd.read_file(path, bbox=bbox) that goes through the process-wide layer cache,
+	or through the shared geometry stores when geometry_store_dir is set.
+	"""
+	if geometry_store_dir is not None:
+		from geometrystore import ReadStoredLayer
+
+		return ReadStoredLayer(path, bbox=bbox, columns=columns, where=where, store_root=geometry_store_dir)
+	return layer_cache.read(path, bbox=bbox, columns=columns, where=where)
+
+
+def GetLayerCacheStats():
+	return layer_cache.stats()
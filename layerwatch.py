@@ -0,0 +1,223 @@
+"""
+Hot reloading of the boundary and ward files behind the layer cache.
+
+The layer cache checks a file's signature on every read and re-reads a changed file inside the
+request that finds it. LayerWatcher moves that work off the request path: a background thread
+looks at every file the cache has loaded, and when one changes it re-reads the cached layers of
+that file, rebuilds what was derived from them (centroids, LOD pyramids, MCD outlines), and only
+then swaps the new layers in. Requests arriving in the meantime are served the old layers, and
+while the watcher runs the cache no longer stats the file on every read.
+
+A change is noticed from the file's SourceSignature (mtime and size), which costs a stat per file.
+A file whose signature changed but whose content hash did not (touched, or copied over with the
+same data) is not reloaded. With watchdog installed, file system events wake the watcher as soon
+as a file is written; without it the files are polled every `watch_interval` seconds.
+
+usage:
+	watcher = StartLayerWatcher()          # once, when the map server starts
+	...
+	watcher.stop()
+"""
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+import gdftools
+import lodpyramid
+import outlinecache
+from layercache import SourceSignature, layer_cache
+from sidecarcache import FileHash
+
+try:
+	from watchdog.events import FileSystemEventHandler
+	from watchdog.observers import Observer
+except ImportError:
+	Observer = None
+
+### seconds between checks of the watched files
+watch_interval = 5.0
+
+
+def _Geoms(gdf):
+	return np.asarray(gdf.geometry.values)
+
+
+def _DerivedKeys(gdf):
+	"""The keys under which the derived caches hold artifacts built from the whole of a layer."""
+	if gdf.crs is None or not len(gdf):
+		return {}
+	fingerprint = gdftools._LayerFingerprint(_Geoms(gdf), gdf.crs)
+	world_gdf = lodpyramid._ToWorldCrs(gdf)
+	world_fingerprint = gdftools._LayerFingerprint(_Geoms(world_gdf), world_gdf.crs)
+	with gdftools._centroid_cache_lock:
+		centroids = [key for key in gdftools._centroid_cache if key == fingerprint]
+	with lodpyramid._pyramid_cache_lock:
+		pyramids = [key for key in lodpyramid._pyramid_cache if key[0] == world_fingerprint]
+	with outlinecache._outline_cache_lock:
+		outlines = [key for key in outlinecache._outline_cache if key[0] == fingerprint[0] and key[1].startswith(fingerprint[1] + "_")]
+	return {"centroids": centroids, "pyramids": pyramids, "outlines": outlines}
+
+
+def RebuildDerived(old, new):
+	"""
+	Build, for each new layer, the centroids, LOD pyramids and MCD outlines that were built for the
+	old layer it replaces, so the first request after the swap finds them ready.
+
+	Returns:
+	- list: The derived cache keys of the old layers, for DropDerived once the swap is done.
+	"""
+	stale = []
+	for old_gdf, new_gdf in zip(old, new):
+		keys = _DerivedKeys(old_gdf)
+		if not keys:
+			continue
+		if keys["centroids"]:
+			gdftools.ComputeCentroidLatLon(_Geoms(new_gdf), new_gdf.crs)
+		for _, levels in keys["pyramids"]:
+			lodpyramid.GetLODPyramid(new_gdf, levels)
+		if keys["outlines"] and {"CNTY_NAME", "MCD_NAME"} <= set(new_gdf.columns):
+			outlinecache.GetOutlineCache(new_gdf)
+		### a file rewritten with the same geometry keeps its artifacts
+		new_keys = _DerivedKeys(new_gdf)
+		stale.append({name: [key for key in old_keys if key not in new_keys.get(name, [])] for name, old_keys in keys.items()})
+	return stale
+
+
+def DropDerived(stale):
+	"""Drop the derived artifacts of replaced layers from their caches."""
+	for keys in stale:
+		for cache, lock, name in [
+			(gdftools._centroid_cache, gdftools._centroid_cache_lock, "centroids"),
+			(lodpyramid._pyramid_cache, lodpyramid._pyramid_cache_lock, "pyramids"),
+			(outlinecache._outline_cache, outlinecache._outline_cache_lock, "outlines"),
+		]:
+			with lock:
+				for key in keys[name]:
+					cache.pop(key, None)
+
+
+class LayerWatcher:
+	"""
+	Watches the files a LayerCache has loaded and reloads the layers of any that change.
+	"""
+
+	def __init__(self, cache=layer_cache, interval=watch_interval, on_reload=None):
+		"""
+		Parameters:
+		- cache (LayerCache): The cache to watch.
+		- interval (float): Seconds between checks.
+		- on_reload: Called as on_reload(path, pairs) after a file's layers are swapped, with the
+		  (old, new) GeoDataFrame pairs.
+		"""
+		self.cache = cache
+		self.interval = interval
+		self.on_reload = on_reload
+		self.reloads = 0
+		self._hashes = {}
+		self._wake = threading.Event()
+		self._stop = threading.Event()
+		self._thread = None
+		self._observer = None
+		self._watched_dirs = set()
+
+	def check(self):
+		"""
+		Check every file the cache has loaded and reload the layers of those whose content changed.
+
+		Returns:
+		- list: The paths reloaded.
+		"""
+		reloaded = []
+		for path, cached in self.cache.sources().items():
+			self._Watch(path)
+			signature = SourceSignature(path)
+			known = self._hashes.get(path)
+			if known is None:
+				### first sight of the file: remember the content the cached layers were read from, if it is still there
+				known = (cached, FileHash(path) if signature == cached else None)
+				self._hashes[path] = known
+			if signature == cached or not Path(path).exists():
+				continue
+			new_hash = FileHash(path)
+			if new_hash == known[1]:
+				self._hashes[path] = (signature, new_hash)
+				self.cache.retag(path, signature)
+				continue
+			stale = []
+
+			def prepare(old, new):
+				stale.extend(RebuildDerived(old, new))
+
+			start_time = time.time()
+			pairs = self.cache.reload(path, prepare)
+			DropDerived(stale)
+			### only now, so a file caught half written is reloaded again once it is complete
+			self._hashes[path] = (signature, new_hash)
+			self.reloads += 1
+			reloaded.append(path)
+			print(f"Reloaded {len(pairs)} cached layers of", path, f"in {time.time() - start_time:.2f} s")
+			if self.on_reload is not None:
+				self.on_reload(path, pairs)
+		return reloaded
+
+	def _Watch(self, path):
+		if self._observer is None:
+			return
+		directory = str(Path(path).parent)
+		if directory not in self._watched_dirs:
+			self._watched_dirs.add(directory)
+			self._observer.schedule(_WakeHandler(self._wake), directory, recursive=False)
+
+	def _Run(self):
+		while not self._stop.is_set():
+			try:
+				self.check()
+			except Exception as e:
+				print("Layer watcher check failed --", e)
+			self._wake.wait(self.interval)
+			self._wake.clear()
+
+	def start(self):
+		"""Start watching on a daemon thread."""
+		if self._thread is not None:
+			return self
+		if Observer is not None:
+			self._observer = Observer()
+			self._observer.daemon = True
+			self._observer.start()
+		self.cache.watched = True
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._Run, name="LayerWatcher", daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		"""Stop watching and wait for a check in progress to finish."""
+		self._stop.set()
+		self._wake.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+		self.cache.watched = False
+		if self._observer is not None:
+			self._observer.stop()
+			self._observer.join()
+			self._observer = None
+			self._watched_dirs = set()
+
+
+if Observer is not None:
+
+	class _WakeHandler(FileSystemEventHandler):
+		def __init__(self, wake):
+			self.wake = wake
+
+		def on_any_event(self, event):
+			self.wake.set()
+
+
+def StartLayerWatcher(interval=watch_interval, on_reload=None):
+	"""Start a LayerWatcher over the process-wide layer cache, and return it."""
+	return LayerWatcher(layer_cache, interval, on_reload).start()
@@ -0,0 +1,175 @@
+"""
+Zoom-level simplification pyramid for the GeoJSON gdftools hands to plotlytools.GetChoroplethMapbox.
+
+Full survey precision makes a statewide ward layer many megabytes per page load, most of it vertices
+closer together than a screen pixel. For each zoom level, the geometry is simplified to half a
+pixel, with the topology of each polygon preserved, and snapped to a coordinate grid of an eighth
+of a pixel. Snapping keeps every polygon valid and lets the coordinates be written with only as many
+decimals as the zoom can show. The simplified geometries are cached per layer, so a page changing
+zoom only pays for encoding.
+
+usage:
+	[gdf, _] = GetWardsInState(ward_bounds_file)
+	gjsn = GetGJSNForZoom(gdf[common_cols], zoom=8)     # in place of the full-precision gjsn
+	print(ReportLODPyramid(gdf[common_cols]))            # payload size and encode time per level
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from gdftools import ConvertGDFtoGJSN, StreamGDFtoGJSN, _FrameFingerprint, world_crs, world_epsg
+
+### the zoom levels precomputed for each layer; requests in between use the next finer level
+zoom_levels = (6, 8, 10, 12, 14)
+
+### web map tiles are 256 pixels across the 360 degrees of longitude at zoom 0
+tile_size = 256
+
+
+def PixelSize(zoom):
+	"""The width of a screen pixel at `zoom`, in degrees of longitude."""
+	return 360.0 / (tile_size * 2**zoom)
+
+
+def ZoomTolerance(zoom):
+	"""The simplification tolerance for `zoom`, in degrees: half a pixel."""
+	return PixelSize(zoom) / 2
+
+
+def ZoomPrecision(zoom):
+	"""The decimal places kept in the coordinates at `zoom`: enough for an eighth of a pixel."""
+	return max(0, math.ceil(-math.log10(PixelSize(zoom) / 8)))
+
+
+class LODPyramid:
+	"""
+	The simplified geometries of one layer, in 'epsg:4326', at each of `levels`.
+
+	Levels are built on first use. `geometry(zoom)` returns the geometry for the smallest level at
+	or above `zoom`; zooms past the last level, or a zoom of None, get the full geometry.
+	"""
+
+	def __init__(self, geoms, levels=zoom_levels):
+		self.full = np.asarray(geoms)
+		self.levels = tuple(sorted(levels))
+		self._geoms = {}
+		self._lock = threading.Lock()
+
+	def level_for(self, zoom):
+		"""The precomputed level serving `zoom`, or None for the full geometry."""
+		if zoom is None:
+			return None
+		for level in self.levels:
+			if level >= zoom:
+				return level
+		return None
+
+	def precision_for(self, zoom):
+		"""The decimal places to write the coordinates with at `zoom`."""
+		level = self.level_for(zoom)
+		return ZoomPrecision(level) if level is not None else None
+
+	def geometry(self, zoom):
+		"""Return the geometry array for `zoom`."""
+		level = self.level_for(zoom)
+		if level is None:
+			return self.full
+		with self._lock:
+			if level not in self._geoms:
+				simplified = shapely.simplify(self.full, ZoomTolerance(level), preserve_topology=True)
+				self._geoms[level] = shapely.set_precision(simplified, 10.0 ** -ZoomPrecision(level))
+			return self._geoms[level]
+
+
+_pyramid_cache = OrderedDict()
+_pyramid_cache_lock = threading.Lock()
+pyramid_cache_size = 16
+
+
+def _ToWorldCrs(gdf):
+	if gdf.crs is not None and gdf.crs.to_epsg() != world_epsg:
+		return gdf.to_crs(world_crs)
+	return gdf
+
+
+def GetLODPyramid(gdf, levels=zoom_levels):
+	"""
+	Return the LODPyramid for the geometry of `gdf`, built once per layer.
+	"""
+	key = (_FrameFingerprint(gdf), tuple(levels))
+	with _pyramid_cache_lock:
+		if key in _pyramid_cache:
+			_pyramid_cache.move_to_end(key)
+			return _pyramid_cache[key]
+
+	pyramid = LODPyramid(np.asarray(_ToWorldCrs(gdf).geometry.values), levels)
+
+	with _pyramid_cache_lock:
+		_pyramid_cache[key] = pyramid
+		while len(_pyramid_cache) > pyramid_cache_size:
+			_pyramid_cache.popitem(last=False)
+	return pyramid
+
+
+def GetGDFForZoom(gdf, zoom, levels=zoom_levels):
+	"""
+	Return a copy of `gdf` in 'epsg:4326' with its geometry simplified for `zoom`,
+	along with the decimal places to encode it with.
+	"""
+	pyramid = GetLODPyramid(gdf, levels)
+	gdf = _ToWorldCrs(gdf).copy()
+	gdf[gdf.geometry.name] = pyramid.geometry(zoom)
+	return gdf, pyramid.precision_for(zoom) or 6
+
+
+def GetGJSNForZoom(gdf, zoom, levels=zoom_levels):
+	"""
+	Convert `gdf` to a geojson FeatureCollection detailed enough for a map at `zoom`.
+	A zoom of None gives the same collection as ConvertGDFtoGJSN.
+	"""
+	gdf, precision = GetGDFForZoom(gdf, zoom, levels)
+	return ConvertGDFtoGJSN(gdf, precision=precision)
+
+
+def StreamGJSNForZoom(gdf, zoom, chunk_size=1000, levels=zoom_levels):
+	"""
+	Like GetGJSNForZoom, but yield the encoded collection as UTF-8 bytes, as StreamGDFtoGJSN does.
+	"""
+	gdf, precision = GetGDFForZoom(gdf, zoom, levels)
+	return StreamGDFtoGJSN(gdf, chunk_size=chunk_size, precision=precision)
+
+
+def ReportLODPyramid(gdf, levels=zoom_levels):
+	"""
+	Report, for each level of the pyramid and for the full geometry, the simplification tolerance,
+	the coordinate precision, the number of vertices, the size of the GeoJSON payload and the time
+	taken to build and to encode it.
+
+	Returns:
+	- DataFrame: One row per level, the full geometry last.
+	"""
+	rows = []
+	for zoom in [*sorted(levels), None]:
+		start = time.perf_counter()
+		level_gdf, precision = GetGDFForZoom(gdf, zoom, levels)
+		build_seconds = time.perf_counter() - start
+		start = time.perf_counter()
+		payload = b"".join(StreamGDFtoGJSN(level_gdf, precision=precision))
+		encode_seconds = time.perf_counter() - start
+		rows.append({
+			"zoom": zoom if zoom is not None else "full",
+			"tolerance": ZoomTolerance(zoom) if zoom is not None else 0.0,
+			"precision": precision,
+			"vertices": int(shapely.get_num_coordinates(np.asarray(level_gdf.geometry.values)).sum()),
+			"bytes": len(payload),
+			"build_seconds": build_seconds,
+			"encode_seconds": encode_seconds,
+		})
+	report = pd.DataFrame(rows)
+	report["ratio"] = report["bytes"].iloc[-1] / report["bytes"]
+	return report
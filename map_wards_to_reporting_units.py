@@ -6,6 +6,7 @@ sys.path.append('../../Common')
 
 from edatools import InitializeDataFrames, ColumnMove
 from setoperations import SetIntersection, SetDifference
+from instrumentation import CurrentCall, Instrumented
 
 common_epsg = 4326  #3070 is the Wisconsin Mercator Projection
 common_crs = f'EPSG:{common_epsg}'
@@ -16,6 +17,41 @@ wisconsin_crs = f'EPSG:{wisconsin_epsg}'
 from ward_mappings import ward_mappings
 keys = ward_mappings.keys()
 
+### how many unmatched names LookupFips lists when it reports the rows it could not match
+max_unmatched_shown = 20
+
+def LookupFips(rows, geocode_keys, geoids, default, label):
+    """
+    Look up the GEOID of the geocode row matching each row, as one hashed join on the key columns
+    instead of a boolean mask over every row per geocode row. Where several geocode rows share a
+    key the last one wins, as it did in the loops this replaces; geocode rows with a missing key
+    never match. The keys are compared as strings, so a County_Code read as a number on one side
+    simply fails to match a zero-padded one, as it did with ==, rather than failing the join.
+    The rows that match nothing are reported together, once.
+
+    Args:
+        rows: DataFrame of the key columns of the rows to look up.
+        geocode_keys: DataFrame of the same columns for the geocode rows.
+        geoids: The GEOIDs of the geocode rows, in the order of geocode_keys.
+        default: The value given to rows that match no geocode row.
+        label: What is being looked up, for the report of unmatched rows.
+
+    Returns:
+        Series of GEOIDs, indexed like rows.
+    """
+    on = list(rows.columns)
+    keys = geocode_keys[on]
+    lookup = keys.astype(str).where(keys.notna()).assign(_fips = np.asarray(geoids, dtype=object)).dropna(subset=on)
+    lookup = lookup.drop_duplicates(subset=on, keep='last')
+    fips = rows.astype(str).where(rows.notna()).merge(lookup, on=on, how='left')['_fips'].to_numpy(dtype=object)
+    matched = pd.notna(fips)
+    if not matched.all():
+        missing = [' / '.join(map(str, row)) for row in rows.loc[~matched].drop_duplicates().itertuples(index=False)]
+        shown = ', '.join(missing[:max_unmatched_shown]) + (', ...' if len(missing) > max_unmatched_shown else '')
+        print(f'{(~matched).sum():,} of {len(rows):,} rows matched no {label} geocode ({len(missing):,} distinct):', shown)
+    return pd.Series(np.where(matched, fips, default), index=rows.index, dtype=object)
+
+@Instrumented
 def InitializeWECDataFrames(path, file, geocodes, label_row, body_row,   presidential, remote_file, kwargs):
     df = InitializeDataFrames(path, file,  remote_file, kwargs = kwargs)
     label = df.iloc[label_row,0].title()
@@ -45,12 +81,10 @@ def InitializeWECDataFrames(path, file, geocodes, label_row, body_row,   preside
     df['CNTY_NAME'] = df['CNTY_NAME'].ffill().str.title()
     df['CNTY_NAME'] = df['CNTY_NAME'].apply(lambda x: f"{x.strip()} County")
     df['CNTY_NAME'] = df['CNTY_NAME'].replace('Fond Du Lac County', 'Fond du Lac County')
-    df['CNTY_FIPS'] = ''
-    df = ColumnMove(df, 'CNTY_FIPS', 1)
     df.reset_index(drop=True, inplace=True)
-
-    for row in geocodes.itertuples():
-        df.loc[df['CNTY_NAME'] == row.Area_Name,'CNTY_FIPS'] = row.GEOID
+    df['CNTY_FIPS'] = LookupFips(df[['CNTY_NAME']], geocodes[['Area_Name']].rename(columns={'Area_Name': 'CNTY_NAME'}),
+                                 geocodes['GEOID'], '', 'county')
+    df = ColumnMove(df, 'CNTY_FIPS', 1)
 
     df['ReportingUnit'] = df['ReportingUnit'].str.title()
     df['ReportingUnit'] = df['ReportingUnit'].str.replace('Of', 'of')
@@ -60,7 +94,6 @@ def InitializeWECDataFrames(path, file, geocodes, label_row, body_row,   preside
     df['data'] = df['data'].astype(str)
     df['data'] = df['data'].fillna('None')
     df['MCD_NAME'] = df['ReportingUnit'].map(ConvertRow)
-    df['MCD_FIPS'] = '0'
     df['EXPANDEDGEOID'] = '0'
 
     ### Put a county code on each MCD so we can distinguish similarly named MCDs in different counties
@@ -69,8 +102,7 @@ def InitializeWECDataFrames(path, file, geocodes, label_row, body_row,   preside
     df = SetIntersection(df, geocodes[['Area_Name', 'County_Code']], left_on = 'CNTY_NAME', right_on = 'Area_Name')
 
     #add the fips codes for the MCDs
-    for row in geocodes.itertuples():
-        df.loc[(df['MCD_NAME'] == row.MCD_NAME) & (df['County_Code'] == row.County_Code), 'MCD_FIPS'] = row.GEOID
+    df['MCD_FIPS'] = LookupFips(df[['MCD_NAME', 'County_Code']], geocodes, geocodes['GEOID'], '0', 'MCD')
         
     df['EXPANDEDGEOID'] = df.apply(ExpandFips, axis=1)
     
@@ -84,8 +116,10 @@ def InitializeWECDataFrames(path, file, geocodes, label_row, body_row,   preside
     else:
         df = df.rename(columns = {'TotalVotes':'DistTotalVotes', 'DEM':'DistDEM', 'REP':'DistREP'})
         
+    CurrentCall().rows_out = len(df)
     return label, dem_name, rep_name, office_totals, df     
 
+@Instrumented
 def PreprocessData(df, str_to_append, target_county_list):
     """
     Preprocess election results data by renaming columns, stripping/titlecasing county names, 
@@ -120,6 +154,7 @@ def PreprocessData(df, str_to_append, target_county_list):
     df['CNTY_NAME'] = df['CNTY_NAME'].apply(lambda x: f"{x} County")
     df_totals = df.loc[df['ReportingUnit'] == 'County Totals:']
     df = df.loc[df['ReportingUnit'] != 'County Totals:']
+    CurrentCall().rows_out = len(df)
     return df_totals, df
 
 def extract_numbers(text):
@@ -188,6 +223,7 @@ def ProcessReportingUnitString(ward):
         raise Exception()
     
 
+@Instrumented
 def ProcessReportingUnitData(df, wards_df, data_column_list, 
         ward_fips_list = None, cleanup_redundant_columns = True,
         keep_geometry = False):  
@@ -390,6 +426,7 @@ def ExpandFips(row):
 ## They may involve single sheets or multiple sheets depending on the election and there will be some
 ## header information that needs to be skipped.
 
+@Instrumented
 def CreateElectionData(target_counties, columns_to_keep, geocode_df, str_to_append, path, file, skiprows = 0, sheet_name = 'Sheet1'):
     df = InitializeDataFrames(path, file, remote_file=False, kwargs={'skiprows': skiprows, 'sheet_name': sheet_name})
     _, voter_df = PreprocessData(df, str_to_append, target_counties)
@@ -399,12 +436,10 @@ def CreateElectionData(target_counties, columns_to_keep, geocode_df, str_to_appe
     result['data'] = result['data'].astype(str)
     result['data'] = result['data'].fillna('None')
     result['MCD_NAME'] = result['ReportingUnit'].map(ConvertRow)
-    result['MCD_FIPS'] = '0'
     ## result['WinNumber_53'] = (.53 * result['Total']).fillna(0).astype(int)
     
     result = SetIntersection(result, geocode_df[['Area_Name', 'County_Code']], left_on = 'CNTY_NAME', right_on = 'Area_Name').drop(columns = 'Area_Name')
-    for row in geocode_df.itertuples():
-        result.loc[(result['MCD_NAME'] == row.MCD_NAME) & (result['County_Code'] == row.County_Code), 'MCD_FIPS'] = row.GEOID
+    result['MCD_FIPS'] = LookupFips(result[['MCD_NAME', 'County_Code']], geocode_df, geocode_df['GEOID'], '0', 'MCD')
     result['MCD_FIPS'] = result['MCD_FIPS'].astype(np.int64).astype(str)
     result['EXPANDEDGEOID'] = result.apply(ExpandFips, axis = 1)
     result = result[columns_to_keep]
@@ -414,6 +449,7 @@ def compute_ward(ward):
     lst = ward.split(' ')
     return lst[0].zfill(4) if len(lst) == 1 else lst[-1].zfill(4)
 
+@Instrumented
 def CreateVoterRegistrationData(target_counties, columns_to_keep, fips_dict, geocode_df, path, file, skiprows = 0):
     df = InitializeDataFrames(path, file, remote_file=False, kwargs = {'skiprows': skiprows})
 
@@ -426,15 +462,11 @@ def CreateVoterRegistrationData(target_counties, columns_to_keep, fips_dict, geo
 
     df['CNTY_FIPS'] = df['CNTY_NAME'].map(fips_dict)
     df['County_Code'] = df['CNTY_FIPS'].str[-3:]
-    df['MCD_FIPS'] = '0'
 
 ## Test both the MCD name and the county code because there are a number of cases where names are duplicated across counties
-    for row in geocode_df.itertuples():
-        name = row.MCD_NAME.strip()
-        code = row.County_Code.zfill(3)
-        id = row.GEOID
-        df.loc[((df['MCD_NAME'].str.strip() == name) & 
-                (df['County_Code'].str.strip() == code)), 'MCD_FIPS'] = id
+    rows = pd.DataFrame({'MCD_NAME': df['MCD_NAME'].str.strip(), 'County_Code': df['County_Code'].str.strip()})
+    geocode_keys = pd.DataFrame({'MCD_NAME': geocode_df['MCD_NAME'].str.strip(), 'County_Code': geocode_df['County_Code'].str.zfill(3)})
+    df['MCD_FIPS'] = LookupFips(rows, geocode_keys, geocode_df['GEOID'], '0', 'MCD')
      
     df['GEOID'] = df['MCD_FIPS'] + df['Ward']
     df['GEOID'] = df['GEOID'].astype(str)
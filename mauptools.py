@@ -1,10 +1,11 @@
 import maup 
 import pandas as pd
 import geopandas as gpd
-import time
 import sys
 sys.path.append('./')
 from gdftools import InitializeGeoDataFrames
+from instrumentation import Instrumented
+from compactframes import CompactFrame, ReportMemorySaved
 from edatools import  ColumnMove
 
 sys.path.append('../SEIU/SEIU_2025_Election')
@@ -12,6 +13,7 @@ sys.path.append('../SEIU/SEIU_2025_Election')
 wisconsin_transverse_mercator = 3070
 common_epsg = 4326
 
+@Instrumented
 def MaupRepair(gdf):
 	"""
 	Repairs a GeoDataFrame if necessary using the `maup` library.
@@ -28,11 +30,10 @@ def MaupRepair(gdf):
 		ValueError: If the repair process fails and the GeoDataFrame remains invalid.
 	Notes:
 		- The function prints progress and status messages to the console.
-		- The time taken for the repair process is also displayed.
+		- The time taken for the repair process is recorded by instrumentation.
 	Example:
 		>>> repaired_gdf = MaupRepair(gdf)
 	"""
-	start_time = time.time()
 	print('Examining...')
 	
 	if not maup.doctor(gdf):
@@ -44,11 +45,9 @@ def MaupRepair(gdf):
 			print('Repair unsuccessful. Please check the data.')
 	else:
 		print('Geodataframe does not need repair.')
-	
-	elapsed_time = time.time() - start_time
-	print(f'Process completed in {elapsed_time:.2f} seconds.')
 	return gdf
 
+@Instrumented
 def AssignGeoSourceToTarget(source, target, do_repairs = True, reset_crs = True):
 	def AssignGeoSourceToTarget(source, target, do_repairs=True, reset_crs=True):
 		"""
@@ -108,7 +107,8 @@ def AssignGeoSourceToTarget(source, target, do_repairs = True, reset_crs = True)
 	return result
 	
 
-def GetBlocksOrWards(path, file, columns_to_keep, target_county_fips):
+@Instrumented
+def GetBlocksOrWards(path, file, columns_to_keep, target_county_fips, compact=False):
 	"""
 	Processes geographic data to extract and filter blocks or wards (depending on the
  	input file) for specific counties.
@@ -118,16 +118,20 @@ def GetBlocksOrWards(path, file, columns_to_keep, target_county_fips):
 		file (str): The name of the geographic data file to be processed.
 		columns_to_keep (list): A list of column names to retain in the resulting DataFrame.
 		target_county_fips (list): A list of county FIPS codes to filter the data for specific counties.
+		compact (bool): If True, return the frame in the compact layout of compactframes.CompactFrame
+			(categorical names, Arrow string GEOIDs, small integer counts) and print the memory saved.
 	Returns:
 		pandas.DataFrame: A DataFrame containing the filtered and processed geographic data 
 		for the specified counties and columns.
 	Notes:
-		- The function initializes a GeoDataFrame from the specified file and path.
+		- The function initializes a GeoDataFrame from the specified file and path, loading only
+		  the columns it needs. After the first load these come from the file's GeoParquet sidecar.
 		- Filters the data based on the provided county FIPS codes 
 		- Resets the index of the resulting DataFrame and applies a repair function 
 		  (`MaupRepair`) to the data.
 	"""
-	blocks_df = InitializeGeoDataFrames(path, file, epsg=wisconsin_transverse_mercator, remote_file=False)
+	columns = list(columns_to_keep) if target_county_fips is None else [*columns_to_keep, 'CNTY_FIPS']
+	blocks_df = InitializeGeoDataFrames(path, file, epsg=wisconsin_transverse_mercator, remote_file=False, columns=columns)
 
 	print(f'Blocks/wards in state: {len(blocks_df)}')
 	if target_county_fips is not None:
@@ -140,8 +144,13 @@ def GetBlocksOrWards(path, file, columns_to_keep, target_county_fips):
 
 	target_county_blocks_df = MaupRepair(target_county_blocks_df)
 	target_county_blocks_df.reset_index(drop=True, inplace=True)
+	if compact:
+		compact_df = CompactFrame(target_county_blocks_df)
+		ReportMemorySaved(target_county_blocks_df, compact_df, 'Blocks/wards')
+		target_county_blocks_df = compact_df
 	return target_county_blocks_df
 
+@Instrumented
 def MapBlocksToWards(blocks_df, wards_df, fips_dict, variables, target_mcd_name = None):
     """
     Processes county wards by assigning blocks to wards and aggregating variables.
@@ -0,0 +1,244 @@
+"""
+Municipality (MCD) and county outlines dissolved from a ward layer, for GetCityInCounty.
+
+GetCityInCounty used to copy the wards of one city and union them on every call. Here every MCD
+outline of a ward layer is built at once: the wards are laid out in one row per MCD and dissolved
+with a single coverage union along the rows, which only has to drop the edges neighbouring wards
+share. County outlines are dissolved the same way from the MCD outlines. Where the wards of an MCD
+overlap, so that the coverage union does not hold, that outline falls back to a full union.
+
+The outlines of a layer are kept in memory, keyed on the layer's geometry, and written to
+`outline_cache_dir`, so later processes load them instead of dissolving again. A lookup is then a
+dictionary access, and the encoded result of each lookup is kept for the next one.
+
+usage:
+	[gdf, gjsn] = GetCityInCounty(county_ward_gdf, "Milwaukee", "Milwaukee")
+	outlines = GetOutlineCache(wards_gdf).outlines          # one row per MCD and per county
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import geojson
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from gdftools import ComputeCentroidLatLon, ConvertGDFtoGJSN, _FrameFingerprint, common_cols, world_crs
+
+try:
+	import pyarrow.parquet as pq
+except ImportError:
+	pq = None
+
+### where dissolved outlines are stored between processes, one file per ward layer; None keeps them in memory only
+outline_cache_dir = Path("./static/outlines")
+
+outline_cols = ["level", "CNTY_NAME", "MCD_NAME", "lat", "lon", "geometry"]
+
+
+def GroupedCoverageUnion(geoms, groups, n_groups):
+	"""
+	Union the geometries of each group in one vectorized coverage union.
+
+	Parameters:
+	- geoms: An array of polygons.
+	- groups: The group number, 0 to n_groups - 1, of each polygon.
+	- n_groups (int): The number of groups.
+
+	Returns:
+	- numpy.ndarray: The union of each group; an empty MultiPolygon for a group with no polygons.
+	"""
+	geoms = np.asarray(geoms)
+	groups = np.asarray(groups)
+	order = np.argsort(groups, kind="stable")
+	counts = np.bincount(groups, minlength=n_groups)
+	starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+	sorted_groups = groups[order]
+	slots = np.arange(len(groups)) - starts[sorted_groups]
+
+	### one row per group, padded with None, which the union skips
+	grid = np.full((n_groups, max(int(counts.max()), 1) if len(counts) else 1), None, dtype=object)
+	grid[sorted_groups, slots] = geoms[order]
+	outlines = shapely.coverage_union_all(grid, axis=1)
+
+	### overlapping polygons break the coverage union; their groups lose area or come out invalid
+	area = np.bincount(groups, weights=shapely.area(geoms), minlength=n_groups)
+	bad = ~shapely.is_valid(outlines) | ~np.isclose(shapely.area(outlines), area, rtol=1e-9, atol=0.0)
+	if bad.any():
+		outlines[bad] = shapely.union_all(grid[bad], axis=1)
+	return outlines
+
+
+def DissolveOutlines(wards_gdf, county_col="CNTY_NAME", mcd_col="MCD_NAME"):
+	"""
+	Dissolve a ward layer into one outline per MCD and one per county.
+
+	Parameters:
+	- wards_gdf (GeoDataFrame): The wards, with county and MCD name columns and a crs.
+	- county_col, mcd_col (str): The names of the county and MCD columns.
+
+	Returns:
+	- GeoDataFrame: In 'epsg:4326', with the columns of outline_cols. 'level' is "mcd" or "county",
+	  and the MCD_NAME of a county row is None. lat and lon are the centroid of each outline.
+	"""
+	geoms = np.asarray(wards_gdf.geometry.values)
+	keys = pd.DataFrame({
+		"CNTY_NAME": wards_gdf[county_col].astype(object).to_numpy(),
+		"MCD_NAME": wards_gdf[mcd_col].astype(object).to_numpy(),
+	})
+	mcd_codes, mcds = pd.MultiIndex.from_frame(keys).factorize()
+	mcd_outlines = GroupedCoverageUnion(geoms, mcd_codes, len(mcds))
+
+	mcd_counties = mcds.get_level_values(0)
+	county_codes, counties = pd.factorize(mcd_counties)
+	county_outlines = GroupedCoverageUnion(mcd_outlines, county_codes, len(counties))
+
+	outlines = gpd.GeoDataFrame(
+		{
+			"level": ["mcd"] * len(mcds) + ["county"] * len(counties),
+			"CNTY_NAME": [*mcd_counties, *counties],
+			"MCD_NAME": [*mcds.get_level_values(1), *[None] * len(counties)],
+		},
+		geometry=np.concatenate([mcd_outlines, county_outlines]),
+		crs=wards_gdf.crs,
+	)
+	if outlines.crs is not None and outlines.crs != world_crs:
+		outlines = outlines.to_crs(world_crs)
+	lat, lon = ComputeCentroidLatLon(np.asarray(outlines.geometry.values), outlines.crs)
+	outlines.insert(3, "lat", lat)
+	outlines.insert(4, "lon", lon)
+	return outlines[outline_cols]
+
+
+class OutlineCache:
+	"""
+	The dissolved outlines of one ward layer, looked up by (county, MCD) or by county.
+	"""
+
+	def __init__(self, outlines):
+		self.outlines = outlines.reset_index(drop=True)
+		self._index = {
+			(level, county, mcd): i
+			for i, (level, county, mcd) in enumerate(self.outlines[["level", "CNTY_NAME", "MCD_NAME"]].itertuples(index=False))
+		}
+		self._results = {}
+		self._lock = threading.Lock()
+
+	def __contains__(self, key):
+		county_name, mcd_name = key
+		level = "county" if mcd_name is None else "mcd"
+		return (level, county_name, mcd_name) in self._index
+
+	def outline(self, county_name, mcd_name=None):
+		"""Return the outline row for an MCD of a county, or for the county if mcd_name is None; None if there is none."""
+		level = "county" if mcd_name is None else "mcd"
+		i = self._index.get((level, county_name, mcd_name))
+		return None if i is None else self.outlines.iloc[[i]]
+
+	def city_result(self, county_name, city_name):
+		"""
+		Return [gdf, gjsn] for a city the way GetCityInCounty returns them, or None if the layer has no such city.
+		The result is built on the first lookup; later lookups return copies of it.
+		"""
+		key = (county_name, city_name)
+		with self._lock:
+			result = self._results.get(key)
+		if result is None:
+			row = self.outline(county_name, city_name)
+			if row is None:
+				return None
+			gdf = gpd.GeoDataFrame(row[["lat", "lon", "geometry"]].reset_index(drop=True), crs=row.crs)
+			gdf["id"] = city_name
+			gdf["z_layer"] = [0] * len(gdf)
+			gdf.reset_index(inplace=True)
+			gjsn = ConvertGDFtoGJSN(gdf[common_cols])
+			result = [gdf, json.dumps(gjsn["features"]), gjsn.get("crs")]
+			with self._lock:
+				self._results[key] = result
+		gdf, features, crs = result
+		### a fresh collection per call, as ConvertGDFtoGJSN would return
+		if crs is None:
+			return [gdf.copy(), geojson.FeatureCollection(json.loads(features))]
+		return [gdf.copy(), geojson.FeatureCollection(json.loads(features), crs=crs)]
+
+
+_outline_cache = OrderedDict()
+_outline_cache_lock = threading.Lock()
+outline_cache_size = 8
+
+
+def _OutlineFile(key):
+	crs, digest = key
+	crs_digest = hashlib.blake2b(crs.encode(), digest_size=4).hexdigest()
+	suffix = ".parquet" if pq is not None else ".gpkg"
+	return Path(outline_cache_dir) / f"outlines_{digest}_{crs_digest}{suffix}"
+
+
+def WriteOutlines(outlines, out_file):
+	"""Write dissolved outlines to a .parquet file (needs pyarrow) or to any file type to_file writes."""
+	out_file = Path(out_file)
+	out_file.parent.mkdir(parents=True, exist_ok=True)
+	if out_file.suffix == ".parquet":
+		outlines.to_parquet(out_file)
+	else:
+		outlines.to_file(out_file)
+
+
+def LoadOutlines(in_file):
+	"""Read outlines written by WriteOutlines."""
+	in_file = Path(in_file)
+	if in_file.suffix == ".parquet":
+		outlines = gpd.read_parquet(in_file)
+	else:
+		outlines = gpd.read_file(in_file)
+	outlines["MCD_NAME"] = outlines["MCD_NAME"].astype(object).where(outlines["MCD_NAME"].notna(), None)
+	return outlines[outline_cols]
+
+
+def GetOutlineCache(wards_gdf, county_col="CNTY_NAME", mcd_col="MCD_NAME"):
+	"""
+	Return the OutlineCache of a ward layer: from memory, else from outline_cache_dir, else dissolved
+	with DissolveOutlines and stored in both.
+	"""
+	key = _FrameFingerprint(wards_gdf)
+	key = (key[0], f"{key[1]}_{_NamesDigest(wards_gdf, county_col, mcd_col)}")
+	with _outline_cache_lock:
+		if key in _outline_cache:
+			_outline_cache.move_to_end(key)
+			return _outline_cache[key]
+
+	outlines = None
+	out_file = _OutlineFile(key) if outline_cache_dir is not None else None
+	if out_file is not None and out_file.exists():
+		try:
+			outlines = LoadOutlines(out_file)
+		except (OSError, ValueError) as e:
+			print("Could not read stored outlines", out_file, "--", e)
+	if outlines is None:
+		outlines = DissolveOutlines(wards_gdf, county_col, mcd_col)
+		if out_file is not None:
+			try:
+				WriteOutlines(outlines, out_file)
+			except (OSError, ValueError) as e:
+				print("Could not store outlines", out_file, "--", e)
+	cache = OutlineCache(outlines)
+
+	with _outline_cache_lock:
+		_outline_cache[key] = cache
+		while len(_outline_cache) > outline_cache_size:
+			_outline_cache.popitem(last=False)
+	return cache
+
+
+def _NamesDigest(wards_gdf, county_col, mcd_col):
+	"""
+	A hash of the county and MCD names of every ward, in row order, which decide how the wards are
+	grouped. Swapping the names of two wards changes it.
+	"""
+	names = pd.DataFrame({"c": wards_gdf[county_col].astype(object), "m": wards_gdf[mcd_col].astype(object)})
+	row_hashes = pd.util.hash_pandas_object(names, index=False).to_numpy()
+	return hashlib.blake2b(row_hashes.tobytes(), digest_size=8).hexdigest()
@@ -0,0 +1,279 @@
+"""
+A sparse matrix of intersection areas between two polygon layers, for apportioning data from one to
+the other by areal overlap.
+
+Rolling ward data up to districts used to mean an overlay per district type and a groupby per column.
+Here the overlapping pairs of two layers are found once with a spatial index and their intersection
+areas computed in one vectorized call (crosswalk.ComputeOverlapAreas), and kept as a scipy sparse
+matrix with a row per source polygon and a column per target polygon. Apportioning any number of
+columns is then one sparse matrix product.
+
+The matrix depends only on the two boundary files, so GetOverlapMatrix stores it in
+`overlap_cache_dir` and reuses it for every election drawn on the same boundaries.
+
+usage:
+	overlaps = GetOverlapMatrix(ward_bounds_file, assembly_districts_file, "GEOID", "ASM2021")
+	totals = overlaps.apportion(wards_df, ["PERSONS18", "HISPANIC18", "WHITE18"], source_id="GEOID")
+	shares = overlaps.mean(wards_df, ["LatinxVAPPct"], source_id="GEOID")
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+from crosswalk import ComputeOverlapAreas, _SourceHash, equal_area_crs, min_overlap_fraction
+from filesig import ReplaceAtomically
+from layercache import ReadLayer, SourceSignature
+
+### where overlap matrices are stored between runs; None keeps them in memory only
+overlap_cache_dir = Path("./static/overlaps")
+
+
+class OverlapMatrix:
+	"""
+	The intersection areas of two polygon layers, in square meters of equal_area_crs.
+
+	areas[i, j] is the area source polygon i shares with target polygon j. source_ids and target_ids
+	label the rows and columns; source_areas and target_areas are the areas of the whole polygons.
+	"""
+
+	def __init__(self, areas, source_ids, target_ids, source_areas, target_areas):
+		self.areas = sparse.csr_matrix(areas, dtype="float64")
+		self.source_ids = pd.Index(source_ids)
+		self.target_ids = pd.Index(target_ids)
+		self.source_areas = np.asarray(source_areas, dtype="float64")
+		self.target_areas = np.asarray(target_areas, dtype="float64")
+
+	@property
+	def shape(self):
+		return self.areas.shape
+
+	def weights(self, min_fraction=min_overlap_fraction, normalize=False):
+		"""
+		Return the fraction of each source polygon lying in each target polygon.
+
+		Parameters:
+		- min_fraction (float): Fractions below this are dropped as digitizing noise along shared edges.
+		- normalize (bool): Scale each row to sum to 1, so a source polygon partly outside every
+		  target still hands on all of its value.
+
+		Returns:
+		- scipy.sparse.csr_matrix: The fractions, shaped like areas.
+		"""
+		with np.errstate(divide="ignore", invalid="ignore"):
+			scale = np.where(self.source_areas > 0, 1.0 / self.source_areas, 0.0)
+		w = sparse.diags(scale) @ self.areas
+		w = w.tocsr()
+		if min_fraction:
+			w.data[w.data < min_fraction] = 0.0
+			w.eliminate_zeros()
+		if normalize:
+			totals = np.asarray(w.sum(axis=1)).ravel()
+			with np.errstate(divide="ignore", invalid="ignore"):
+				w = (sparse.diags(np.where(totals > 0, 1.0 / totals, 0.0)) @ w).tocsr()
+		return w
+
+	def _SourceValues(self, df, columns, source_id):
+		"""The columns of df as a float matrix in the row order of the matrix; missing sources are NaN."""
+		df = pd.DataFrame(df)
+		if source_id is not None:
+			df = df.set_index(source_id)
+		df.index = df.index.astype(str)
+		if not df.index.is_unique:
+			raise ValueError("The source ids of the data are not unique")
+		return df[columns].reindex(self.source_ids).to_numpy(dtype="float64")
+
+	def apportion(self, df, columns, source_id=None, min_fraction=min_overlap_fraction, normalize=False):
+		"""
+		Apportion counts from the source polygons to the target polygons: each source hands each
+		target its value times the fraction of its area lying in the target. All columns are
+		apportioned in one sparse matrix product.
+
+		Parameters:
+		- df (DataFrame): The source data, indexed by source id or with a `source_id` column.
+		- columns (list): The count columns to apportion. Missing values count as 0.
+		- source_id (str): The column holding the source ids, None to use the index.
+		- min_fraction, normalize: As for weights.
+
+		Returns:
+		- DataFrame: The apportioned totals, indexed by target id.
+		"""
+		values = np.nan_to_num(self._SourceValues(df, columns, source_id))
+		totals = self.weights(min_fraction, normalize).T @ values
+		return pd.DataFrame(totals, index=self.target_ids, columns=columns)
+
+	def mean(self, df, columns, source_id=None):
+		"""
+		Average rates or shares over each target polygon, weighting every source by the area it
+		shares with the target. Sources with no value in a column are left out of that column's average.
+
+		Parameters:
+		- df (DataFrame): The source data, indexed by source id or with a `source_id` column.
+		- columns (list): The columns to average.
+		- source_id (str): The column holding the source ids, None to use the index.
+
+		Returns:
+		- DataFrame: The averages, indexed by target id; NaN where no source with a value overlaps.
+		"""
+		values = self._SourceValues(df, columns, source_id)
+		present = ~np.isnan(values)
+		at = self.areas.T
+		with np.errstate(divide="ignore", invalid="ignore"):
+			means = (at @ np.where(present, values, 0.0)) / (at @ present.astype("float64"))
+		return pd.DataFrame(means, index=self.target_ids, columns=columns)
+
+	def save(self, out_file, sources=None):
+		"""
+		Write the matrix to an .npz file. `sources`, if given, is recorded next to it in a .json file
+		so GetOverlapMatrix can tell whether the boundary files have changed since.
+		"""
+		out_file = Path(out_file)
+		out_file.parent.mkdir(parents=True, exist_ok=True)
+		areas = self.areas
+		### each file is written to a private name and renamed into place, the .json last, so a reader
+		### never sees a partly written matrix or a record of sources for a matrix not yet in place
+		if sources is not None:
+			_MetaPath(out_file).unlink(missing_ok=True)
+		with ReplaceAtomically(out_file) as f:
+			np.savez_compressed(
+				f,
+				data=areas.data,
+				indices=areas.indices,
+				indptr=areas.indptr,
+				shape=np.array(areas.shape),
+				source_ids=self.source_ids.astype(str).to_numpy(dtype=str),
+				target_ids=self.target_ids.astype(str).to_numpy(dtype=str),
+				source_areas=self.source_areas,
+				target_areas=self.target_areas,
+			)
+		if sources is not None:
+			with ReplaceAtomically(_MetaPath(out_file), "w") as f:
+				json.dump(sources, f)
+		return out_file
+
+	@classmethod
+	def load(cls, in_file):
+		"""Read a matrix written by save. The ids come back as strings."""
+		with np.load(in_file, allow_pickle=False) as npz:
+			areas = sparse.csr_matrix((npz["data"], npz["indices"], npz["indptr"]), shape=tuple(npz["shape"]))
+			return cls(areas, npz["source_ids"].astype(object), npz["target_ids"].astype(object), npz["source_areas"], npz["target_areas"])
+
+
+def BuildOverlapMatrix(source_gdf, target_gdf, source_id, target_id):
+	"""
+	Build the OverlapMatrix of two polygon layers.
+
+	Parameters:
+	- source_gdf, target_gdf (GeoDataFrame): The layers, in any crs; they are compared in equal_area_crs.
+	- source_id, target_id (str): The columns holding the polygon ids.
+
+	Returns:
+	- OverlapMatrix: With a row per source polygon and a column per target polygon, in frame order.
+	"""
+	sources = np.asarray(source_gdf.geometry.to_crs(equal_area_crs).values)
+	targets = np.asarray(target_gdf.geometry.to_crs(equal_area_crs).values)
+	source_idx, target_idx, overlap, source_areas = ComputeOverlapAreas(sources, targets)
+	keep = overlap > 0
+	areas = sparse.csr_matrix(
+		(overlap[keep], (source_idx[keep], target_idx[keep])), shape=(len(sources), len(targets))
+	)
+	return OverlapMatrix(
+		areas,
+		source_gdf[source_id].astype(str).to_numpy(dtype=object),
+		target_gdf[target_id].astype(str).to_numpy(dtype=object),
+		source_areas,
+		shapely.area(targets),
+	)
+
+
+def _MetaPath(out_file):
+	return out_file.with_name(out_file.name + ".json")
+
+
+def _OverlapFile(source_file, target_file, source_id, target_id, cache_dir):
+	### the stems alone would put 2022/wards.shp and 2024/wards.shp in the same file
+	paths = f"{Path(source_file).resolve()}\n{Path(target_file).resolve()}"
+	digest = hashlib.blake2b(paths.encode("utf-8"), digest_size=4).hexdigest()
+	return Path(cache_dir) / f"overlap_{Path(source_file).stem}_{source_id}__{Path(target_file).stem}_{target_id}_{digest}.npz"
+
+
+def _Sources(source_file, target_file, source_id, target_id):
+	return {
+		"source": [str(source_file), _SourceHash(source_file), source_id],
+		"target": [str(target_file), _SourceHash(target_file), target_id],
+	}
+
+
+### loaded overlap matrices, least recently used first
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+overlap_cache_size = 8
+
+### a lock per matrix being loaded or built, so concurrent first calls build and store it once
+_overlap_builds = {}
+
+
+def GetOverlapMatrix(source_file, target_file, source_id, target_id, cache_dir=None, rebuild=False):
+	"""
+	Return the OverlapMatrix of two boundary files: the stored one if neither file has changed since
+	it was built, otherwise built with BuildOverlapMatrix and stored. The last overlap_cache_size
+	matrices are also kept in memory.
+
+	Parameters:
+	- source_file, target_file (str or Path): The boundary files.
+	- source_id, target_id (str): The columns holding the polygon ids.
+	- cache_dir (str or Path): Where to store the matrix; defaults to overlap_cache_dir.
+	- rebuild (bool): Build the matrix even if the stored one is up to date.
+
+	Returns:
+	- OverlapMatrix
+	"""
+	if cache_dir is None:
+		cache_dir = overlap_cache_dir
+	key = (str(Path(source_file).resolve()), str(Path(target_file).resolve()), source_id, target_id)
+	signature = (SourceSignature(source_file), SourceSignature(target_file))
+	with _loaded_lock:
+		entry = _loaded.get(key)
+		if not rebuild and entry is not None and entry[0] == signature:
+			_loaded.move_to_end(key)
+			return entry[1]
+		build_lock = _overlap_builds.setdefault(key, threading.Lock())
+
+	with build_lock:
+		with _loaded_lock:
+			entry = _loaded.get(key)
+			if not rebuild and entry is not None and entry[0] == signature:
+				_loaded.move_to_end(key)
+				return entry[1]
+		try:
+			overlaps = _LoadOrBuild(source_file, target_file, source_id, target_id, cache_dir, rebuild)
+			with _loaded_lock:
+				_loaded[key] = (signature, overlaps)
+				_loaded.move_to_end(key)
+				while len(_loaded) > overlap_cache_size:
+					_loaded.popitem(last=False)
+		finally:
+			with _loaded_lock:
+				_overlap_builds.pop(key, None)
+	return overlaps
+
+
+def _LoadOrBuild(source_file, target_file, source_id, target_id, cache_dir, rebuild):
+	sources = _Sources(source_file, target_file, source_id, target_id)
+	out_file = _OverlapFile(source_file, target_file, source_id, target_id, cache_dir) if cache_dir is not None else None
+	if not rebuild and out_file is not None and out_file.exists() and _MetaPath(out_file).exists():
+		with _MetaPath(out_file).open() as f:
+			if json.load(f) == sources:
+				return OverlapMatrix.load(out_file)
+	source_gdf = ReadLayer(source_file, columns=[source_id])
+	target_gdf = ReadLayer(target_file, columns=[target_id])
+	overlaps = BuildOverlapMatrix(source_gdf, target_gdf, source_id, target_id)
+	if out_file is not None:
+		overlaps.save(out_file, sources)
+	return overlaps
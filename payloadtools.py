@@ -0,0 +1,110 @@
+"""
+Choropleth payloads: the geometry of a layer keyed by id, and its attributes in a separate columnar
+table keyed by the same ids.
+
+Plotly joins a choropleth's geojson to its z values through featureidkey 'properties.id'; the z and
+hover values themselves come from the frame passed as locations and z (see plotlytools). Any other
+property in the geojson is sent to the browser with every feature and never read. Here the geojson
+carries only the id (gdftools.ConvertGDFtoChoroplethGJSN), and the attributes go out once, as one
+list per column.
+
+usage:
+	[gjsn, table] = BuildChoroplethPayload(gdf)
+	fig.add_trace(GetChoroplethMapbox(table, gjsn, "LatinxVAPPct", ...))
+	ReportPayloadSavings({"state wards": wards_gdf, "assembly": assembly_gdf})
+"""
+import json
+
+import geojson
+import numpy as np
+import pandas as pd
+
+from gdftools import ConvertGDFtoChoroplethGJSN, StreamGDFtoGJSN
+
+
+def AttributeTable(gdf, id_column="id", columns=None):
+	"""
+	Return the attributes of a layer without its geometry, with the id column first.
+
+	Parameters:
+	- gdf (GeoDataFrame): The layer.
+	- id_column (str): The column holding the feature ids; it is named 'id' in the table.
+	- columns (list): The attribute columns to keep, or None for all of them.
+
+	Returns:
+	- DataFrame: One row per feature, in the order of gdf.
+	"""
+	columns = [c for c in (gdf.columns if columns is None else columns) if c not in (id_column, gdf.geometry.name)]
+	table = pd.DataFrame(gdf[[id_column, *columns]]).rename(columns={id_column: "id"})
+	return table.reset_index(drop=True)
+
+
+def EncodeAttributeTable(table):
+	"""
+	Encode an attribute table as columnar JSON, {"id": [...], column: [...], ...}, with NaN and
+	None written as null.
+	"""
+	values = table.astype(object).where(table.notna(), None)
+	return json.dumps({col: values[col].tolist() for col in values.columns}, default=str)
+
+
+def BuildChoroplethPayload(gdf, id_column="id", columns=None, precision=geojson.geometry.DEFAULT_PRECISION):
+	"""
+	Split a layer into a choropleth payload.
+
+	Parameters:
+	- gdf (GeoDataFrame): The layer.
+	- id_column (str): The column holding the feature ids.
+	- columns (list): The attribute columns the table keeps, or None for all of them.
+	- precision (int): Decimal places kept in the coordinates, None keeps full precision.
+
+	Returns:
+	- list: The geojson (geometry, with 'id' as the only property) and the attribute table.
+	"""
+	return [ConvertGDFtoChoroplethGJSN(gdf, id_column, precision), AttributeTable(gdf, id_column, columns)]
+
+
+def _StreamedBytes(gdf, precision):
+	return sum(len(chunk) for chunk in StreamGDFtoGJSN(gdf, precision=precision))
+
+
+def PayloadSizes(gdf, id_column="id", columns=None, precision=geojson.geometry.DEFAULT_PRECISION):
+	"""
+	Measure a layer sent as one geojson with every column as a property, and as a choropleth payload.
+
+	Returns:
+	- dict: The bytes of the full geojson, of the id-only geojson, of the encoded attribute table,
+	  and the bytes saved.
+	"""
+	full = _StreamedBytes(gdf, precision)
+	ids = gdf[[id_column, gdf.geometry.name]].rename(columns={id_column: "id"})
+	pruned = _StreamedBytes(ids, precision)
+	table = len(EncodeAttributeTable(AttributeTable(gdf, id_column, columns)).encode("utf-8"))
+	return {
+		"features": len(gdf),
+		"full_bytes": full,
+		"geometry_bytes": pruned,
+		"table_bytes": table,
+		"saved_bytes": full - pruned - table,
+	}
+
+
+def ReportPayloadSavings(layers, id_column="id", precision=geojson.geometry.DEFAULT_PRECISION):
+	"""
+	Print and return the PayloadSizes of several layers.
+
+	Parameters:
+	- layers (dict): {layer name: GeoDataFrame}.
+
+	Returns:
+	- DataFrame: One row of PayloadSizes per layer, with the fraction saved.
+	"""
+	report = pd.DataFrame({name: PayloadSizes(gdf, id_column, precision=precision) for name, gdf in layers.items()}).T
+	report["fraction_saved"] = report["saved_bytes"] / np.maximum(report["full_bytes"], 1)
+	for name, row in report.iterrows():
+		print(
+			f"{name} ({int(row['features']):,} features): {row['full_bytes'] / 2**10:,.0f} KB -> "
+			f"{row['geometry_bytes'] / 2**10:,.0f} KB geometry + {row['table_bytes'] / 2**10:,.0f} KB table "
+			f"({row['fraction_saved']:.0%} saved)"
+		)
+	return report
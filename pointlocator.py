@@ -0,0 +1,197 @@
+"""
+Bulk point-in-polygon assignment of geocoded points (members, contacts, addresses) to the ward and
+district layers gdftools loads.
+
+A PointLocator indexes the polygons of one layer on a uniform grid, built with an STRtree, so
+locating a few hundred thousand points is array arithmetic plus one vectorized containment test.
+Locators are cached per layer, keyed on the layer's geometry, so assigning several batches of
+points to the same wards builds the tree once.
+
+usage:
+	[wards_gdf, _] = GetWardsInState(ward_bounds_file)
+	members = LocatePoints(members, wards_gdf, columns=["GEOID", "LABEL"])
+	members = LocatePoints(members, assembly_gdf, columns={"DISTRICT": "ASSEMBLY"})
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from gdftools import GetTransformer, _FrameFingerprint, world_crs
+
+
+class PointLocator:
+	"""
+	Assigns points to the polygons of a layer without building a geometry per point.
+
+	When the locator is built, the extent of the layer is divided into a uniform grid of about
+	`cells_per_geom` cells per polygon, and an STRtree query finds the polygons touching each cell.
+	A point in a cell lying wholly inside one polygon is assigned from the cell alone; the rest are
+	tested, straight from their coordinates, against the prepared polygons of their cell.
+
+	A point on the shared edge of two polygons is assigned to just one of them, and a point outside
+	every polygon gets missing values, as does every point located in an empty layer.
+	"""
+
+	def __init__(self, gdf, columns, cells_per_geom=16):
+		self.crs = gdf.crs
+		self.columns = list(columns)
+		### a private copy to prepare: the layer's geometry objects are shared with every other reader of the
+		### layer cache, and a GEOS prepared geometry must not be used from two threads at once
+		self.geoms = shapely.from_wkb(shapely.to_wkb(np.asarray(gdf.geometry.values)))
+		self.attributes = pd.DataFrame(gdf[self.columns]).reset_index(drop=True)
+		### an empty layer has no extent to grid, and no point falls inside it
+		if len(self.geoms) == 0:
+			return
+		shapely.prepare(self.geoms)
+		self._BuildGrid(cells_per_geom)
+
+	def _BuildGrid(self, cells_per_geom):
+		xmin, ymin, xmax, ymax = shapely.total_bounds(self.geoms)
+		width, height = max(xmax - xmin, 1e-12), max(ymax - ymin, 1e-12)
+		n_cells = max(1, len(self.geoms) * cells_per_geom)
+		nx = max(1, int(round(np.sqrt(n_cells * width / height))))
+		ny = max(1, int(round(n_cells / nx)))
+		self.origin = (xmin, ymin)
+		self.cell_size = (width / nx, height / ny)
+		self.shape = (ny, nx)
+
+		iy, ix = np.divmod(np.arange(nx * ny), nx)
+		cells = shapely.box(
+			xmin + ix * self.cell_size[0], ymin + iy * self.cell_size[1],
+			xmin + (ix + 1) * self.cell_size[0], ymin + (iy + 1) * self.cell_size[1],
+		)
+		cell_idx, geom_idx = shapely.STRtree(self.geoms).query(cells, predicate="intersects")
+
+		### cells wholly inside a polygon need no test at all
+		self.cell_owner = np.full(nx * ny, -1, dtype="int64")
+		inside = shapely.contains(self.geoms[geom_idx], cells[cell_idx])
+		self.cell_owner[cell_idx[inside]] = geom_idx[inside]
+
+		### the other cells keep their candidate polygons, grouped by cell
+		keep = self.cell_owner[cell_idx] < 0
+		self.candidates = geom_idx[keep]
+		counts = np.bincount(cell_idx[keep], minlength=nx * ny)
+		self.cell_start = np.concatenate([[0], np.cumsum(counts)[:-1]])
+		self.cell_count = counts
+
+	def locate_index(self, x, y, crs=world_crs):
+		"""
+		Return, for each point, the position in the layer of the polygon holding it, or -1.
+
+		Parameters:
+		- x, y (array-like): The point coordinates (longitude and latitude for 'epsg:4326').
+		- crs: The coordinate reference system of the points.
+		"""
+		x = np.asarray(x, dtype="float64")
+		y = np.asarray(y, dtype="float64")
+		if self.crs is not None and not self.crs.equals(crs):
+			x, y = GetTransformer(crs, self.crs).transform(x, y)
+		result = np.full(len(x), -1, dtype="int64")
+		if len(self.geoms) == 0:
+			return result
+
+		ny, nx = self.shape
+		with np.errstate(invalid="ignore"):
+			fx = (x - self.origin[0]) / self.cell_size[0]
+			fy = (y - self.origin[1]) / self.cell_size[1]
+			valid = (fx >= 0) & (fx <= nx) & (fy >= 0) & (fy <= ny)
+		ix = np.minimum(fx[valid].astype("int64"), nx - 1)
+		iy = np.minimum(fy[valid].astype("int64"), ny - 1)
+		points = np.flatnonzero(valid)
+		cell = iy * nx + ix
+
+		owner = self.cell_owner[cell]
+		result[points] = owner
+
+		### test the points in boundary cells against each candidate polygon of their cell
+		todo = owner < 0
+		points, cell = points[todo], cell[todo]
+		counts = self.cell_count[cell]
+		point_idx = np.repeat(points, counts)
+		offsets = np.arange(len(point_idx)) - np.repeat(np.cumsum(counts) - counts, counts)
+		geom_idx = self.candidates[np.repeat(self.cell_start[cell], counts) + offsets]
+		hit = shapely.intersects_xy(self.geoms[geom_idx], x[point_idx], y[point_idx])
+		point_idx, geom_idx = point_idx[hit], geom_idx[hit]
+
+		### keep the first polygon for points on a shared edge
+		first = np.unique(point_idx, return_index=True)[1]
+		result[point_idx[first]] = geom_idx[first]
+		return result
+
+	def locate(self, x, y, crs=world_crs):
+		"""
+		Return the layer's attribute columns for each point, one row per point, with missing values
+		for points outside the layer.
+		"""
+		idx = self.locate_index(x, y, crs)
+		if len(self.attributes) == 0:
+			return self.attributes.reindex(range(len(idx)))
+		found = idx >= 0
+		result = self.attributes.iloc[np.where(found, idx, 0)].reset_index(drop=True)
+		if not found.all():
+			result = result.where(np.repeat(found[:, None], len(self.columns), axis=1))
+		return result
+
+
+_locator_cache = OrderedDict()
+_locator_cache_lock = threading.Lock()
+locator_cache_size = 16
+
+### a lock per layer being built, so concurrent first calls on a layer build its locator once
+_locator_builds = {}
+
+
+def GetPointLocator(gdf, columns):
+	"""
+	Return a PointLocator for the polygons of `gdf` and the given attribute columns, built once per layer.
+	"""
+	key = (_FrameFingerprint(gdf), tuple(columns))
+	with _locator_cache_lock:
+		if key in _locator_cache:
+			_locator_cache.move_to_end(key)
+			return _locator_cache[key]
+		build_lock = _locator_builds.setdefault(key, threading.Lock())
+
+	with build_lock:
+		with _locator_cache_lock:
+			if key in _locator_cache:
+				_locator_cache.move_to_end(key)
+				return _locator_cache[key]
+		try:
+			locator = PointLocator(gdf, columns)
+			with _locator_cache_lock:
+				_locator_cache[key] = locator
+				while len(_locator_cache) > locator_cache_size:
+					_locator_cache.popitem(last=False)
+		finally:
+			with _locator_cache_lock:
+				_locator_builds.pop(key, None)
+	return locator
+
+
+def LocatePoints(df, layer_gdf, columns=["GEOID"], lat="latitude", lon="longitude", crs=world_crs):
+	"""
+	Assign each row of a DataFrame of geocoded points to the polygon of a ward or district layer holding it.
+
+	Parameters:
+	- df (DataFrame): The points, with latitude and longitude columns (e.g. from geocoders.nominatim_geocode).
+	- layer_gdf (GeoDataFrame): The ward or district polygons.
+	- columns (list or dict): The layer columns to copy onto the points; a dict renames them on the way.
+	- lat, lon (str): The names of the latitude and longitude columns of `df`.
+	- crs: The coordinate reference system of the points.
+
+	Returns:
+	- DataFrame: A copy of `df` with the requested columns added. Points outside the layer, or with no
+	  coordinates, get missing values.
+	"""
+	rename = dict(columns) if isinstance(columns, dict) else {c: c for c in columns}
+	locator = GetPointLocator(layer_gdf, list(rename))
+	located = locator.locate(df[lon].to_numpy(dtype="float64"), df[lat].to_numpy(dtype="float64"), crs)
+	located = located.rename(columns=rename).set_axis(df.index, axis=0)
+	df = df.copy()
+	for col in located.columns:
+		df[col] = located[col]
+	return df
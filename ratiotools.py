@@ -0,0 +1,114 @@
+"""
+Vectorized ratio columns (shares of the voting age population and the like) for ward and block frames.
+
+Every ratio of a call is computed in one NumPy division over stacked numerator and denominator
+arrays, rows with a zero or missing denominator get a fill value, and all the ratios are rounded in
+one pass. The new columns are placed in a single reorder of the frame, instead of one insert per column.
+
+Rounding gives exactly what float("{:.2f}".format(x)) gives, the rounding GetWardDataForCounty used.
+np.round can disagree with it on values within a hair of a rounding tie, because scaling by 100 is
+itself rounded; here the scaling is done exactly, as a sum of two floats.
+
+usage:
+	gdf = AddRatioColumns(gdf, {"LatinxVAPPct": ("LatinxVAP", "VAP"), "BlackVAPPct": ("BlackVAP", "VAP")}, after="AsianVAP")
+"""
+import numpy as np
+import pandas as pd
+
+
+def _TwoProduct(a, b):
+	"""Dekker's exact product: a * b == product + error, with both terms computed in float64."""
+	product = a * b
+
+	def split(v):
+		c = 134217729.0 * v
+		hi = c - (c - v)
+		return hi, v - hi
+
+	a_hi, a_lo = split(a)
+	b_hi, b_lo = split(b)
+	error = ((a_hi * b_hi - product) + a_hi * b_lo + a_lo * b_hi) + a_lo * b_lo
+	return product, error
+
+
+def RoundLikeFormat(values, decimals=2):
+	"""
+	Round an array the way float(f"{x:.{decimals}f}") rounds each value: to the nearest decimal,
+	ties resolved on the exact binary value of x, and exact ties to even.
+
+	Parameters:
+	- values (array-like): The values to round.
+	- decimals (int): The decimal places to keep, at most 22.
+
+	Returns:
+	- numpy.ndarray: The rounded values, as float64.
+	"""
+	values = np.asarray(values, dtype="float64")
+	shape = values.shape
+	values = values.reshape(-1)
+	scale = 10.0**decimals
+
+	### np.round scales by 10**decimals first, and the rounding error of that product can move a
+	### value onto a tie or off one; carrying the error term settles which side of the tie it is on
+	with np.errstate(invalid="ignore", over="ignore"):
+		scaled, error = _TwoProduct(values, scale)
+		rounded = np.rint(scaled)
+		tie = (scaled - np.floor(scaled) == 0.5) & (error != 0)
+		rounded[tie] = np.floor(scaled[tie]) + (error[tie] > 0)
+	return (rounded / scale).reshape(shape)
+
+
+def ComputeRatios(df, ratios, decimals=2, fill_value=0.0):
+	"""
+	Compute ratio columns from numerator and denominator columns of a frame.
+
+	Parameters:
+	- df (DataFrame): The frame holding the numerator and denominator columns.
+	- ratios (dict): {new column: (numerator column, denominator column)}.
+	- decimals (int): The decimal places to round to, or None to leave the ratios unrounded.
+	- fill_value (float): The ratio for rows whose denominator is zero or missing.
+
+	Returns:
+	- DataFrame: One column per ratio, on the index of df.
+	"""
+	names = list(ratios)
+	if not names:
+		return pd.DataFrame(index=df.index)
+	numerators = np.column_stack([df[ratios[name][0]].to_numpy(dtype="float64", na_value=np.nan) for name in names])
+	denominators = np.column_stack([df[ratios[name][1]].to_numpy(dtype="float64", na_value=np.nan) for name in names])
+
+	valid = (denominators != 0) & ~np.isnan(denominators)
+	result = np.full(numerators.shape, fill_value, dtype="float64")
+	np.divide(numerators, denominators, out=result, where=valid)
+	result[valid & np.isnan(result)] = fill_value
+	if decimals is not None:
+		result = RoundLikeFormat(result, decimals)
+	return pd.DataFrame(result, index=df.index, columns=names)
+
+
+def AddRatioColumns(df, ratios, after=None, decimals=2, fill_value=0.0):
+	"""
+	Add ratio columns to a frame, computed by ComputeRatios, in one step.
+
+	Parameters:
+	- df (DataFrame or GeoDataFrame): The frame holding the numerator and denominator columns.
+	- ratios (dict): {new column: (numerator column, denominator column)}, in the order the columns are to appear.
+	- after (str or int): The column the new columns follow, or the position of the first new column;
+	  None puts them at the end. Existing columns of the same names are replaced in place.
+	- decimals (int): The decimal places to round to, or None to leave the ratios unrounded.
+	- fill_value (float): The ratio for rows whose denominator is zero or missing.
+
+	Returns:
+	- DataFrame: A copy of df with the ratio columns added.
+	"""
+	values = ComputeRatios(df, ratios, decimals, fill_value)
+	new = [c for c in values.columns if c not in df.columns]
+	columns = list(df.columns)
+	if after is None:
+		position = len(columns)
+	elif isinstance(after, str):
+		position = columns.index(after) + 1
+	else:
+		position = int(after)
+	order = columns[:position] + new + columns[position:]
+	return df.assign(**{c: values[c] for c in values.columns})[order]
@@ -0,0 +1,117 @@
+"""
+GeoParquet sidecar files for slow-to-parse geodata (zipped or plain shapefiles, spreadsheets with WKT geometry).
+
+The first time a file is loaded, the parsed and reprojected GeoDataFrame is written next to it as
+<name>.<suffix>.epsg<epsg>.parquet, along with a small .json file recording the source's signature and
+content hash. Later loads memory-map the parquet file and read only the requested columns. The sidecar
+is rebuilt when the source's mtime/size changes and its content hash no longer matches.
+
+pyarrow is optional: without it, ReadSidecar always misses and WriteSidecar does nothing.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+import geopandas as gpd
+
+from filesig import ReplaceAtomically, SourceSignature, shapefile_sidecars
+
+try:
+	import pyarrow.parquet as pq
+except ImportError:
+	pq = None
+
+
+def SidecarPath(in_file, epsg, kwargs={}):
+	"""
+	Return the path of the parquet sidecar for `in_file` loaded in `epsg` with the given reader kwargs.
+	"""
+	in_file = Path(in_file)
+	tag = ""
+	if kwargs:
+		tag = "." + hashlib.sha1(repr(sorted(kwargs.items())).encode("utf-8")).hexdigest()[:8]
+	return in_file.with_name(f"{in_file.name}.epsg{epsg}{tag}.parquet")
+
+
+def FileHash(in_file, block_size=2**20):
+	"""Return the sha256 of a data file and, for a shapefile, its sidecar files."""
+	in_file = Path(in_file)
+	if in_file.suffix.lower() == ".shp":
+		files = [in_file.with_suffix(sfx) for sfx in shapefile_sidecars]
+	else:
+		files = [in_file]
+	h = hashlib.sha256()
+	for f in files:
+		if f.exists():
+			with f.open("rb") as fp:
+				while block := fp.read(block_size):
+					h.update(block)
+	return h.hexdigest()
+
+
+def _Signature(in_file):
+	### round trip through json so it compares equal to what was stored
+	return json.loads(json.dumps(SourceSignature(in_file)))
+
+
+def ReadSidecar(in_file, epsg, columns=None, kwargs={}):
+	"""
+	Return the GeoDataFrame cached in the sidecar of `in_file`, or None if there is no up-to-date sidecar.
+
+	Parameters:
+	- in_file (str or Path): The source data file.
+	- epsg (int): The EPSG code the data was loaded in.
+	- columns (list): The attribute columns to read, or None for all of them.
+	- kwargs (dict): The reader kwargs the data was loaded with.
+	"""
+	if pq is None:
+		return None
+	sidecar = SidecarPath(in_file, epsg, kwargs)
+	meta_file = sidecar.with_suffix(".json")
+	if not sidecar.exists() or not meta_file.exists():
+		return None
+	with meta_file.open() as f:
+		meta = json.load(f)
+
+	signature = _Signature(in_file)
+	if meta.get("signature") != signature:
+		# The file was touched or copied; only a change in content invalidates the sidecar
+		if meta.get("hash") != FileHash(in_file):
+			return None
+		meta["signature"] = signature
+		with ReplaceAtomically(meta_file, "w") as f:
+			json.dump(meta, f)
+
+	if columns is not None:
+		columns = list(dict.fromkeys([*columns, meta["geometry"]]))
+	return gpd.read_parquet(sidecar, columns=columns, memory_map=True)
+
+
+def WriteSidecar(gdf, in_file, epsg, kwargs={}):
+	"""
+	Write `gdf`, as loaded from `in_file` in `epsg`, to its parquet sidecar.
+	Returns the sidecar path, or None if pyarrow is not installed or the sidecar could not be written.
+	"""
+	if pq is None:
+		return None
+	sidecar = SidecarPath(in_file, epsg, kwargs)
+	meta = {
+		"source": str(in_file),
+		"signature": _Signature(in_file),
+		"hash": FileHash(in_file),
+		"geometry": gdf.geometry.name,
+	}
+	### the .json marks the sidecar as complete: it is removed first and written last, and each file is
+	### renamed into place whole, so a crash or a concurrent reader never pairs a .json with a partial parquet
+	meta_file = sidecar.with_suffix(".json")
+	try:
+		meta_file.unlink(missing_ok=True)
+		with ReplaceAtomically(sidecar, None) as tmp_path:
+			gdf.to_parquet(tmp_path)
+		with ReplaceAtomically(meta_file, "w") as f:
+			json.dump(meta, f)
+	except (OSError, ValueError, TypeError) as e:
+		print("Could not write parquet sidecar", sidecar, "--", e)
+		sidecar.unlink(missing_ok=True)
+		return None
+	return sidecar
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import pathlib
+import tempfile
+import threading
+import unittest
+
+import geopandas as gpd
+import shapely
+
+from benchmarktools import MakeSyntheticWardGrid
+import crosswalk
+from crosswalk import BuildCrosswalk, BuildCrosswalkFromFiles, GetWardDistricts, GetWardsInDistrict, ApportionToDistricts
+import overlapmatrix
+from overlapmatrix import BuildOverlapMatrix, GetOverlapMatrix, OverlapMatrix
+import sidecarcache
+
+wards_gdf = MakeSyntheticWardGrid(6, 8)
+
+### two districts splitting the wards along a line that cuts through a column of wards
+x0, y0, x1, y1 = wards_gdf.total_bounds
+xm = x0 + (x1 - x0) * 0.37
+districts_gdf = gpd.GeoDataFrame(
+    {'DISTRICT': [1, 2]},
+    geometry=[shapely.box(x0 - 1, y0 - 1, xm, y1 + 1), shapely.box(xm, y0 - 1, x1 + 1, y1 + 1)],
+    crs=wards_gdf.crs)
+
+"""
+1. open a Windows PowerShell terminal
+2. usage: 'python -m unittest test_crosswalk.py'
+"""
+class TestCrosswalk(unittest.TestCase):
+
+    def test_FractionsMatchOverlay(self):
+        xwalk = BuildCrosswalk(wards_gdf, {'assembly': (districts_gdf, 'DISTRICT')})
+        overlay = gpd.overlay(wards_gdf.to_crs('epsg:6933'), districts_gdf.to_crs('epsg:6933'))
+        ward_areas = wards_gdf.to_crs('epsg:6933').set_index('GEOID').area
+        overlay['fraction'] = overlay.area / overlay['GEOID'].map(ward_areas)
+        overlay = overlay[overlay['fraction'] >= 1e-4].sort_values(['GEOID', 'DISTRICT'])
+        df = xwalk.loc['assembly'].reset_index()
+        self.assertEqual(list(df['GEOID'].astype(str)), list(overlay['GEOID']))
+        self.assertEqual(list(df['district'].astype(str)), list(overlay['DISTRICT'].astype(str)))
+        self.assertTrue((abs(df['fraction'].to_numpy() - overlay['fraction'].to_numpy()) < 1e-6).all())
+
+    def test_MembershipAndApportionment(self):
+        xwalk = BuildCrosswalk(wards_gdf, {'assembly': (districts_gdf, 'DISTRICT')})
+        membership = GetWardDistricts(xwalk, 'assembly')
+        self.assertEqual(len(membership), len(wards_gdf))
+        split = GetWardsInDistrict(xwalk, 'assembly', 2)
+        self.assertTrue((split['fraction'] < 1).any())
+        totals = ApportionToDistricts(xwalk, wards_gdf, 'assembly', ['PERSONS'])
+        self.assertAlmostEqual(totals['PERSONS'].sum(), wards_gdf['PERSONS'].sum(), places=2)
+
+    def test_BuildFromFilesOncePerVintage(self):
+        out_name = 'crosswalk.parquet' if sidecarcache.pq is not None else 'crosswalk.csv.gz'
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            wards_gdf.to_file(d / 'wards.shp')
+            districts_gdf.to_file(d / 'districts.shp')
+            district_files = {'assembly': (d / 'districts.shp', 'DISTRICT')}
+            first = BuildCrosswalkFromFiles(d / 'wards.shp', district_files, d / out_name)
+            written = (d / out_name).stat().st_mtime_ns
+            ### an unchanged file is not hashed again
+            hashed = []
+            file_hash, crosswalk.FileHash = crosswalk.FileHash, lambda path: hashed.append(path) or file_hash(path)
+            try:
+                second = BuildCrosswalkFromFiles(d / 'wards.shp', district_files, d / out_name)
+            finally:
+                crosswalk.FileHash = file_hash
+            self.assertEqual(hashed, [])
+            self.assertEqual((d / out_name).stat().st_mtime_ns, written)
+            self.assertTrue(first.equals(second))
+            districts_gdf.iloc[:1].to_file(d / 'districts.shp')
+            third = BuildCrosswalkFromFiles(d / 'wards.shp', district_files, d / out_name)
+            self.assertEqual(set(third['district'].astype(str)), {'1'})
+
+    def test_OverlapMatrixApportionsLikeCrosswalk(self):
+        xwalk = BuildCrosswalk(wards_gdf, {'assembly': (districts_gdf, 'DISTRICT')})
+        columns = ['PERSONS', 'PERSONS18', 'HISPANIC18']
+        expected = ApportionToDistricts(xwalk, wards_gdf, 'assembly', columns)
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            wards_gdf.to_file(d / 'wards.shp')
+            districts_gdf.to_file(d / 'districts.shp')
+            built = GetOverlapMatrix(d / 'wards.shp', d / 'districts.shp', 'GEOID', 'DISTRICT', cache_dir=d)
+            [npz] = d.glob('*.npz')
+            stored = OverlapMatrix.load(npz)
+            ### files of the same name in two vintages are stored apart
+            for vintage in ['2022', '2024']:
+                (d / vintage).mkdir()
+                wards_gdf.to_file(d / vintage / 'wards.shp')
+                GetOverlapMatrix(d / vintage / 'wards.shp', d / 'districts.shp', 'GEOID', 'DISTRICT', cache_dir=d)
+            self.assertEqual(len(list(d.glob('*.npz'))), 3)
+        for overlaps in [built, stored, BuildOverlapMatrix(wards_gdf, districts_gdf, 'GEOID', 'DISTRICT')]:
+            totals = overlaps.apportion(wards_gdf, columns, source_id='GEOID')
+            self.assertEqual(list(totals.index), ['1', '2'])
+            self.assertTrue(((totals - expected.loc[totals.index]).abs() < 1e-3).all().all())
+        shares = built.mean(wards_gdf.assign(ONE=1.0), ['ONE'], source_id='GEOID')
+        self.assertTrue((abs(shares['ONE'] - 1) < 1e-9).all())
+
+    def test_OverlapMatrixBuiltOnceAcrossThreads(self):
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            wards_gdf.to_file(d / 'wards.shp')
+            districts_gdf.to_file(d / 'districts.shp')
+            args = (d / 'wards.shp', d / 'districts.shp', 'GEOID', 'DISTRICT')
+            built, hashed, results = [], [], []
+            build, overlapmatrix.BuildOverlapMatrix = overlapmatrix.BuildOverlapMatrix, lambda *a: built.append(1) or build(*a)
+            file_hash, crosswalk.FileHash = crosswalk.FileHash, lambda path: hashed.append(path) or file_hash(path)
+            try:
+                threads = [threading.Thread(target=lambda: results.append(GetOverlapMatrix(*args, cache_dir=d))) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                ### a stored matrix is checked against files hashed once per change, not once per call
+                overlapmatrix._loaded.clear()
+                GetOverlapMatrix(*args, cache_dir=d)
+            finally:
+                overlapmatrix.BuildOverlapMatrix = build
+                crosswalk.FileHash = file_hash
+            self.assertEqual(len(built), 1)
+            self.assertEqual(len(hashed), 2)
+            self.assertEqual(len(results), 8)
+            self.assertTrue(all(result is results[0] for result in results))
+            self.assertEqual(sorted(p.suffix for p in d.iterdir() if p.name.startswith(('overlap_', '.overlap_'))), ['.json', '.npz'])
+
+
+if __name__ == '__main__':
+    unittest.main()
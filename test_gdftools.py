@@ -0,0 +1,716 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+import unittest
+
+from benchmarktools import MakeSyntheticWardGrid, MakeSyntheticBounds, _LegacyConvertGDFtoGJSN, _LegacyClipGDFToBounds
+from benchmarktools import _LegacyComputeRegionCentroids, MakeSyntheticPoints, _LegacyLocatePoints
+from benchmarktools import MakeSyntheticVAPFrame, _LegacyAddVAPPercentages, _LegacyGetCityInCounty
+import benchmarktools
+from gdftools import ConvertGDFtoGJSN, StreamGDFtoGJSN, GetWardsInState, InitializeGeoDataFrames
+from gdftools import ClipGDFToBounds, GetBoundedGeometry, TrimGDFToBounds, ComputeRegionCentroids
+from gdftools import GetWardDataFromList, ConvertGDFtoTopoJSON, GetCityInCounty, ConvertDFToGDF
+from gdftools import GetTargetWardsInCounty, GetPassiveWardsInCounty, GetCountyBounds
+from gdftools import AddVAPPercentages, GetWardDataForCounty, GetDistrictsInBounds, GetDistrictsInBoundsConcurrently, GetDistrictsInBoundsAsync
+from topojsontools import DecodeTopology, EncodeTopology
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+import layercache
+from layercache import LayerCache, layer_cache
+import pointlocator
+from pointlocator import LocatePoints
+import lodpyramid
+from lodpyramid import GetLODPyramid, GetGJSNForZoom, ZoomPrecision
+from vectortiles import TileCache, TilesInBounds, DecodeTile
+import countybatch
+from countybatch import BuildCountyArtifacts, ComputeCountySummaries
+from ratiotools import RoundLikeFormat, AddRatioColumns
+from compactframes import CompactFrame, ExpandFrame, CompareMemory
+import outlinecache
+import geometrystore
+import instrumentation
+from geometrycodec import DecodeGeometries, EncodeGeometries, GeometryFrame
+from payloadtools import BuildChoroplethPayload, EncodeAttributeTable, PayloadSizes
+import geometryrepair
+from geometryrepair import RepairLayer, GetRepairLog
+from layerwatch import LayerWatcher
+import gdftools
+import sidecarcache
+from sidecarcache import SidecarPath
+
+wards_gdf = MakeSyntheticWardGrid(6, 8)
+
+tmp_dir = tempfile.TemporaryDirectory()
+wards_file = pathlib.Path(tmp_dir.name) / 'wards.shp'
+wards_gdf.to_file(wards_file)
+
+"""
+1. open a Windows PowerShell terminal
+2. usage: 'python -m unittest test_gdftools.py'
+"""
+class TestGDFTools(unittest.TestCase):
+
+    def test_ConvertGDFtoGJSNMatchesFileRoundTrip(self):
+        self.assertEqual(ConvertGDFtoGJSN(wards_gdf), _LegacyConvertGDFtoGJSN(wards_gdf))
+
+    def test_ConvertGDFtoGJSNProjectedCrs(self):
+        gdf = wards_gdf.to_crs('epsg:3070')
+        self.assertEqual(ConvertGDFtoGJSN(gdf), _LegacyConvertGDFtoGJSN(gdf))
+
+    def test_ConvertGDFtoGJSNGeometryOnly(self):
+        gdf = wards_gdf[['geometry']]
+        self.assertEqual(len(ConvertGDFtoGJSN(gdf)['features']), len(gdf))
+        self.assertEqual(ConvertGDFtoGJSN(gdf), _LegacyConvertGDFtoGJSN(gdf))
+
+    def test_ConvertGDFtoGJSNWritesDatesAsISO(self):
+        gdf = wards_gdf[['GEOID', 'geometry']].head(3).assign(
+            updated=pd.to_datetime(['2024-01-02 03:04:05', '2024-01-02 03:04:05.250', None], format='ISO8601'))
+        properties = [f['properties'] for f in ConvertGDFtoGJSN(gdf)['features']]
+        self.assertEqual([p['updated'] for p in properties], ['2024-01-02T03:04:05', '2024-01-02T03:04:05.250', None])
+        self.assertEqual(ConvertGDFtoGJSN(gdf), _LegacyConvertGDFtoGJSN(gdf))
+
+    def test_StreamGDFtoGJSN(self):
+        stream = b''.join(StreamGDFtoGJSN(wards_gdf, chunk_size=7))
+        self.assertEqual(json.loads(stream), ConvertGDFtoGJSN(wards_gdf))
+
+    def test_LayerCacheHitsAndMisses(self):
+        cache = LayerCache()
+        gdf = cache.read(wards_file)
+        gdf['GEOID'] = 'changed'
+        again = cache.read(wards_file)
+        self.assertEqual(cache.stats()['misses'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertTrue((again['GEOID'] != 'changed').all())
+
+    def test_LayerCacheKeysOnBboxAndColumns(self):
+        cache = LayerCache()
+        cache.read(wards_file)
+        subset = cache.read(wards_file, columns=['GEOID', 'CNTY_NAME'])
+        cache.read(wards_file, bbox=tuple(wards_gdf.iloc[:2].total_bounds))
+        self.assertEqual(list(subset.columns), ['GEOID', 'CNTY_NAME', 'geometry'])
+        self.assertEqual(cache.stats()['misses'], 3)
+
+    def test_LayerCacheRereadsChangedFile(self):
+        cache = LayerCache()
+        cache.read(wards_file)
+        st = os.stat(wards_file.with_suffix('.dbf'))
+        os.utime(wards_file.with_suffix('.dbf'), ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        cache.read(wards_file)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['layers'], 1)
+
+    def test_LayerCacheEvictsLeastRecentlyUsed(self):
+        cache = LayerCache(max_layers=2)
+        cache.read(wards_file, columns=['GEOID'])
+        cache.read(wards_file, columns=['LABEL'])
+        cache.read(wards_file, columns=['GEOID'])
+        cache.read(wards_file, columns=['CTV'])
+        cache.read(wards_file, columns=['GEOID'])
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_LayerCacheWherePushdownMatchesFilter(self):
+        cache = LayerCache()
+        full = gpd.read_file(wards_file)
+        expected = full.loc[full['MCD_NAME'].isin(['Adams', 'Adams 2'])]
+        result = cache.read(wards_file, where={'MCD_NAME': ['Adams', 'Adams 2']})
+        self.assertEqual(list(result.index), list(expected.index))
+        self.assertEqual(list(result.columns), list(expected.columns))
+        self.assertEqual(len(cache.read(wards_file, where={'MCD_NAME': 'adams'})), 0)
+        subset = cache.read(wards_file, where={'MCD_NAME': 'Adams'}, columns=['GEOID'])
+        self.assertEqual(list(subset.columns), ['GEOID', 'geometry'])
+        self.assertEqual(cache.stats()['misses'], 3)
+
+    def test_GetWardDataFromListReadsOnlyListedCounties(self):
+        headers = ['GEOID', 'CNTY_NAME', 'MCD_NAME', 'CTV', 'WARDID']
+        gdf = GetWardDataFromList(wards_file, ['Adams'], headers, ['PERSONS18'], ['geometry'])
+        self.assertEqual(len(gdf), (wards_gdf['CNTY_NAME'] == 'Adams').sum())
+        self.assertEqual(list(gdf.columns), [*headers, 'VAP', 'geometry', 'id', 'z_layer'])
+        empty = GetWardDataFromList(wards_file, [], headers, ['PERSONS18'], ['geometry'])
+        self.assertEqual((len(empty), list(empty.columns)), (0, list(gdf.columns)))
+        self.assertEqual(layercache.WhereToSQL({'CNTY_NAME': [], 'WARDID': [np.int64(5), "O'Neil"]}),
+                         '1=0 AND "WARDID" IN (5, \'O\'\'Neil\')')
+
+    def test_GetWardsInStateUsesLayerCache(self):
+        layer_cache.invalidate()
+        hits = layer_cache.stats()['hits']
+        [first, _] = GetWardsInState(wards_file)
+        [second, _] = GetWardsInState(wards_file)
+        self.assertEqual(layer_cache.stats()['hits'], hits + 1)
+        self.assertEqual(list(first['GEOID']), list(second['GEOID']))
+
+    @unittest.skipIf(sidecarcache.pq is None, 'pyarrow is not installed')
+    def test_InitializeGeoDataFramesWritesAndReadsSidecar(self):
+        with tempfile.TemporaryDirectory() as d:
+            wards_gdf.to_file(pathlib.Path(d) / 'wards.shp')
+            first = InitializeGeoDataFrames(d + '/', 'wards.shp', epsg=3070, remote_file=False)
+            sidecar = SidecarPath(pathlib.Path(d) / 'wards.shp', 3070)
+            self.assertTrue(sidecar.exists())
+            second = InitializeGeoDataFrames(d + '/', 'wards.shp', epsg=3070, remote_file=False, columns=['GEOID'])
+            self.assertEqual(list(second.columns), ['GEOID', 'geometry'])
+            self.assertEqual(second.crs.to_epsg(), 3070)
+            self.assertTrue(second.geometry.geom_equals_exact(first.geometry, 1e-6).all())
+
+    @unittest.skipIf(sidecarcache.pq is None, 'pyarrow is not installed')
+    def test_SidecarRebuiltOnlyWhenContentChanges(self):
+        with tempfile.TemporaryDirectory() as d:
+            shp = pathlib.Path(d) / 'wards.shp'
+            wards_gdf.to_file(shp)
+            InitializeGeoDataFrames(d + '/', 'wards.shp', remote_file=False)
+            sidecar = SidecarPath(shp, 4326)
+            written = sidecar.stat().st_mtime_ns
+            st = os.stat(shp)
+            os.utime(shp, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            InitializeGeoDataFrames(d + '/', 'wards.shp', remote_file=False)
+            self.assertEqual(sidecar.stat().st_mtime_ns, written)
+            wards_gdf.iloc[:5].to_file(shp)
+            gdf = InitializeGeoDataFrames(d + '/', 'wards.shp', remote_file=False)
+            self.assertEqual(len(gdf), 5)
+
+    @unittest.skipIf(sidecarcache.pq is None, 'pyarrow is not installed')
+    def test_InterruptedSidecarWriteLeavesNoSidecar(self):
+        with tempfile.TemporaryDirectory() as d:
+            shp = pathlib.Path(d) / 'wards.shp'
+            wards_gdf.to_file(shp)
+            sidecarcache.WriteSidecar(wards_gdf, shp, 4326)
+            wards_gdf.iloc[:5].to_file(shp)
+
+            def partial_write(gdf, path, *args, **kwargs):
+                pathlib.Path(path).write_bytes(b'PAR1')
+                raise OSError('disk full')
+            to_parquet, gpd.GeoDataFrame.to_parquet = gpd.GeoDataFrame.to_parquet, partial_write
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertIsNone(sidecarcache.WriteSidecar(wards_gdf.iloc[:5], shp, 4326))
+            finally:
+                gpd.GeoDataFrame.to_parquet = to_parquet
+            self.assertIsNone(sidecarcache.ReadSidecar(shp, 4326))
+            self.assertEqual([p.name for p in pathlib.Path(d).iterdir() if 'parquet' in p.name or p.suffix == '.json'], [])
+
+    def test_ClipGDFToBoundsMatchesOverlay(self):
+        bounds = MakeSyntheticBounds(wards_gdf, 'Adams', -0.8)
+        expected = _LegacyClipGDFToBounds(wards_gdf, bounds, 1.0)
+        result = ClipGDFToBounds(wards_gdf, bounds, 1.0)
+        self.assertEqual(list(result.columns), list(expected.columns))
+        self.assertEqual(list(result.index), list(expected.index))
+        self.assertTrue(result.drop(columns='geometry').round(6).equals(expected.drop(columns='geometry').round(6)))
+        self.assertTrue(result.geometry.geom_equals(expected.geometry).all())
+
+    def test_ClipGDFToBoundsIsSafeAcrossThreads(self):
+        with tempfile.TemporaryDirectory() as d:
+            counties = pathlib.Path(d) / 'counties.shp'
+            wards_gdf.dissolve('CNTY_NAME').reset_index().rename(columns={'CNTY_NAME': 'COUNTY_NAM'})[['COUNTY_NAM', 'geometry']].to_file(counties)
+            county_name = wards_gdf['CNTY_NAME'].iloc[0]
+            [bounds, _, _] = GetCountyBounds(counties, county_name)
+            expected = ClipGDFToBounds(wards_gdf, bounds)
+            ### the cached bounds are shared by every caller, so clipping must not prepare them in place
+            self.assertFalse(shapely.is_prepared(layercache.ReadLayer(counties).geometry.values).any())
+            results, errors = [], []
+
+            def clip():
+                try:
+                    for _ in range(10):
+                        [bounds, _, _] = GetCountyBounds(counties, county_name)
+                        results.append(ClipGDFToBounds(wards_gdf, bounds))
+                except Exception as e:
+                    errors.append(e)
+            threads = [threading.Thread(target=clip) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 80)
+        self.assertTrue(all(result.equals(expected) for result in results))
+
+    def test_GetBoundedGeometryContract(self):
+        bounds = MakeSyntheticBounds(wards_gdf, 'Adams', -0.8)
+        [focal_point, gdf] = GetBoundedGeometry(wards_gdf.copy(), bounds)
+        self.assertEqual(len(focal_point), 2)
+        self.assertIn('lat', gdf.columns)
+        [gdf, gjsn] = TrimGDFToBounds(gdf.assign(id=gdf['GEOID'], z_layer=0), bounds)
+        self.assertEqual(len(gjsn['features']), len(gdf))
+
+    def test_ComputeRegionCentroidsMatchesOriginal(self):
+        gdf = wards_gdf.to_crs('epsg:3070')
+        [expected_focal_point, expected] = _LegacyComputeRegionCentroids(gdf)
+        [focal_point, result] = ComputeRegionCentroids(gdf)
+        self.assertEqual(list(result.columns), list(expected.columns))
+        self.assertEqual(result.crs.to_epsg(), 4326)
+        self.assertTrue(((result['lat'] - expected['lat']).abs() < 1e-9).all())
+        self.assertTrue(((result['lon'] - expected['lon']).abs() < 1e-9).all())
+        self.assertAlmostEqual(focal_point[0], expected_focal_point[0], places=9)
+        self.assertAlmostEqual(focal_point[1], expected_focal_point[1], places=9)
+
+    def test_ComputeRegionCentroidsCacheReturnsCopies(self):
+        [_, first] = ComputeRegionCentroids(wards_gdf)
+        first['lat'] = 0.0
+        [_, second] = ComputeRegionCentroids(wards_gdf)
+        self.assertTrue((second['lat'] > 40).all())
+        self.assertNotIn('lat', wards_gdf.columns)
+
+    def test_LocatePointsMatchesSpatialJoin(self):
+        points = MakeSyntheticPoints(5000, tuple(wards_gdf.total_bounds))
+        points.loc[:2, 'latitude'] = float('nan')
+        expected = _LegacyLocatePoints(points, wards_gdf, ['GEOID'])
+        result = LocatePoints(points, wards_gdf.to_crs('epsg:3070'), {'GEOID': 'WARD'})
+        self.assertEqual(list(result.columns), ['VANID', 'latitude', 'longitude', 'WARD'])
+        self.assertTrue(result['WARD'].fillna('').equals(expected['GEOID'].fillna('')))
+        self.assertTrue(result['WARD'].iloc[:3].isna().all())
+        ### an empty layer leaves every point unassigned
+        empty = LocatePoints(points.iloc[:10], wards_gdf.iloc[:0], {'GEOID': 'WARD'})
+        self.assertEqual(len(empty), 10)
+        self.assertTrue(empty['WARD'].isna().all())
+
+    def test_LocatePointsCachesLocatorPerLayer(self):
+        pointlocator._locator_cache.clear()
+        points = MakeSyntheticPoints(100, tuple(wards_gdf.total_bounds))
+        LocatePoints(points, wards_gdf)
+        LocatePoints(points.iloc[:10], wards_gdf.copy())
+        self.assertEqual(len(pointlocator._locator_cache), 1)
+        ### a hit on the same frame does not hash its coordinates again
+        calls = []
+        digest, gdftools._GeometryDigest = gdftools._GeometryDigest, lambda geoms: calls.append(1) or digest(geoms)
+        try:
+            LocatePoints(points, wards_gdf)
+        finally:
+            gdftools._GeometryDigest = digest
+        self.assertEqual(calls, [])
+
+    def test_LocatePointsBuildsOneLocatorAcrossThreads(self):
+        pointlocator._locator_cache.clear()
+        points = MakeSyntheticPoints(1000, tuple(wards_gdf.total_bounds))
+        expected = LocatePoints(points, wards_gdf)
+        pointlocator._locator_cache.clear()
+        built, results = [], []
+        locator_class = pointlocator.PointLocator
+
+        class CountingLocator(locator_class):
+            def __init__(self, *args, **kwargs):
+                built.append(1)
+                super().__init__(*args, **kwargs)
+        pointlocator.PointLocator = CountingLocator
+        try:
+            threads = [threading.Thread(target=lambda: results.append(LocatePoints(points, wards_gdf))) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            pointlocator.PointLocator = locator_class
+        self.assertEqual(len(built), 1)
+        self.assertEqual(len(results), 8)
+        self.assertTrue(all(result.equals(expected) for result in results))
+        ### the layer's own geometry objects are left unprepared for the other readers of the layer
+        self.assertFalse(shapely.is_prepared(wards_gdf.geometry.values).any())
+
+    def test_GJSNForZoomIsSimplifiedAndValid(self):
+        full = ConvertGDFtoGJSN(wards_gdf)
+        self.assertEqual(GetGJSNForZoom(wards_gdf, None), full)
+        coarse = GetGJSNForZoom(wards_gdf.to_crs('epsg:3070'), 7)
+        self.assertEqual(len(coarse['features']), len(full['features']))
+        self.assertEqual(coarse['features'][0]['properties'], full['features'][0]['properties'])
+        self.assertLess(len(json.dumps(coarse)), len(json.dumps(full)))
+        ring = coarse['features'][0]['geometry']['coordinates'][0]
+        self.assertTrue(all(round(c, ZoomPrecision(8)) == c for c in ring[0]))
+        pyramid = GetLODPyramid(wards_gdf)
+        self.assertTrue(all(shapely.is_valid(pyramid.geometry(z)).all() for z in pyramid.levels))
+        self.assertIs(GetLODPyramid(wards_gdf.copy()), pyramid)
+        ### a hit on the same frame neither hashes its coordinates nor reprojects it
+        projected = wards_gdf.to_crs('epsg:3070')
+        projected_pyramid = GetLODPyramid(projected)
+        calls = []
+        digest, gdftools._GeometryDigest = gdftools._GeometryDigest, lambda geoms: calls.append(1) or digest(geoms)
+        to_world, lodpyramid._ToWorldCrs = lodpyramid._ToWorldCrs, lambda gdf: calls.append(1) or to_world(gdf)
+        try:
+            self.assertIs(GetLODPyramid(projected), projected_pyramid)
+        finally:
+            gdftools._GeometryDigest = digest
+            lodpyramid._ToWorldCrs = to_world
+        self.assertEqual(calls, [])
+
+    def test_TopoJSONRoundTrip(self):
+        gdf = wards_gdf[['GEOID', 'PERSONS', 'geometry']]
+        topo = ConvertGDFtoTopoJSON(gdf)
+        self.assertLess(len(json.dumps(topo)), len(json.dumps(ConvertGDFtoGJSN(gdf))))
+        decoded = DecodeTopology(json.dumps(topo))
+        self.assertEqual([f['properties'] for f in decoded['features']],
+                         [f['properties'] for f in ConvertGDFtoGJSN(gdf)['features']])
+        result = gpd.GeoDataFrame.from_features(decoded['features'], crs=gdf.crs)
+        step = max(topo['transform']['scale'])
+        self.assertTrue((shapely.hausdorff_distance(result.geometry.values, gdf.geometry.values) < step).all())
+        self.assertTrue(shapely.is_valid(result.geometry.values).all())
+
+        ### rings smaller than a grid step collapse and are left out rather than written degenerate
+        holey = shapely.Polygon(shapely.box(100, 0, 200, 100).exterior.coords, [shapely.box(150, 50, 150.0001, 50.0001).exterior.coords])
+        tiny = shapely.box(50, 150, 50.00001, 150.00001)
+        decoded = DecodeTopology(EncodeTopology([shapely.box(0, 0, 100, 100), holey, tiny], quantization=1000))
+        geometries = [f['geometry'] for f in decoded['features']]
+        self.assertEqual([len(g['coordinates']) for g in geometries[:2]], [1, 1])
+        self.assertIsNone(geometries[2])
+
+    def test_VectorTilesCoverLayerAndInvalidate(self):
+        gdf = wards_gdf[['GEOID', 'PERSONS', 'geometry']]
+        with tempfile.TemporaryDirectory() as d:
+            cache = TileCache(pathlib.Path(d) / 'wards.mbtiles', gdf, layer_name='wards')
+            seen = {}
+            for x, y in TilesInBounds(8, cache.layer.bounds):
+                for feature in DecodeTile(cache.tile(8, x, y)).get('wards', []):
+                    seen[feature['id']] = feature['properties']
+                    self.assertTrue(shapely.Polygon(feature['rings'][0]).is_valid)
+            self.assertEqual(sorted(seen), list(range(len(gdf))))
+            self.assertEqual(seen[0], {'GEOID': gdf['GEOID'].iloc[0], 'PERSONS': int(gdf['PERSONS'].iloc[0])})
+            cache.tile(8, *TilesInBounds(8, cache.layer.bounds)[0])
+            self.assertEqual(cache.stats()['hits'], 1)
+            cache.close()
+            reopened = TileCache(pathlib.Path(d) / 'wards.mbtiles', gdf, layer_name='wards')
+            self.assertGreater(reopened.stats()['tiles'], 0)
+            reopened.close()
+            changed = TileCache(pathlib.Path(d) / 'wards.mbtiles', gdf.iloc[:5], layer_name='wards')
+            self.assertEqual(changed.stats()['tiles'], 0)
+            changed.close()
+
+    def test_ConcurrentDistrictLoaderMatchesSequential(self):
+        bounds = MakeSyntheticBounds(wards_gdf, county_name=wards_gdf['CNTY_NAME'].iloc[0])
+        specs = [(wards_file, 'GEOID'), (wards_file, 'LABEL'), (pathlib.Path(tmp_dir.name) / 'missing.shp', 'GEOID')]
+        expected = [GetDistrictsInBounds(datafile, column, bounds) for datafile, column in specs]
+        results = GetDistrictsInBoundsConcurrently(specs, bounds, max_workers=2)
+        self.assertIsNone(results[2])
+        for (gdf, gjsn), (expected_gdf, expected_gjsn) in zip(results[:2], expected[:2]):
+            self.assertTrue(gdf.equals(expected_gdf))
+            self.assertEqual(gjsn, expected_gjsn)
+
+        async def collect():
+            return [item async for item in GetDistrictsInBoundsAsync(specs, bounds, max_workers=2)]
+        completed = dict(asyncio.run(collect()))
+        self.assertEqual(sorted(completed), [0, 1, 2])
+        self.assertEqual(completed[1][1], expected[1][1])
+        ### the loader threads never prepare the caller's bounds
+        fresh = MakeSyntheticBounds(wards_gdf, county_name=wards_gdf['CNTY_NAME'].iloc[0])
+        GetDistrictsInBoundsConcurrently(specs, fresh, max_workers=2)
+        self.assertFalse(shapely.is_prepared(fresh.geometry.values).any())
+
+    def test_CountyArtifactsMatchPerCountyAndSkipUnchanged(self):
+        counties = ['Adams', 'Ashland', 'Barron']
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            MakeSyntheticWardGrid(9, 36).to_file(d / 'wards.shp')
+            headers = ['GEOID', 'CNTY_FIPS', 'CNTY_NAME', 'MCD_NAME', 'CTV', 'WARDID']
+            numeric = ['PERSONS18', 'WHITE18', 'BLACK18', 'HISPANIC18', 'ASIAN18']
+            counties_gdf = GetWardDataFromList(d / 'wards.shp', counties, headers, numeric, ['geometry'])
+            summaries = ComputeCountySummaries(counties_gdf)
+            for county in counties:
+                [cutoff, id_list, ward_list, pop_list, focal_point, gdf, _] = GetWardDataForCounty(counties_gdf, county)
+                self.assertEqual(summaries.loc[county, 'target_ward_cutoff'], cutoff)
+                self.assertEqual(summaries.loc[county, ['id_list', 'ward_list', 'pop_list']].tolist(), [id_list, ward_list, pop_list])
+                self.assertAlmostEqual(summaries.loc[county, 'focal_point_lat'], focal_point[0])
+
+            ### the centroids of the wards are computed once, for the summaries and the files alike
+            centroid_calls = []
+            centroids, countybatch.ComputeRegionCentroids = countybatch.ComputeRegionCentroids, lambda gdf: centroid_calls.append(1) or centroids(gdf)
+            try:
+                built = BuildCountyArtifacts(counties_gdf, counties, d / 'static', formats=('geojson',), max_workers=1)
+            finally:
+                countybatch.ComputeRegionCentroids = centroids
+            self.assertEqual(len(centroid_calls), 1)
+            self.assertEqual(list(built['status']), ['built'] * 3)
+            self.assertTrue(built.drop(columns='status').equals(summaries))
+            self.assertEqual([p.name for p in (d / 'static').iterdir() if p.suffix == '.tmp'], [])
+            written = gpd.read_file(d / 'static' / 'Barron_population.geojson')
+            self.assertEqual(list(written['GEOID']), list(gdf['GEOID']))
+            self.assertEqual(list(written['LatinxVAPPct']), list(gdf['LatinxVAPPct']))
+            self.assertEqual(list(BuildCountyArtifacts(counties_gdf, counties, d / 'static', formats=('geojson',), max_workers=1)['status']), ['skipped'] * 3)
+            counties_gdf.loc[counties_gdf['CNTY_NAME'] == 'Ashland', 'LatinxVAP'] += 1
+            rebuilt = BuildCountyArtifacts(counties_gdf, counties, d / 'static', formats=('geojson',), max_workers=1)
+            self.assertEqual(list(rebuilt['status']), ['skipped', 'built', 'skipped'])
+
+    def test_VAPPercentagesMatchStringFormatRounding(self):
+        df = MakeSyntheticVAPFrame(5000)
+        self.assertTrue(AddVAPPercentages(df).equals(_LegacyAddVAPPercentages(df)))
+        values = [0.125, 0.135, 1.005, 2.675, -0.125, 0.285, 1 / 3, 5e-3]
+        for decimals in [0, 1, 2, 3]:
+            self.assertEqual(list(RoundLikeFormat(values, decimals)), [float(f'{v:.{decimals}f}') for v in values])
+        ratios = AddRatioColumns(df.head(3), {'BlackShare': ('BlackVAP', 'VAP')}, after=0, decimals=None)
+        self.assertEqual(list(ratios.columns), ['BlackShare', *df.columns])
+
+    def test_CompactFrameKeepsValuesAndSavesMemory(self):
+        headers = ['GEOID', 'CNTY_FIPS', 'CNTY_NAME', 'MCD_NAME', 'CTV', 'WARDID']
+        gdf = GetWardDataFromList(wards_file, ['Adams'], headers, ['PERSONS18', 'HISPANIC18'], ['geometry'])
+        compact = GetWardDataFromList(wards_file, ['Adams'], headers, ['PERSONS18', 'HISPANIC18'], ['geometry'], compact=True)
+        self.assertEqual(str(compact['CNTY_NAME'].dtype), 'category')
+        self.assertLess(compact['VAP'].dtype.itemsize, gdf['VAP'].dtype.itemsize)
+        self.assertGreater(CompareMemory(gdf, compact).loc['total', 'bytes_saved'], 0)
+        self.assertEqual(ConvertGDFtoGJSN(compact), ConvertGDFtoGJSN(gdf))
+        self.assertEqual(compact['VAP'].sum(), gdf['VAP'].sum())
+        self.assertEqual(len(compact.merge(gdf[['GEOID']], on='GEOID')), len(gdf))
+        ### each column is sized on its own total, so sums across columns need the int64 of ExpandFrame
+        counts = CompactFrame(pd.DataFrame({'a': [100, 27], 'b': [100, 27]}))
+        self.assertEqual(str(counts['a'].dtype), 'int8')
+        self.assertEqual(list(ExpandFrame(counts).eval('a + b')), [200, 54])
+        with tempfile.TemporaryDirectory() as d:
+            ExpandFrame(compact).to_file(pathlib.Path(d) / 'compact.shp')
+            self.assertEqual(list(gpd.read_file(pathlib.Path(d) / 'compact.shp')['GEOID']), list(gdf['GEOID']))
+
+    def test_CompactFrameWritesFilesFromCountyGetters(self):
+        headers = ['GEOID', 'CNTY_FIPS', 'CNTY_NAME', 'MCD_NAME', 'CTV', 'WARDID']
+        numeric = ['PERSONS18', 'WHITE18', 'BLACK18', 'HISPANIC18', 'ASIAN18']
+        compact = GetWardDataFromList(wards_file, ['Adams'], headers, numeric, ['geometry'], compact=True)
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as d:
+            os.chdir(d)
+            try:
+                os.mkdir('static')
+                if importlib.util.find_spec('openpyxl') is None:
+                    ### only the geojson and shapefile writers are under test; skip the spreadsheets
+                    for stem in ['population_data', 'population_arrays', 'targetwards', 'passivewards']:
+                        pathlib.Path(f'static/Adams_{stem}.xlsx').touch()
+                [cutoff, _, _, _, _, gdf, _] = GetWardDataForCounty(compact, 'Adams', write_files=True)
+                [targets, _] = GetTargetWardsInCounty(gdf, cutoff, write_files=True)
+                [passive, _] = GetPassiveWardsInCounty(gdf, cutoff, write_files=True)
+                for stem, written in [('population', gdf), ('targetwards', targets), ('passivewards', passive)]:
+                    for sfx in ['geojson', 'shp']:
+                        self.assertEqual(list(gpd.read_file(f'static/Adams_{stem}.{sfx}')['GEOID']), list(written['GEOID']))
+            finally:
+                os.chdir(cwd)
+
+    def test_GetCityInCountyMatchesUnionAndIsStored(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache_dir, outlinecache.outline_cache_dir = outlinecache.outline_cache_dir, pathlib.Path(d)
+            try:
+                outlinecache._outline_cache.clear()
+                for county_name, city_name in [('Adams', 'Adams'), ('Adams', 'Adams 2'), ('Adams', 'Adams 4')]:
+                    [gdf, gjsn] = GetCityInCounty(wards_gdf, county_name, city_name)
+                    [legacy_gdf, legacy_gjsn] = _LegacyGetCityInCounty(wards_gdf, county_name, city_name)
+                    self.assertEqual(list(gdf.columns), list(legacy_gdf.columns))
+                    self.assertAlmostEqual(gdf.geometry.iloc[0].symmetric_difference(legacy_gdf.geometry.iloc[0]).area, 0.0)
+                    properties, legacy_properties = gjsn['features'][0]['properties'], legacy_gjsn['features'][0]['properties']
+                    self.assertEqual(sorted(properties), sorted(legacy_properties))
+                    for key in ['lat', 'lon']:
+                        self.assertAlmostEqual(properties[key], legacy_properties[key], places=9)
+                self.assertEqual(len(list(pathlib.Path(d).iterdir())), 1)
+                outlinecache._outline_cache.clear()
+                stored = outlinecache.GetOutlineCache(wards_gdf)
+                county = stored.outline('Adams')
+                self.assertAlmostEqual(county.geometry.iloc[0].area, wards_gdf.loc[wards_gdf['CNTY_NAME'] == 'Adams'].unary_union.area)
+                self.assertTrue(GetCityInCounty(wards_gdf, 'Adams', 'Nowhere')[0].geometry.iloc[0].is_empty)
+
+                ### swapping the MCDs of two wards changes the outlines, so it must change the key
+                swapped = wards_gdf.copy()
+                rows = swapped.index[[0, len(swapped) // 2]]
+                self.assertNotEqual(*swapped.loc[rows, 'MCD_NAME'])
+                swapped.loc[rows, 'MCD_NAME'] = swapped.loc[rows[::-1], 'MCD_NAME'].to_numpy()
+                fresh = outlinecache.DissolveOutlines(swapped)
+                outlines = outlinecache.GetOutlineCache(swapped).outlines
+                self.assertIsNot(outlinecache.GetOutlineCache(swapped), stored)
+                self.assertTrue(outlines.geom_equals_exact(fresh, 1e-9).all())
+            finally:
+                outlinecache.outline_cache_dir = cache_dir
+                outlinecache._outline_cache.clear()
+
+    def test_GeometryStoreMatchesReadLayer(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = geometrystore.GetGeometryStore(wards_file, store_root=d)
+            self.assertIs(geometrystore.GetGeometryStore(wards_file, store_root=d), store)
+            self.assertFalse(store.column('PERSONS').flags.writeable)
+            bounds = tuple(wards_gdf.geometry.iloc[:10].total_bounds)
+            for kwargs in [{}, {'where': {'MCD_NAME': ['Adams', 'Adams 3']}, 'columns': ['GEOID', 'LABEL']}, {'bbox': bounds}]:
+                expected = layercache._ReadLayer(wards_file, **kwargs)
+                result = geometrystore.ReadStoredLayer(wards_file, store_root=d, **kwargs)
+                self.assertEqual(list(result.columns), list(expected.columns))
+                self.assertEqual(list(result.index), list(expected.index))
+                self.assertTrue(result.drop(columns='geometry').equals(expected.drop(columns='geometry')))
+                self.assertTrue(result.geometry.geom_equals_exact(expected.geometry, 0).all())
+
+    def test_GeometryCodecDecodesEveryEncoding(self):
+        geoms = wards_gdf.geometry.values[:4]
+        mixed = [*EncodeGeometries(geoms[:1], 'wkt'), *EncodeGeometries(geoms[1:2], 'hex'),
+                 *EncodeGeometries(geoms[2:3], 'wkb'), geoms[3], None, float('nan'), '']
+        decoded = DecodeGeometries(mixed)
+        self.assertTrue(all(shapely.equals_exact(decoded[:4], geoms, 0)))
+        self.assertEqual(list(decoded[4:]), [None, None, None])
+        df = pd.DataFrame(wards_gdf)
+        gdf = ConvertDFToGDF(df)
+        self.assertIs(df['geometry'].iloc[0], wards_gdf.geometry.iloc[0])
+        self.assertEqual(list(gdf.columns), list(df.columns))
+        self.assertTrue(gdf.geom_equals_exact(wards_gdf, 0).all())
+        hex_gdf = GeometryFrame(df.assign(geometry=EncodeGeometries(geoms.tolist() * 12, 'hex')), crs=wards_gdf.crs)
+        self.assertTrue(hex_gdf.geometry.iloc[:4].geom_equals_exact(wards_gdf.geometry.iloc[:4], 0).all())
+        self.assertEqual(hex_gdf.crs, wards_gdf.crs)
+
+    def test_ChoroplethPayloadKeepsOnlyIdInFeatures(self):
+        gdf = wards_gdf.assign(id=wards_gdf['GEOID'])
+        [gjsn, table] = BuildChoroplethPayload(gdf)
+        full = ConvertGDFtoGJSN(gdf)
+        self.assertEqual([f['properties'] for f in gjsn['features']], [{'id': i} for i in gdf['GEOID']])
+        self.assertEqual([f['geometry'] for f in gjsn['features']], [f['geometry'] for f in full['features']])
+        self.assertEqual(list(table.columns), ['id', *[c for c in gdf.columns if c not in ('id', 'geometry')]])
+        decoded = json.loads(EncodeAttributeTable(table))
+        self.assertEqual(decoded['PERSONS'], [f['properties']['PERSONS'] for f in full['features']])
+        sizes = PayloadSizes(gdf)
+        self.assertGreater(sizes['saved_bytes'], 0)
+        self.assertLess(sizes['geometry_bytes'], sizes['full_bytes'])
+
+    def test_RepairLayerFixesOnlyInvalidGeometriesOnce(self):
+        gdf = wards_gdf.copy()
+        x0, y0, x1, y1 = shapely.bounds(gdf.geometry.values[[3, 7]]).T
+        bowties = shapely.polygons([[(a, b), (c, d), (c, b), (a, d), (a, b)] for a, b, c, d in zip(x0, y0, x1, y1)])
+        gdf.loc[[3, 7], 'geometry'] = bowties
+        repaired, report = RepairLayer(gdf, source='bowties')
+        self.assertEqual(list(report['position']), [3, 7])
+        self.assertTrue(report['valid'].all())
+        self.assertEqual(set(report['type_after']), {'MultiPolygon'})
+        self.assertTrue(shapely.is_valid(repaired.geometry.values).all())
+        self.assertTrue(repaired.drop(index=[3, 7]).geom_equals_exact(wards_gdf.drop(index=[3, 7]), 0).all())
+        cached = len(geometryrepair._repairs)
+        again, _ = RepairLayer(gdf.copy())
+        self.assertEqual(len(geometryrepair._repairs), cached)
+        self.assertTrue(again.geom_equals_exact(repaired, 0).all())
+        self.assertIn('bowties', set(GetRepairLog()['source']))
+        with tempfile.TemporaryDirectory() as d:
+            gdf.to_file(pathlib.Path(d) / 'bowties.shp')
+            layercache.repair_geometries = True
+            try:
+                read = LayerCache().read(pathlib.Path(d) / 'bowties.shp')
+            finally:
+                layercache.repair_geometries = False
+            self.assertTrue(shapely.is_valid(read.geometry.values).all())
+
+    def test_LayerWatcherReloadsChangedFilesOffTheRequestPath(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = pathlib.Path(d) / 'wards.shp'
+            wards_gdf.to_file(path)
+            cache = LayerCache()
+            old = cache.read(path)
+            ComputeRegionCentroids(old)
+            old_key = gdftools._LayerFingerprint(old.geometry.values, old.crs)
+            watcher = LayerWatcher(cache)
+            self.assertEqual(watcher.check(), [])
+            os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+            self.assertEqual(watcher.check(), [])
+            self.assertEqual(cache.stats()['misses'], 1)
+
+            moved = wards_gdf.assign(geometry=wards_gdf.geometry.translate(0.01, 0))
+            moved.to_file(path)
+            served = []
+            reload = cache.reload
+            cache.reload = lambda p, prepare: reload(p, lambda o, n: (served.append(cache.read(path)), prepare(o, n)))
+            self.assertEqual(watcher.check(), [str(path.resolve())])
+            self.assertTrue(served[0].geom_equals_exact(old, 0).all())
+            new = cache.read(path)
+            self.assertTrue(new.geom_equals_exact(gpd.read_file(path), 0).all())
+            self.assertEqual(cache.stats()['misses'], 1)
+            self.assertNotIn(old_key, gdftools._centroid_cache)
+            self.assertIn(gdftools._LayerFingerprint(new.geometry.values, new.crs), gdftools._centroid_cache)
+
+    def test_BenchmarkSuiteAppendsToHistory(self):
+        blocks = benchmarktools.MakeSyntheticBlockGrid(wards_gdf)
+        self.assertAlmostEqual(shapely.area(blocks.geometry.values).sum(), shapely.area(wards_gdf.geometry.values).sum(), places=9)
+        self.assertEqual(blocks['GEOID'].str.len().unique().tolist(), [15])
+        self.assertTrue((blocks.groupby('WARDID')['PERSONS'].sum() <= wards_gdf.groupby('WARDID')['PERSONS'].sum()).all())
+        benchmarktools.benchmark_scales['test'] = {'shape': (6, 8), 'bounds': benchmarktools.milwaukee_bounds, 'districts': 3}
+        try:
+            with tempfile.TemporaryDirectory() as d:
+                history_file = pathlib.Path(d) / 'history.json'
+                first = benchmarktools.RunBenchmarkSuite(('test',), repeat=1, history_file=history_file)
+                benchmarktools.RunBenchmarkSuite(('test',), repeat=1, history_file=history_file)
+                history = benchmarktools.ReadBenchmarkHistory(history_file)
+        finally:
+            del benchmarktools.benchmark_scales['test']
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[0]['results'], json.loads(json.dumps(first['results'])))
+        self.assertEqual(set(history[1]['results']), {f'test/{name}' for name in [
+            'ConvertGDFtoGJSN', 'ComputeRegionCentroids', 'ComputeRegionCentroids (blocks)', 'GetBoundedGeometry',
+            'TrimGDFToBounds', 'GetWardDataForCounty', 'GetCityInCounty']})
+        self.assertTrue(all(r['seconds'] > 0 and r['peak_mb'] >= 0 for r in history[1]['results'].values()))
+        slower = {'results': {case: dict(r, seconds=r['seconds'] * 2 + 1) for case, r in first['results'].items()}}
+        self.assertEqual(set(benchmarktools.FindRegressions(slower, first)), set(first['results']))
+
+    def test_InstrumentationRecordsCallsRowsAndBytes(self):
+        instrumentation.ResetInstrumentation()
+        instrumentation.trace_memory = True
+        try:
+            with tempfile.TemporaryDirectory() as d:
+                wards_gdf.to_file(pathlib.Path(d) / 'wards.shp')
+                InitializeGeoDataFrames(d + '/', 'wards.shp', epsg=3070, remote_file=False, use_sidecar=False)
+                ConvertGDFtoGJSN(wards_gdf)
+                ConvertGDFtoGJSN(wards_gdf)
+                with self.assertRaises(ValueError):
+                    with instrumentation.Instrument('failing') as call:
+                        call.rows_in = 3
+                        raise ValueError()
+                shp_bytes = instrumentation.FileBytes(pathlib.Path(d) / 'wards.shp')
+        finally:
+            instrumentation.trace_memory = False
+        report = instrumentation.GetInstrumentation()
+        loads = report.loc['gdftools.InitializeGeoDataFrames']
+        self.assertEqual(loads['calls'], 1)
+        self.assertEqual(loads['rows_out'], len(wards_gdf))
+        self.assertEqual(loads['bytes_read'], shp_bytes)
+        self.assertGreater(loads['peak_bytes'], 0)
+        gjsn = report.loc['gdftools.ConvertGDFtoGJSN']
+        self.assertEqual((gjsn['calls'], gjsn['rows_in']), (2, 2 * len(wards_gdf)))
+        self.assertEqual((report.loc['failing', 'errors'], report.loc['failing', 'rows_in']), (1, 3))
+        self.assertEqual(json.loads(instrumentation.ExportJSON())['gdftools.ConvertGDFtoGJSN']['calls'], 2)
+        self.assertIn('common_calls_total{function="gdftools.ConvertGDFtoGJSN"} 2', instrumentation.ExportPrometheus())
+        instrumentation.ResetInstrumentation()
+        self.assertTrue(instrumentation.GetInstrumentation().empty)
+
+    def test_InstrumentationDoesNotImportTheGeoStack(self):
+        ### edatools and geocoders import instrumentation, and must not pull in geopandas through it
+        script = 'import sys, instrumentation; print(sorted(m for m in ("geopandas", "shapely", "layercache") if m in sys.modules))'
+        out = subprocess.run([sys.executable, '-c', script], cwd=pathlib.Path(__file__).parent, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), '[]')
+
+    def test_InstrumentationTracesMemoryAcrossThreads(self):
+        instrumentation.ResetInstrumentation()
+        instrumentation.trace_memory = True
+        entered, allocated, first_done = threading.Event(), threading.Barrier(2), threading.Event()
+
+        ### thread 0 starts tracing and finishes first, while thread 1 is still in its call
+        def work(i):
+            if i == 1:
+                entered.wait()
+            with instrumentation.Instrument(f'thread {i}'):
+                entered.set()
+                data = [bytearray(2**20) for _ in range(4)]
+                allocated.wait()
+                if i == 1:
+                    first_done.wait()
+                del data
+            first_done.set()
+
+        try:
+            threads = [threading.Thread(target=work, args=(i,)) for i in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertFalse(tracemalloc.is_tracing())
+            report = instrumentation.GetInstrumentation()
+            self.assertTrue((report['peak_bytes'] >= 4 * 2**20).all())
+
+            ### turning instrumentation off inside a call still finishes the call
+            with instrumentation.Instrument('switched off'):
+                instrumentation.instrumentation_enabled = False
+            self.assertIsNone(instrumentation.CurrentCall().name)
+        finally:
+            instrumentation.trace_memory = False
+            instrumentation.instrumentation_enabled = True
+            instrumentation.ResetInstrumentation()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import pathlib
+import tempfile
+import unittest
+
+import pandas as pd
+
+import benchmarktools
+from benchmarktools import MakeSyntheticElectionResults, MakeSyntheticGeocodes, MakeSyntheticRegistrationFile
+from benchmarktools import _LegacyAssignMcdFips, _LegacyCreateElectionData, _LegacyCreateVoterRegistrationData
+from benchmarktools import map_wards_to_reporting_units
+
+geocodes = MakeSyntheticGeocodes(60, benchmarktools.wisconsin_counties[:4], n_names=30)
+
+"""
+1. open a Windows PowerShell terminal
+2. usage: 'python -m unittest test_map_wards_to_reporting_units.py'
+"""
+@unittest.skipIf(map_wards_to_reporting_units is None, 'map_wards_to_reporting_units cannot be imported')
+class TestMapWardsToReportingUnits(unittest.TestCase):
+
+    def test_LookupFipsMatchesTheGeocodeLoops(self):
+        columns = ['GEOID', 'CNTY_NAME', 'CNTY_FIPS', 'MCD_NAME', 'MCD_FIPS', 'Registered']
+        with tempfile.TemporaryDirectory() as d:
+            target_counties, fips_dict = MakeSyntheticRegistrationFile(geocodes, pathlib.Path(d) / 'registration.csv', n_unmatched=2)
+            args = (target_counties, columns, fips_dict, geocodes, d + '/', 'registration.csv')
+            legacy = _LegacyCreateVoterRegistrationData(*args)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                registration = map_wards_to_reporting_units.CreateVoterRegistrationData(*args)
+        pd.testing.assert_frame_equal(legacy, registration, check_dtype=False)
+        self.assertEqual((registration['MCD_FIPS'] == '0').sum(), 2)
+        self.assertEqual(out.getvalue().count('matched no MCD geocode'), 1)
+        self.assertIn('2 of', out.getvalue())
+
+        ### a repeated geocode key takes the GEOID of its last row, as the loops did
+        units = registration[['MCD_NAME', 'CNTY_FIPS']].assign(County_Code=lambda df: df['CNTY_FIPS'].str[-3:])
+        units = units[['MCD_NAME', 'County_Code']].reset_index(drop=True)
+        repeated = pd.concat([geocodes, geocodes.iloc[[10]].assign(GEOID='5500000000')], ignore_index=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            fips = map_wards_to_reporting_units.LookupFips(units, repeated, repeated['GEOID'], '0', 'MCD')
+            self.assertTrue((_LegacyAssignMcdFips(units, repeated)['MCD_FIPS'] == fips).all())
+        self.assertIn('5500000000', set(fips))
+
+        ### a County_Code read as a number matches nothing, as with the loops, rather than failing the join
+        numeric = units.assign(County_Code=units['County_Code'].astype(int))
+        with contextlib.redirect_stdout(io.StringIO()):
+            fips = map_wards_to_reporting_units.LookupFips(numeric, geocodes, geocodes['GEOID'], '0', 'MCD')
+            self.assertTrue((_LegacyAssignMcdFips(numeric, geocodes)['MCD_FIPS'] == fips).all())
+        self.assertTrue((fips == '0').all())
+
+    def test_CreateElectionDataMatchesTheGeocodeLoop(self):
+        columns = ['CNTY_NAME', 'County_Code', 'MCD_NAME', 'MCD_FIPS', 'Wards', 'EXPANDEDGEOID', 'DEM', 'REP']
+        target_counties, results = MakeSyntheticElectionResults(geocodes)
+        initialize = map_wards_to_reporting_units.InitializeDataFrames
+        map_wards_to_reporting_units.InitializeDataFrames = lambda *args, **kwargs: results.copy()
+        try:
+            args = (target_counties, columns, geocodes, '2024', 'path/', 'results.xlsx')
+            with contextlib.redirect_stdout(io.StringIO()):
+                legacy = _LegacyCreateElectionData(*args)
+            with contextlib.redirect_stdout(io.StringIO()):
+                election = map_wards_to_reporting_units.CreateElectionData(*args)
+        finally:
+            map_wards_to_reporting_units.InitializeDataFrames = initialize
+        pd.testing.assert_frame_equal(legacy, election)
+        self.assertEqual(len(election), 2 * (len(geocodes) - len(target_counties)))
+        self.assertTrue((election['MCD_FIPS'] != '0').all())
+
+if __name__ == '__main__':
+    unittest.main()
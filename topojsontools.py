@@ -0,0 +1,260 @@
+"""
+TopoJSON encoding of polygon layers, and decoding back to GeoJSON.
+
+Neighbouring wards share almost all of their boundaries, and GeoJSON writes every shared edge twice.
+TopoJSON writes each boundary once, as an arc, and each polygon as a list of references into the arcs;
+the coordinates are quantized to integers and delta-encoded, so most of them are small numbers.
+
+The encoder follows the usual TopoJSON construction:
+1. quantize all coordinates to a `quantization` x `quantization` grid over the layer's bounds,
+2. find the junctions, the vertices where the rings meeting there stop sharing a path,
+3. cut every ring at its junctions into arcs, and keep one copy of each arc,
+   referenced by its index or, when walked backwards, by the ones' complement of its index.
+
+The topology is meant for clients that decode it themselves (topojson-client's feature(), for
+example). Plotly takes only GeoJSON, so plotlytools figures are built from ConvertGDFtoGJSN output,
+not from a topology. DecodeTopology turns a topology back into a GeoJSON FeatureCollection dict, for
+checking an encoding and for Python consumers.
+
+A ring that quantizes to fewer than 3 distinct points has no area and is left out; when it is the
+exterior ring of a polygon the whole polygon goes, and a geometry with no polygon left is null.
+"""
+import itertools
+import json
+
+import numpy as np
+import pandas as pd
+import shapely
+
+default_quantization = 10**5
+
+
+def _PolygonalRings(geoms):
+	"""
+	Break polygonal geometries down into rings.
+	Returns the ring geometries and, for each ring, its polygon and the geometry holding that polygon.
+	"""
+	type_ids = shapely.get_type_id(geoms)
+	bad = ~np.isin(type_ids, [-1, 3, 6]) & ~shapely.is_empty(geoms)
+	if bad.any():
+		raise TypeError("TopoJSON encoding supports Polygon and MultiPolygon geometries only.")
+	parts, part_geom = shapely.get_parts(geoms, return_index=True)
+	rings, ring_part = shapely.get_rings(parts, return_index=True)
+	return rings, ring_part, part_geom
+
+
+def _Quantize(coords, ring_idx, bounds, quantization):
+	"""
+	Quantize ring coordinates, dropping the closing vertex of each ring and any vertex that lands on
+	the same grid point as the one before it.
+	"""
+	x0, y0, x1, y1 = bounds
+	kx = (x1 - x0) / (quantization - 1) if x1 > x0 else 1.0
+	ky = (y1 - y0) / (quantization - 1) if y1 > y0 else 1.0
+	q = np.empty(coords.shape, dtype="int64")
+	q[:, 0] = np.round((coords[:, 0] - x0) / kx)
+	q[:, 1] = np.round((coords[:, 1] - y0) / ky)
+
+	first = np.ones(len(q), dtype=bool)
+	first[1:] = ring_idx[1:] != ring_idx[:-1]
+	last = np.roll(first, -1)
+	keep = ~last
+	keep[1:] &= first[1:] | (q[1:] != q[:-1]).any(axis=1)
+	q, ring_idx = q[keep], ring_idx[keep]
+
+	### a ring whose last vertices collapsed onto its first one
+	starts = np.flatnonzero(np.r_[True, ring_idx[1:] != ring_idx[:-1]])
+	last = np.r_[starts[1:], len(q)] - 1
+	wraps = (last > starts) & (q[last] == q[starts]).all(axis=1)
+	keep = np.ones(len(q), dtype=bool)
+	keep[last[wraps]] = False
+	return q[keep], ring_idx[keep], (kx, ky), (x0, y0)
+
+
+def _DropCollapsedRings(q, ring_idx, ring_part, n_rings):
+	"""
+	Drop the rings left with fewer than 3 distinct points by quantization, and every ring of a polygon
+	whose exterior ring is dropped. Returns q and ring_idx without their vertices, the kept rings
+	renumbered from 0, and the polygon of each kept ring.
+	"""
+	distinct = pd.DataFrame({"ring": ring_idx, "x": q[:, 0], "y": q[:, 1]}).drop_duplicates()
+	collapsed = np.bincount(distinct["ring"].to_numpy(), minlength=n_rings) < 3
+	if not collapsed.any():
+		return q, ring_idx, ring_part
+	### get_rings lists the exterior ring of each polygon first
+	exterior = np.r_[True, ring_part[1:] != ring_part[:-1]]
+	drop = collapsed | np.isin(ring_part, ring_part[collapsed & exterior])
+	kept = np.flatnonzero(~drop)
+	keep_vertex = ~drop[ring_idx]
+	return q[keep_vertex], np.searchsorted(kept, ring_idx[keep_vertex]), ring_part[kept]
+
+
+def _Junctions(keys, starts, lengths, ring_of):
+	"""Flag the vertices that are junctions: points whose rings do not all pass through them the same way."""
+	pos = np.arange(len(keys)) - starts[ring_of]
+	prev = keys[starts[ring_of] + (pos - 1) % lengths[ring_of]]
+	nxt = keys[starts[ring_of] + (pos + 1) % lengths[ring_of]]
+	pairs = pd.DataFrame({"pt": keys, "a": np.minimum(prev, nxt), "b": np.maximum(prev, nxt)})
+	counts = pairs.drop_duplicates()["pt"].value_counts()
+	return np.isin(keys, counts.index[counts.to_numpy() > 1])
+
+
+def _Arcs(q, keys, starts, lengths, junction):
+	"""
+	Cut every ring into arcs at its junctions, keeping one copy of each arc.
+	Returns the unique arcs (as quantized coordinate arrays) and, for each ring, its arc references.
+	"""
+	arcs = []
+	index = {}
+
+	def add(arc):
+		fwd = arc.tobytes()
+		if fwd in index:
+			return index[fwd]
+		rev = arc[::-1].tobytes()
+		if rev in index:
+			return ~index[rev]
+		index[fwd] = len(arcs)
+		arcs.append(arc)
+		return len(arcs) - 1
+
+	ring_arcs = []
+	for s, n in zip(starts, lengths):
+		ring = q[s : s + n]
+		cuts = np.flatnonzero(junction[s : s + n])
+		if len(cuts) == 0:
+			### a ring with no junctions is a single closed arc; start it at its smallest point
+			### so a ring shared whole (an island filling a hole) is found either way round
+			m = int(np.argmin(keys[s : s + n]))
+			ring = np.roll(ring, -m, axis=0)
+			ring_arcs.append([add(np.concatenate([ring, ring[:1]]))])
+			continue
+		ring = np.roll(ring, -cuts[0], axis=0)
+		cuts = np.append(cuts - cuts[0], n)
+		ring = np.concatenate([ring, ring[:1]])
+		ring_arcs.append([add(ring[a : b + 1]) for a, b in zip(cuts[:-1], cuts[1:])])
+	return arcs, ring_arcs
+
+
+def EncodeTopology(geoms, properties=None, object_name="layer", quantization=default_quantization):
+	"""
+	Encode an array of Polygon/MultiPolygon geometries as a TopoJSON Topology dict with shared,
+	quantized, delta-encoded arcs.
+
+	Parameters:
+	- geoms: An array of polygonal geometries.
+	- properties (list): One properties dict per geometry, or None.
+	- object_name (str): The name of the layer in the topology's objects.
+	- quantization (int): The number of grid steps across the layer's extent on each axis.
+
+	Returns:
+	- dict: The topology.
+	"""
+	geoms = np.asarray(geoms)
+	rings, ring_part, part_geom = _PolygonalRings(geoms)
+	coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+	bounds = shapely.total_bounds(geoms)
+	q, ring_idx, scale, translate = _Quantize(coords, ring_idx, bounds, quantization)
+
+	q, ring_idx, ring_part = _DropCollapsedRings(q, ring_idx, ring_part, len(rings))
+
+	lengths = np.bincount(ring_idx, minlength=len(ring_part))
+	starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+	keys = q[:, 0] * (quantization + 1) + q[:, 1]
+	junction = _Junctions(keys, starts, lengths, ring_idx)
+	arcs, ring_arcs = _Arcs(q, keys, starts, lengths, junction)
+
+	### regroup ring references by polygon, and polygons by geometry
+	polygons = [[] for _ in range(int(ring_part.max()) + 1 if len(ring_part) else 0)]
+	for part, refs in zip(ring_part, ring_arcs):
+		polygons[part].append(refs)
+	features = [[] for _ in range(len(geoms))]
+	for geom, polygon in zip(part_geom, polygons):
+		if polygon:
+			features[geom].append(polygon)
+
+	type_ids = shapely.get_type_id(geoms)
+	geometries = []
+	for i, polys in enumerate(features):
+		if not polys:
+			geometry = {"type": None}
+		elif type_ids[i] == 6:
+			geometry = {"type": "MultiPolygon", "arcs": polys}
+		else:
+			geometry = {"type": "Polygon", "arcs": polys[0]}
+		if properties is not None:
+			geometry["properties"] = properties[i]
+		geometries.append(geometry)
+
+	return {
+		"type": "Topology",
+		"bbox": [float(b) for b in bounds],
+		"transform": {"scale": [float(scale[0]), float(scale[1])], "translate": [float(translate[0]), float(translate[1])]},
+		"objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+		"arcs": [np.concatenate([arc[:1], np.diff(arc, axis=0)]).tolist() for arc in arcs],
+	}
+
+
+def _DecodeArcs(topo, precision=None):
+	"""Decode all of the arcs at once: undo the delta encoding and the quantization in one pass."""
+	lengths = np.fromiter((len(arc) for arc in topo["arcs"]), dtype="int64", count=len(topo["arcs"]))
+	coords = np.array(list(itertools.chain.from_iterable(topo["arcs"])), dtype="float64").reshape(-1, 2)
+	transform = topo.get("transform")
+	if transform is not None and len(coords):
+		### a running sum over every arc, less the running sum at the start of each arc
+		totals = np.cumsum(coords, axis=0)
+		ends = np.cumsum(lengths)
+		offsets = np.vstack([[0.0, 0.0], totals[ends[:-1] - 1]])
+		coords = (totals - np.repeat(offsets, lengths, axis=0)) * transform["scale"] + transform["translate"]
+	if precision is not None:
+		coords = np.round(coords, precision)
+	return np.split(coords, np.cumsum(lengths)[:-1])
+
+
+def _DecodeRing(refs, arcs):
+	pieces = []
+	for k, ref in enumerate(refs):
+		arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+		pieces.append(arc if k == 0 else arc[1:])
+	return np.concatenate(pieces)
+
+
+def DecodeTopology(topo, object_name=None, precision=6):
+	"""
+	Decode a TopoJSON Topology into a GeoJSON FeatureCollection dict.
+
+	Parameters:
+	- topo (dict or str): The topology, or its JSON text.
+	- object_name (str): The object to decode; the first one if None.
+	- precision (int): Decimal places kept in the decoded coordinates, None keeps them all.
+
+	Returns:
+	- dict: A FeatureCollection with one feature per geometry of the object.
+	"""
+	if isinstance(topo, (str, bytes)):
+		topo = json.loads(topo)
+	if object_name is None:
+		object_name = next(iter(topo["objects"]))
+	arcs = _DecodeArcs(topo, precision)
+
+	def polygon(rings):
+		return [_DecodeRing(refs, arcs).tolist() for refs in rings]
+
+	features = []
+	for g in topo["objects"][object_name]["geometries"]:
+		if g.get("type") == "Polygon":
+			geometry = {"type": "Polygon", "coordinates": polygon(g["arcs"])}
+		elif g.get("type") == "MultiPolygon":
+			geometry = {"type": "MultiPolygon", "coordinates": [polygon(p) for p in g["arcs"]]}
+		else:
+			geometry = None
+		feature = {"type": "Feature", "properties": g.get("properties", {}), "geometry": geometry}
+		if "id" in g:
+			feature["id"] = g["id"]
+		features.append(feature)
+	return {"type": "FeatureCollection", "features": features}
+
+
+def IsTopology(obj):
+	"""True if `obj` is a TopoJSON Topology dict."""
+	return isinstance(obj, dict) and obj.get("type") == "Topology"
@@ -0,0 +1,544 @@
+"""
+Mapbox vector tiles (MVT) for ward and district layers, cached in MBTiles files and served locally.
+
+Instead of pushing a whole county or state of GeoJSON into every Choroplethmapbox trace, a map can
+point a mapbox vector source at the tile endpoint and load only the tiles in view:
+
+usage:
+	[gdf, _] = GetWardsInState(ward_bounds_file)
+	wards = TileCache("./static/wards.mbtiles", gdf[["id", "GEOID", "geometry"]], layer_name="wards")
+	server = MakeTileServer({"wards": wards}, port=8765)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	# in the figure layout:
+	# mapbox_layers=[{"sourcetype": "vector", "sourcelayer": "wards", "type": "line",
+	#                 "source": ["http://127.0.0.1:8765/wards/{z}/{x}/{y}.pbf"]}]
+
+Tiles are cut from the layer in web mercator: for each tile, an STRtree picks the features touching
+it, their geometry (simplified to one tile unit at that zoom) is clipped to the tile plus a small
+buffer, snapped to the integer tile grid (repairing any polygon the snapping breaks) and encoded as MVT version 2 protobuf. Rendered tiles are
+gzipped and kept in the MBTiles file, which remembers a hash of the layer's geometry and attributes
+and is emptied when the layer changes.
+"""
+import gzip
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from gdftools import GetTransformer, TransformGeometries, _LayerFingerprint
+
+### half the width of the web mercator world, in meters
+mercator_extent = 20037508.342789244
+
+tile_extent = 4096
+tile_buffer = 64
+
+
+### ---- protobuf encoding (just enough of it for vector_tile.proto) ----
+
+def _Varint(n):
+	out = bytearray()
+	while True:
+		b = n & 0x7F
+		n >>= 7
+		if n:
+			out.append(b | 0x80)
+		else:
+			out.append(b)
+			return bytes(out)
+
+
+def _ZigZag(n):
+	return (n << 1) ^ (n >> 63)
+
+
+def _Field(field, wire_type):
+	return _Varint((field << 3) | wire_type)
+
+
+def _LengthDelimited(field, data):
+	return _Field(field, 2) + _Varint(len(data)) + data
+
+
+def _EncodeValue(value):
+	if isinstance(value, (bool, np.bool_)):
+		return _Field(7, 0) + _Varint(int(value))
+	if isinstance(value, (int, np.integer)):
+		return _Field(6, 0) + _Varint(_ZigZag(int(value)))
+	if isinstance(value, (float, np.floating)):
+		return _Field(3, 1) + np.float64(value).tobytes()
+	return _LengthDelimited(1, str(value).encode("utf-8"))
+
+
+### ---- geometry ----
+
+def TileBounds(z, x, y):
+	"""The web mercator bounds (minx, miny, maxx, maxy) of tile z/x/y."""
+	size = 2 * mercator_extent / 2**z
+	minx = -mercator_extent + x * size
+	maxy = mercator_extent - y * size
+	return (minx, maxy - size, minx + size, maxy)
+
+
+def TilesInBounds(z, bounds):
+	"""All the (x, y) tiles at zoom `z` touching web mercator `bounds`."""
+	size = 2 * mercator_extent / 2**z
+	n = 2**z
+	x0 = int(np.clip(np.floor((bounds[0] + mercator_extent) / size), 0, n - 1))
+	x1 = int(np.clip(np.floor((bounds[2] + mercator_extent) / size), 0, n - 1))
+	y0 = int(np.clip(np.floor((mercator_extent - bounds[3]) / size), 0, n - 1))
+	y1 = int(np.clip(np.floor((mercator_extent - bounds[1]) / size), 0, n - 1))
+	return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def _Command(command, count):
+	return (command & 0x7) | (count << 3)
+
+
+def _ZigZagArray(a):
+	a = a.astype("int64")
+	return ((a << 1) ^ (a >> 63)).astype("uint64")
+
+
+def _PackVarints(values):
+	"""
+	Varint-encode an array of unsigned integers in one pass.
+	Returns the encoded bytes and the offset of each value's encoding in them (plus the total length).
+	"""
+	values = np.asarray(values, dtype="uint64")
+	sizes = np.ones(len(values), dtype="int64")
+	rest = values >> np.uint64(7)
+	while rest.any():
+		sizes += rest > 0
+		rest >>= np.uint64(7)
+	offsets = np.concatenate([[0], np.cumsum(sizes)])
+	out = np.empty(offsets[-1], dtype="uint8")
+	for k in range(int(sizes.max()) if len(sizes) else 0):
+		live = sizes > k
+		byte = (values[live] >> np.uint64(7 * k)) & np.uint64(0x7F)
+		more = (sizes[live] > k + 1).astype("uint64") << np.uint64(7)
+		out[offsets[:-1][live] + k] = (byte | more).astype("uint8")
+	return out.tobytes(), offsets
+
+
+def _PolygonCommandStream(parts, part_feature):
+	"""
+	Encode polygons in tile coordinates as MVT geometry commands, for all the features of a tile at once.
+
+	Exterior rings are written clockwise and interior rings counter-clockwise in tile space (y down),
+	as MVT 2 requires; the cursor carries over from ring to ring within a feature.
+
+	Parameters:
+	- parts: The Polygon parts, grouped by feature.
+	- part_feature: The feature number (0, 1, ...) of each part.
+
+	Returns:
+	- The command integers, and the offset of each feature's commands in them (plus the total length).
+	"""
+	rings, ring_part = shapely.get_rings(parts, return_index=True)
+	exterior = np.r_[True, ring_part[1:] != ring_part[:-1]]
+	coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+	coords = coords.astype("int64")
+
+	### drop each ring's closing vertex
+	counts = np.bincount(ring_idx, minlength=len(rings))
+	closing = np.cumsum(counts) - 1
+	keep = np.ones(len(coords), dtype=bool)
+	keep[closing[counts > 0]] = False
+	coords, ring_idx = coords[keep], ring_idx[keep]
+	n = np.maximum(counts - 1, 0)
+	start = np.cumsum(n) - n
+
+	### signed area of each ring, and reversal of the rings wound the wrong way
+	pos = np.arange(len(coords)) - start[ring_idx]
+	nxt = start[ring_idx] + (pos + 1) % n[ring_idx]
+	cross = coords[:, 0] * coords[nxt, 1] - coords[nxt, 0] * coords[:, 1]
+	area = np.bincount(ring_idx, weights=cross, minlength=len(rings))
+	flip = (area > 0) != exterior
+	order = np.where(flip[ring_idx], start[ring_idx] + n[ring_idx] - 1 - pos, np.arange(len(coords)))
+	coords = coords[order]
+
+	### deltas from the previous vertex; the cursor starts at (0, 0) for each feature
+	feature = part_feature[ring_part[ring_idx]]
+	prev = np.vstack([[0, 0], coords[:-1]])
+	prev[np.r_[True, feature[1:] != feature[:-1]]] = 0
+	deltas = _ZigZagArray(coords - prev)
+
+	### MoveTo(1) dx dy LineTo(n-1) dx dy ... ClosePath: 2n + 3 integers per ring
+	ring_len = 2 * n + 3
+	out_start = np.cumsum(ring_len) - ring_len
+	out = np.empty(ring_len.sum(), dtype="uint64")
+	out[out_start] = _Command(1, 1)
+	out[out_start + 1] = deltas[start, 0]
+	out[out_start + 2] = deltas[start, 1]
+	out[out_start + 3] = (2 | ((n - 1) << 3)).astype("uint64")
+	line = pos > 0
+	at = out_start[ring_idx[line]] + 2 + 2 * pos[line]
+	out[at] = deltas[line, 0]
+	out[at + 1] = deltas[line, 1]
+	out[out_start + ring_len - 1] = _Command(7, 1)
+
+	ring_feature = part_feature[ring_part]
+	feature_offsets = np.searchsorted(ring_feature, np.arange(part_feature.max() + 2))
+	return out, np.r_[out_start, len(out)][feature_offsets]
+
+
+### ---- the layer ----
+
+class TileLayer:
+	"""
+	A polygon layer prepared for cutting into tiles: projected to web mercator once, indexed with an
+	STRtree, and simplified once per zoom level as tiles at that zoom are asked for. The attribute
+	values are factorized once, so each tile's key and value tables are built with array operations.
+	"""
+
+	def __init__(self, gdf, layer_name="layer", columns=None, extent=tile_extent, buffer=tile_buffer):
+		self.layer_name = layer_name
+		self.extent = extent
+		self.buffer = buffer
+		if columns is None:
+			columns = [c for c in gdf.columns if c != gdf.geometry.name]
+		self.columns = list(columns)
+		geoms = np.asarray(gdf.geometry.values)
+		self.geoms = TransformGeometries(geoms, gdf.crs, "EPSG:3857") if gdf.crs is not None else geoms
+		self.bounds = tuple(shapely.total_bounds(self.geoms))
+		self.tree = shapely.STRtree(self.geoms)
+
+		### every distinct (column, value) gets a layer-wide id; -1 marks a missing value
+		codes, encoded = [], []
+		for col in self.columns:
+			col_codes, uniques = pd.factorize(gdf[col], use_na_sentinel=True)
+			codes.append(np.where(col_codes >= 0, col_codes + len(encoded), -1))
+			encoded += [_LengthDelimited(4, _EncodeValue(v)) for v in uniques]
+		self.value_codes = np.column_stack(codes) if codes else np.empty((len(gdf), 0), dtype="int64")
+		self.encoded_values = encoded
+		self.encoded_keys = [_LengthDelimited(3, c.encode("utf-8")) for c in self.columns]
+		self._zoom_geoms = {}
+		self._lock = threading.Lock()
+
+	def _Geometry(self, z):
+		with self._lock:
+			if z not in self._zoom_geoms:
+				unit = 2 * mercator_extent / 2**z / self.extent
+				self._zoom_geoms[z] = shapely.simplify(self.geoms, unit, preserve_topology=True)
+			return self._zoom_geoms[z]
+
+	def _Tags(self, features):
+		"""Build the tile's value table and each feature's packed tags, from the layer-wide value ids."""
+		codes = self.value_codes[features]
+		present = codes >= 0
+		used, local = np.unique(codes[present], return_inverse=True)
+		key_idx = np.broadcast_to(np.arange(codes.shape[1]), codes.shape)[present]
+		tags = np.empty(2 * len(local), dtype="uint64")
+		tags[0::2] = key_idx
+		tags[1::2] = local
+		tag_offsets = 2 * np.r_[0, np.cumsum(present.sum(axis=1))]
+		return used, tags, tag_offsets
+
+	def render(self, z, x, y):
+		"""Return the MVT protobuf bytes of tile z/x/y, or b"" if no feature touches it."""
+		minx, miny, maxx, maxy = TileBounds(z, x, y)
+		scale = self.extent / (maxx - minx)
+		pad = self.buffer / scale
+		idx = self.tree.query(shapely.box(minx - pad, miny - pad, maxx + pad, maxy + pad), predicate="intersects")
+		if len(idx) == 0:
+			return b""
+		idx.sort()
+
+		geoms = shapely.clip_by_rect(self._Geometry(z)[idx], minx - pad, miny - pad, maxx + pad, maxy + pad)
+		geoms = shapely.transform(geoms, lambda c: np.column_stack([(c[:, 0] - minx) * scale, (maxy - c[:, 1]) * scale]))
+		### snap to the integer grid; only the few polygons that snapping breaks need the
+		### (much slower) validity-preserving precision reduction
+		geoms = shapely.remove_repeated_points(shapely.transform(geoms, np.round))
+		invalid = ~shapely.is_valid(geoms)
+		if invalid.any():
+			geoms[invalid] = shapely.set_precision(geoms[invalid], 1.0)
+
+		### clipping and snapping can leave lines and points along the tile edge; keep the polygons
+		parts, part_idx = shapely.get_parts(geoms, return_index=True)
+		parts, part_idx = parts[shapely.get_type_id(parts) == 3], part_idx[shapely.get_type_id(parts) == 3]
+		if len(parts) == 0:
+			return b""
+		features, part_feature = np.unique(part_idx, return_inverse=True)
+		features = idx[features]
+
+		commands, command_offsets = _PolygonCommandStream(parts, part_feature)
+		command_bytes, command_pos = _PackVarints(commands)
+		used, tags, tag_offsets = self._Tags(features)
+		tag_bytes, tag_pos = _PackVarints(tags)
+
+		encoded = []
+		for f, i in enumerate(features):
+			geometry = command_bytes[command_pos[command_offsets[f]] : command_pos[command_offsets[f + 1]]]
+			tag_data = tag_bytes[tag_pos[tag_offsets[f]] : tag_pos[tag_offsets[f + 1]]]
+			feature = _Field(1, 0) + _Varint(int(i)) + _LengthDelimited(2, tag_data)
+			feature += _Field(3, 0) + _Varint(3) + _LengthDelimited(4, geometry)
+			encoded.append(_LengthDelimited(2, feature))
+
+		layer = _Field(15, 0) + _Varint(2) + _LengthDelimited(1, self.layer_name.encode("utf-8"))
+		layer += b"".join(encoded)
+		layer += b"".join(self.encoded_keys)
+		layer += b"".join(self.encoded_values[v] for v in used)
+		layer += _Field(5, 0) + _Varint(self.extent)
+		return _LengthDelimited(3, layer)
+
+
+def LayerHash(gdf, columns=None):
+	"""A hash of a layer's geometry and of the attribute columns that go into its tiles."""
+	if columns is None:
+		columns = [c for c in gdf.columns if c != gdf.geometry.name]
+	crs, geom_hash = _LayerFingerprint(np.asarray(gdf.geometry.values), gdf.crs)
+	h = hashlib.blake2b(f"{crs} {geom_hash} {list(columns)}".encode("utf-8"), digest_size=16)
+	h.update(pd.util.hash_pandas_object(pd.DataFrame(gdf[list(columns)]), index=False).to_numpy().tobytes())
+	return h.hexdigest()
+
+
+### ---- the MBTiles cache ----
+
+class TileCache:
+	"""
+	Vector tiles of one layer, rendered on demand and stored in an MBTiles (SQLite) file.
+
+	The file records a hash of the layer and the tiling parameters; opening it for a different
+	layer, or for the same layer after it has changed, empties it.
+	"""
+
+	def __init__(self, mbtiles_file, gdf, layer_name="layer", columns=None, min_zoom=0, max_zoom=16,
+				 extent=tile_extent, buffer=tile_buffer):
+		self.mbtiles_file = str(mbtiles_file)
+		self.layer = TileLayer(gdf, layer_name, columns, extent, buffer)
+		self.min_zoom = min_zoom
+		self.max_zoom = max_zoom
+		self.source_hash = f"{LayerHash(gdf, self.layer.columns)}:{extent}:{buffer}"
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(self.mbtiles_file, check_same_thread=False)
+		self._Open()
+
+	def _Open(self):
+		with self._lock, self._db:
+			self._db.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+			self._db.execute(
+				"CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB, "
+				"PRIMARY KEY (zoom_level, tile_column, tile_row))"
+			)
+			row = self._db.execute("SELECT value FROM metadata WHERE name = 'source_hash'").fetchone()
+			if row is not None and row[0] == self.source_hash:
+				return
+			self._db.execute("DELETE FROM tiles")
+			minx, miny, maxx, maxy = self.layer.bounds
+			(lon0, lon1), (lat0, lat1) = GetTransformer("EPSG:3857", "EPSG:4326").transform([minx, maxx], [miny, maxy])
+			metadata = {
+				"name": self.layer.layer_name,
+				"format": "pbf",
+				"minzoom": str(self.min_zoom),
+				"maxzoom": str(self.max_zoom),
+				"bounds": f"{lon0},{lat0},{lon1},{lat1}",
+				"json": json.dumps({"vector_layers": [{"id": self.layer.layer_name, "fields": {c: "" for c in self.layer.columns}}]}),
+				"source_hash": self.source_hash,
+			}
+			self._db.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)", metadata.items())
+
+	def tile(self, z, x, y):
+		"""
+		Return the gzipped MVT bytes of tile z/x/y (XYZ scheme), or b"" for an empty tile,
+		rendering and storing it if it is not in the file yet.
+		"""
+		if not self.min_zoom <= z <= self.max_zoom or not (0 <= x < 2**z and 0 <= y < 2**z):
+			raise ValueError(f"Tile {z}/{x}/{y} is out of range.")
+		### MBTiles rows count from the bottom (TMS)
+		row = 2**z - 1 - y
+		with self._lock:
+			found = self._db.execute(
+				"SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (z, x, row)
+			).fetchone()
+			if found is not None:
+				self.hits += 1
+				return bytes(found[0])
+			self.misses += 1
+
+		data = self.layer.render(z, x, y)
+		data = gzip.compress(data) if data else b""
+
+		with self._lock, self._db:
+			self._db.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, row, sqlite3.Binary(data)))
+		return data
+
+	def seed(self, zooms):
+		"""Render and store every tile of the layer at the given zoom levels. Returns the number of tiles."""
+		count = 0
+		for z in zooms:
+			for x, y in TilesInBounds(z, self.layer.bounds):
+				self.tile(z, x, y)
+				count += 1
+		return count
+
+	def stats(self):
+		with self._lock:
+			stored = self._db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+		return {"hits": self.hits, "misses": self.misses, "tiles": stored}
+
+	def close(self):
+		with self._lock:
+			self._db.close()
+
+
+### ---- decoding (for tests and debugging) ----
+
+def _ReadVarint(data, pos):
+	result = shift = 0
+	while True:
+		b = data[pos]
+		pos += 1
+		result |= (b & 0x7F) << shift
+		shift += 7
+		if not b & 0x80:
+			return result, pos
+
+
+def _ReadFields(data):
+	pos = 0
+	while pos < len(data):
+		key, pos = _ReadVarint(data, pos)
+		field, wire_type = key >> 3, key & 0x7
+		if wire_type == 0:
+			value, pos = _ReadVarint(data, pos)
+		elif wire_type == 1:
+			value, pos = data[pos : pos + 8], pos + 8
+		elif wire_type == 2:
+			n, pos = _ReadVarint(data, pos)
+			value, pos = data[pos : pos + n], pos + n
+		elif wire_type == 5:
+			value, pos = data[pos : pos + 4], pos + 4
+		else:
+			raise ValueError(f"Unsupported protobuf wire type {wire_type}.")
+		yield field, value
+
+
+def _ReadPacked(data):
+	pos, out = 0, []
+	while pos < len(data):
+		value, pos = _ReadVarint(data, pos)
+		out.append(value)
+	return out
+
+
+def _UnZigZag(n):
+	return (n >> 1) ^ -(n & 1)
+
+
+def _DecodeValue(data):
+	for field, value in _ReadFields(data):
+		if field == 1:
+			return value.decode("utf-8")
+		if field == 2:
+			return float(np.frombuffer(value, dtype="<f4")[0])
+		if field == 3:
+			return float(np.frombuffer(value, dtype="<f8")[0])
+		if field in (4, 5):
+			return value
+		if field == 6:
+			return _UnZigZag(value)
+		if field == 7:
+			return bool(value)
+
+
+def _DecodeRings(commands):
+	rings, ring, cursor, i = [], [], [0, 0], 0
+	while i < len(commands):
+		command, count = commands[i] & 0x7, commands[i] >> 3
+		i += 1
+		if command == 7:
+			rings.append(ring)
+			ring = []
+			continue
+		for _ in range(count):
+			cursor = [cursor[0] + _UnZigZag(commands[i]), cursor[1] + _UnZigZag(commands[i + 1])]
+			i += 2
+			if command == 1:
+				ring = [cursor]
+			else:
+				ring.append(cursor)
+	return rings
+
+
+def DecodeTile(data):
+	"""
+	Decode (gzipped or plain) MVT bytes into {layer name: [{"id", "properties", "rings"}]}, with the
+	rings in tile coordinates, in the order they were encoded.
+	"""
+	if data[:2] == b"\x1f\x8b":
+		data = gzip.decompress(data)
+	layers = {}
+	for field, layer_data in _ReadFields(data):
+		if field != 3:
+			continue
+		name, keys, values, raw = None, [], [], []
+		for f, value in _ReadFields(layer_data):
+			if f == 1:
+				name = value.decode("utf-8")
+			elif f == 2:
+				raw.append(value)
+			elif f == 3:
+				keys.append(value.decode("utf-8"))
+			elif f == 4:
+				values.append(_DecodeValue(value))
+		features = []
+		for feature_data in raw:
+			feature = {"id": None, "properties": {}, "rings": []}
+			for f, value in _ReadFields(feature_data):
+				if f == 1:
+					feature["id"] = value
+				elif f == 2:
+					tags = _ReadPacked(value)
+					feature["properties"] = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+				elif f == 4:
+					feature["rings"] = _DecodeRings(_ReadPacked(value))
+			features.append(feature)
+		layers[name] = features
+	return layers
+
+
+### ---- the endpoint ----
+
+_tile_path = re.compile(r"^/(?P<layer>[\w-]+)/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.(pbf|mvt)$")
+
+
+def MakeTileServer(caches, host="127.0.0.1", port=8765):
+	"""
+	Make a small threaded HTTP server answering GET /<layer>/<z>/<x>/<y>.pbf from the TileCache
+	registered under <layer> in `caches`. Call serve_forever() on the result to start it.
+	"""
+
+	class TileHandler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			match = _tile_path.match(self.path.split("?")[0])
+			cache = caches.get(match["layer"]) if match else None
+			if cache is None:
+				self.send_error(404)
+				return
+			try:
+				data = cache.tile(int(match["z"]), int(match["x"]), int(match["y"]))
+			except ValueError:
+				self.send_error(404)
+				return
+			self.send_response(200 if data else 204)
+			self.send_header("Access-Control-Allow-Origin", "*")
+			if data:
+				self.send_header("Content-Type", "application/vnd.mapbox-vector-tile")
+				self.send_header("Content-Encoding", "gzip")
+			self.send_header("Content-Length", str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+
+		def log_message(self, format, *args):
+			pass
+
+	return ThreadingHTTPServer((host, port), TileHandler)